@@ -2,10 +2,13 @@
 
 import os
 import time
+import random
+import asyncio
 import base64
 import json
 import requests
 import io
+from dataclasses import dataclass, field, asdict
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.chrome.service import Service
@@ -17,23 +20,2195 @@ from selenium.webdriver.common.action_chains import ActionChains
 from webdriver_manager.chrome import ChromeDriverManager
 from dotenv import load_dotenv
 import re
+import numpy as np
 from PIL import Image
 
 # Load environment variables
 load_dotenv()
 
+XAI_API_BASE_URL = "https://api.x.ai/v1"
+
+
+class GrokHTTPClient:
+    """Pooled keep-alive HTTP client shared by every xAI call path"""
+
+    def __init__(self, api_key, base_url=XAI_API_BASE_URL, pool_size=4, default_timeout=120):
+        from requests.adapters import HTTPAdapter
+
+        self.api_key = api_key
+        self.base_url = base_url.rstrip('/')
+        self.pool_size = pool_size
+        self.default_timeout = default_timeout
+
+        # One session = one urllib3 pool manager, so TCP+TLS handshakes are paid once
+        # and every later call reuses the warm connection (HTTP keep-alive)
+        self.session = requests.Session()
+        self.session.headers.update({
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+            "Connection": "keep-alive"
+        })
+        # Retries stay in robust_api_call, the adapter must not retry behind our back
+        self.adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0, pool_block=False)
+        self.session.mount("https://", self.adapter)
+        self.session.mount("http://", self.adapter)
+
+        self.request_count = 0
+        self.error_count = 0
+
+    @property
+    def chat_completions_url(self):
+        return f"{self.base_url}/chat/completions"
+
+    def post_chat(self, payload, timeout=None):
+        """POST a chat completions payload over the pooled session"""
+        self.request_count += 1
+        try:
+            return self.session.post(
+                self.chat_completions_url,
+                json=payload,
+                timeout=timeout or self.default_timeout
+            )
+        except requests.exceptions.RequestException:
+            self.error_count += 1
+            raise
+
+    def stream_chat(self, payload, timeout=None, usage=None):
+        """POST a streaming chat completions payload and yield content deltas from the server-sent events
+
+        Raises requests.exceptions.HTTPError (with .response) on a non-200 status.
+        Args:
+            usage (dict): If given, filled with the usage block of the final event
+        """
+        self.request_count += 1
+        try:
+            response = self.session.post(
+                self.chat_completions_url,
+                json=dict(payload, stream=True, stream_options={"include_usage": True}),
+                timeout=timeout or self.default_timeout,
+                stream=True
+            )
+        except requests.exceptions.RequestException:
+            self.error_count += 1
+            raise
+
+        with response:
+            if response.status_code != 200:
+                self.error_count += 1
+                raise requests.exceptions.HTTPError(f"HTTP {response.status_code}", response=response)
+
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue  # SSE keep-alive comments and blank separators
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                try:
+                    event = json.loads(data)
+                    if usage is not None and event.get("usage"):
+                        usage.update(event["usage"])
+                    delta = event["choices"][0].get("delta", {}).get("content")
+                except (json.JSONDecodeError, KeyError, IndexError):
+                    continue
+                if delta:
+                    yield delta
+
+    def _pools(self):
+        """Return the urllib3 connection pools opened by this client"""
+        try:
+            pools = self.adapter.poolmanager.pools
+            return [pools[key] for key in pools.keys()]
+        except Exception:
+            return []
+
+    def connection_stats(self):
+        """Connection reuse vs new connection counters for the API host"""
+        pools = self._pools()
+        new_connections = sum(getattr(pool, 'num_connections', 0) for pool in pools)
+        pooled_requests = sum(getattr(pool, 'num_requests', 0) for pool in pools)
+        reused = max(0, pooled_requests - new_connections)
+        return {
+            "requests": self.request_count,
+            "errors": self.error_count,
+            "new_connections": new_connections,
+            "reused_connections": reused,
+            "reuse_ratio": (reused / pooled_requests) if pooled_requests else 0.0,
+            "pool_size": self.pool_size
+        }
+
+    def close(self):
+        """Close all pooled connections"""
+        self.session.close()
+
+
+class StreamingDecisionParser:
+    """Incrementally scans a streamed decision JSON and reports the actions array as soon as it closes"""
+
+    ACTIONS_KEY = re.compile(r'"actions"\s*:\s*\[')
+
+    def __init__(self, valid_actions):
+        self.valid_actions = set(valid_actions)
+        self.text = ""
+        self.actions = None
+
+    def feed(self, chunk):
+        """Add a streamed chunk; returns the actions list the first time it becomes complete"""
+        self.text += chunk
+        if self.actions is not None:
+            return None
+        self.actions = self._extract_actions()
+        return self.actions
+
+    def _extract_actions(self):
+        match = self.ACTIONS_KEY.search(self.text)
+        if not match:
+            return None
+
+        # Walk the array honouring strings/escapes until the matching ']' arrives
+        start = match.end() - 1
+        depth = 0
+        in_string = False
+        escaped = False
+        for pos in range(start, len(self.text)):
+            char = self.text[pos]
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif char == '\\':
+                    escaped = True
+                elif char == '"':
+                    in_string = False
+            elif char == '"':
+                in_string = True
+            elif char == '[':
+                depth += 1
+            elif char == ']':
+                depth -= 1
+                if depth == 0:
+                    try:
+                        actions = json.loads(self.text[start:pos + 1])
+                    except json.JSONDecodeError:
+                        return None
+                    actions = [a for a in actions if isinstance(a, str) and a in self.valid_actions]
+                    return actions or None
+        return None  # Array not closed yet
+
+
+class DecisionCache:
+    """Decision cache keyed on a perceptual hash of the game canvas plus a digest of the memory state
+
+    Lookups match any entry with the same memory digest whose frame hash is within
+    `tolerance` bits (Hamming distance). Entries are evicted LRU once `max_entries`
+    is exceeded and expire after `ttl` seconds.
+    """
+
+    # Scene classifier labels whose frames are safe to cache. Overworld tiles and menu cursors move
+    # without moving the 64-bit hash, so a decision cached there would replay in the wrong place.
+    SCENES = ("dialogue", "title", "blank")
+
+    def __init__(self, max_entries=256, ttl=300, tolerance=4, max_reuse=3):
+        from collections import OrderedDict
+
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.tolerance = tolerance
+        self.max_reuse = max_reuse
+        self.entries = OrderedDict()  # (frame_hash, memory_digest) -> {"decision", "created", "reuses"}
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def frame_hash(image_bytes, hash_size=8):
+        """64-bit difference hash (dHash) of an encoded image"""
+        image = Image.open(io.BytesIO(image_bytes)).convert('L').resize((hash_size + 1, hash_size), Image.Resampling.BILINEAR)
+        pixels = np.asarray(image)
+        bits = (pixels[:, :-1] > pixels[:, 1:]).ravel()
+        return int.from_bytes(np.packbits(bits).tobytes(), 'big') >> (-len(bits) % 8)
+
+    @staticmethod
+    def memory_digest(memory_list, keys=("CURRENT PROGRESS", "CURRENT LOCATION", "OBJECTIVE", "TEAM STATUS")):
+        """Digest of the memory entries that describe game state (not the whole scratchpad)"""
+        import hashlib
+
+        relevant = [entry for entry in memory_list if any(key in entry for key in keys)]
+        return hashlib.sha1("\n".join(relevant).encode('utf-8')).hexdigest()[:16]
+
+    def _expire(self):
+        now = time.time()
+        for key in [k for k, entry in self.entries.items() if now - entry["created"] > self.ttl]:
+            del self.entries[key]
+            self.expirations += 1
+
+    def get(self, frame_hash, memory_digest):
+        """Return a cached decision for a matching screen, or None"""
+        self._expire()
+
+        best_key, best_distance = None, None
+        for key in self.entries:
+            cached_hash, cached_digest = key
+            if cached_digest != memory_digest:
+                continue
+            distance = bin(cached_hash ^ frame_hash).count("1")
+            if distance <= self.tolerance and (best_distance is None or distance < best_distance):
+                best_key, best_distance = key, distance
+
+        if best_key is None:
+            self.misses += 1
+            return None
+
+        entry = self.entries[best_key]
+        if entry["reuses"] >= self.max_reuse:
+            # Same screen, same answer, still here - the cached decision is not making progress
+            del self.entries[best_key]
+            self.misses += 1
+            return None
+
+        entry["reuses"] += 1
+        self.entries.move_to_end(best_key)
+        self.hits += 1
+        return entry["decision"]
+
+    def put(self, frame_hash, memory_digest, decision):
+        """Cache a decision for a screen"""
+        self.entries[(frame_hash, memory_digest)] = {"decision": decision, "created": time.time(), "reuses": 0}
+        self.entries.move_to_end((frame_hash, memory_digest))
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        """Hit/miss statistics"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations
+        }
+
+
+class SceneClassifier:
+    """Labels a game frame as battle, dialogue, menu, title, blank or field from its pixels alone
+
+    Works on the native 240x160 frame with NumPy: colour-class fractions (a coarse colour
+    histogram: white, dark, HP-bar green/yellow/red, warm) of fixed screen regions, plus two
+    templates - an HP bar (a horizontal run of bar-coloured pixels inside a light HP box) in the
+    enemy and player HP box positions, and a text box (a full-width edge row above a white
+    interior at the bottom of the screen) with its red "continue" arrow in the bottom-right
+    corner. Choice menus (a white panel on the right) win over the text box under them. A frame
+    takes a few milliseconds including PNG decoding.
+    """
+
+    SCENES = ("battle", "dialogue", "menu", "title", "blank", "field")
+    HINTS = {
+        "battle": "LOCAL SCENE: battle - pick one battle menu option or move per batch and check the result",
+        "dialogue": "LOCAL SCENE: dialogue - a text box is open with no choice menu; advance it with a batch of A presses",
+        "menu": "LOCAL SCENE: menu - a menu or choice box is open; move the cursor and confirm deliberately",
+        "title": "LOCAL SCENE: title screen - press START or A to continue"
+    }
+
+    def __init__(self, size=(240, 160)):
+        from collections import deque
+
+        self.size = size
+        self.counts = {scene: 0 for scene in self.SCENES}
+        self.latencies = deque(maxlen=500)
+
+    def decode(self, image_bytes):
+        """Encoded frame -> int16 RGB array at native resolution"""
+        image = Image.open(io.BytesIO(image_bytes)).convert('RGB')
+        if image.size != self.size:
+            image = image.resize(self.size, Image.Resampling.NEAREST)
+        return np.asarray(image, dtype=np.int16)
+
+    @staticmethod
+    def colour_classes(rgb):
+        """Boolean masks for the colour classes the features are built from"""
+        r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+        spread = np.maximum(np.maximum(r, g), b) - np.minimum(np.minimum(r, g), b)
+        white = (r > 200) & (g > 200) & (b > 184)
+        return {
+            "white": white,
+            # Window paper: white plus the grey text and shadow printed on it
+            "paper": white | ((spread < 24) & (r > 64) & (r < 232)),
+            "dark": (r < 72) & (g < 72) & (b < 72),
+            "bar": ((g > 200) & (b > 120) & (g - r > 80))        # HP green
+                   | ((r > 216) & (g > 176) & (b < 100))         # HP yellow
+                   | ((r > 216) & (g < 120) & (b < 100)),        # HP red
+            "warm": (r > 150) & (r - g > 60) & (r - b > 60),
+            "arrow": (r > 180) & (g < 120) & (b < 100)
+        }
+
+    @staticmethod
+    def longest_run(mask):
+        """Longest horizontal run of True pixels in a 2-D mask"""
+        if not mask.any():
+            return 0
+        padded = np.zeros((mask.shape[0], mask.shape[1] + 2), dtype=np.int8)
+        padded[:, 1:-1] = mask
+        edges = np.diff(padded, axis=1)
+        return int((np.nonzero(edges == -1)[1] - np.nonzero(edges == 1)[1]).max())
+
+    @staticmethod
+    def text_box_top(row_white, row_paper):
+        """Row of the top edge of a bottom-of-screen text box, None if there is none"""
+        height = len(row_white)
+        for row in range(int(height * 0.62), int(height * 0.82)):
+            # The edge row is (almost) entirely frame colour, the box below it mostly white paper
+            if row_white[row] < 0.15 and row_paper[row + 3:height - 6].mean() > 0.8 and row_white[row + 3:height - 6].mean() > 0.4:
+                return row
+        return None
+
+    def features(self, rgb):
+        """Region and template features of a decoded frame"""
+        classes = self.colour_classes(rgb)
+        height, width = classes["white"].shape
+        white, paper = classes["white"], classes["paper"]
+
+        hp_boxes = []
+        for top, bottom, left, right in ((0, 0.35, 0, 0.55), (0.4, 0.75, 0.45, 1.0)):
+            region = (slice(int(height * top), int(height * bottom)), slice(int(width * left), int(width * right)))
+            hp_boxes.append({
+                "bar_run": self.longest_run(classes["bar"][region]),
+                "light": float(white[region].mean())
+            })
+
+        inner = slice(8, width - 8)
+        box_top = self.text_box_top(white[:, inner].mean(axis=1), paper[:, inner].mean(axis=1))
+        continue_arrow = False
+        if box_top is not None:
+            # The arrow sits after the last line, clear of the text; it blinks, so callers poll it
+            corner = classes["arrow"][box_top + 16:height - 3, width - 26:width - 6]
+            continue_arrow = 4 <= int(corner.sum()) <= 64
+
+        # Rows where a window covers the right edge but not the left of the screen
+        panel_limit = box_top if box_top is not None else int(height * 0.7)
+        right = slice(int(width * 0.75), width - 4)
+        right_paper = paper[:panel_limit, right].mean(axis=1)
+        right_white = white[:panel_limit, right].mean(axis=1)
+        left_paper = paper[:panel_limit, 4:int(width * 0.5)].mean(axis=1)
+        panel_rows = (right_paper > 0.85) & (right_white > 0.3) & (left_paper < 0.4)
+
+        return {
+            "luminance_std": float(rgb.std()),
+            "dark": float(classes["dark"].mean()),
+            "warm": float(classes["warm"].mean()),
+            "hp_boxes": hp_boxes,
+            "text_box_top": box_top,
+            "continue_arrow": continue_arrow,
+            "panel_rows": self.longest_run(panel_rows[None, :]),
+            "bottom_white": float(white[int(height * 0.72):height - 4, inner].mean()),
+            "top_white": float(white[:int(height * 0.5)].mean())
+        }
+
+    @staticmethod
+    def label(features):
+        """Scene for a feature dict"""
+        if features["luminance_std"] < 6:
+            return "blank"
+        if features["dark"] > 0.35 and features["warm"] > 0.02:
+            return "title"
+        bars = [box["bar_run"] for box in features["hp_boxes"] if box["light"] > 0.15]
+        if (len(bars) == 2 and min(bars) >= 4) or max(bars, default=0) >= 16:
+            return "battle"
+        if features["panel_rows"] >= 24:
+            return "menu"
+        if features["text_box_top"] is not None or (features["bottom_white"] > 0.75 and features["top_white"] < 0.5):
+            return "dialogue"
+        return "field"
+
+    def classify(self, image_bytes=None, rgb=None):
+        """Label a frame: {"scene", "features", "ms"}"""
+        start = time.perf_counter()
+        if rgb is None:
+            rgb = self.decode(image_bytes)
+        features = self.features(rgb)
+        scene = self.label(features)
+        elapsed = time.perf_counter() - start
+        self.counts[scene] += 1
+        self.latencies.append(elapsed)
+        return {"scene": scene, "features": features, "ms": elapsed * 1000}
+
+    def stats(self):
+        latencies = sorted(self.latencies)
+        return {
+            "frames": sum(self.counts.values()),
+            "scenes": dict(self.counts),
+            "ms_mean": (sum(latencies) / len(latencies) * 1000) if latencies else 0.0,
+            "ms_p95": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000 if latencies else 0.0
+        }
+
+
+class ModelRouter:
+    """Routes each xAI call to a model tier: a fast tier for dialogue and menus, the full tier for battles and navigation
+
+    Each tier is a dict with "model", "detail" (image detail), "timeout" (seconds, None keeps
+    the per-function default) and "max_tokens" (cap applied to the request). The scene comes
+    from the local SceneClassifier label of the captured frame plus keywords in the last decision;
+    after `max_fast_streak` fast decisions in a row one call is escalated to the full tier.
+    """
+
+    FAST_SCENES = ("dialogue", "menu", "title")
+    FULL_FUNCTIONS = ("Memory Cleanup",)
+    FAST_FUNCTIONS = ("Tool Selection",)
+    SCENE_KEYWORDS = (
+        ("battle", ("battle", "fight", "hp bar", "wild ", "foe ", "sent out", "used ")),
+        ("menu", ("menu", "bag", "options", "save the game", "yes/no", "naming screen")),
+        ("dialogue", ("dialogue", "dialog", "text box", "textbox", "speech", "message box", "says"))
+    )
+
+    def __init__(self, tiers, enabled=True, max_fast_streak=8):
+        self.tiers = tiers
+        self.enabled = enabled
+        self.max_fast_streak = max_fast_streak
+
+        self.frame_scene = None
+        self.decision_scene = None
+        self.fast_streak = 0
+        self.fallback_seen = False
+
+        self.last_tier = {}  # function_name -> tier of its most recent request
+        self.last_ceiling = {}  # function_name -> most completion tokens its most recent request could be given
+        self.calls = {name: 0 for name in tiers}
+        self.latencies = {name: [] for name in tiers}
+
+    @classmethod
+    def classify_description(cls, text):
+        """Scene named by a decision's image description / reasoning (battle wins over dialogue)"""
+        text = (text or "").lower()
+        for scene, keywords in cls.SCENE_KEYWORDS:
+            if any(keyword in text for keyword in keywords):
+                return scene
+        return None
+
+    def observe_scene(self, scene):
+        """Record the local classifier's label for this cycle's frame (None if unknown)"""
+        self.frame_scene = scene
+
+    def observe_decision(self, decision):
+        """Update routing history from a finished decision"""
+        text = f"{decision.get('image_description', '')} {decision.get('reasoning', '')}"
+        self.decision_scene = self.classify_description(text)
+        self.fallback_seen = bool(decision.get("fallback"))
+        self.fast_streak = self.fast_streak + 1 if self.scene() in self.FAST_SCENES else 0
+
+    def scene(self):
+        """Best current scene guess"""
+        if "battle" in (self.frame_scene, self.decision_scene):
+            return "battle"
+        if self.frame_scene in ("dialogue", "menu", "title"):
+            return self.frame_scene
+        if self.frame_scene == "field" and self.decision_scene in self.FAST_SCENES:
+            return None  # The text box or menu the last decision talked about is gone
+        return self.decision_scene
+
+    def route(self, function_name):
+        """Pick the tier for a call"""
+        if not self.enabled or function_name in self.FULL_FUNCTIONS:
+            return "full"
+        if function_name in self.FAST_FUNCTIONS:
+            return "fast"
+        if self.fallback_seen or self.fast_streak >= self.max_fast_streak:
+            # Last answer was unusable, or we've been on the fast tier for a while - get a second opinion
+            return "full"
+        return "fast" if self.scene() in self.FAST_SCENES else "full"
+
+    def apply(self, payload, tier, function_name, requested_max_tokens=None):
+        """Set the tier's model, token cap and image detail on a request body
+        Args:
+            requested_max_tokens (int): The caller's ceiling before any learned budget narrowed max_tokens
+        """
+        config = self.tiers[tier]
+        payload["model"] = config["model"]
+        payload["max_tokens"] = min(payload["max_tokens"], config["max_tokens"])
+        self.last_ceiling[function_name] = min(requested_max_tokens or payload["max_tokens"], config["max_tokens"])
+        payload["messages"] = [self._with_detail(message, config["detail"]) for message in payload["messages"]]
+
+        self.last_tier[function_name] = tier
+        self.calls[tier] += 1
+        if tier == "full" and self.fast_streak >= self.max_fast_streak and function_name not in self.FULL_FUNCTIONS:
+            self.fast_streak = 0
+        return payload
+
+    @staticmethod
+    def _with_detail(message, detail):
+        content = message.get("content")
+        if not isinstance(content, list):
+            return message
+        parts = []
+        for part in content:
+            if part.get("type") == "image_url":
+                part = dict(part, image_url=dict(part["image_url"], detail=detail))
+            parts.append(part)
+        return dict(message, content=parts)
+
+    def record_latency(self, function_name, seconds):
+        """Record a successful call's latency against the tier it was routed to"""
+        tier = self.last_tier.get(function_name)
+        if tier is not None:
+            self.latencies[tier].append(seconds)
+        return tier
+
+    def stats(self):
+        """Per-tier call counts and latency percentiles"""
+        stats = {}
+        for name in self.tiers:
+            samples = sorted(self.latencies[name])
+            stats[name] = {
+                "calls": self.calls[name],
+                "completed": len(samples),
+                "mean": (sum(samples) / len(samples)) if samples else 0.0,
+                "p50": samples[len(samples) // 2] if samples else 0.0,
+                "p95": samples[min(len(samples) - 1, int(len(samples) * 0.95))] if samples else 0.0
+            }
+        return stats
+
+
+class AdaptiveBudgets:
+    """Per call type token budgets and timeouts learned from observed responses
+
+    Once `min_samples` calls of a type have completed, max_tokens becomes
+    p95(completion tokens) x `token_headroom` and the timeout p99(latency) x `timeout_factor`,
+    both clamped between a floor and the configured ceiling. A truncated response
+    (finish_reason "length") doubles that call type's token boost; clean responses decay it.
+    """
+
+    def __init__(self, window=50, min_samples=5, token_headroom=1.5, min_tokens=256, timeout_factor=2.0, min_timeout=10):
+        from collections import deque, defaultdict
+
+        self.min_samples = min_samples
+        self.token_headroom = token_headroom
+        self.min_tokens = min_tokens
+        self.timeout_factor = timeout_factor
+        self.min_timeout = min_timeout
+
+        self.sizes = defaultdict(lambda: deque(maxlen=window))      # key -> completion tokens
+        self.latencies = defaultdict(lambda: deque(maxlen=window))  # key -> seconds (timeouts count as their limit)
+        self.boost = defaultdict(lambda: 1.0)
+        self.overruns = defaultdict(int)
+
+    @staticmethod
+    def percentile(samples, q):
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+    def max_tokens(self, key, ceiling):
+        """Token budget for a call type (the ceiling until enough samples exist)"""
+        samples = self.sizes[key]
+        if len(samples) < self.min_samples:
+            return ceiling
+        budget = self.percentile(samples, 0.95) * self.token_headroom * self.boost[key]
+        return int(min(ceiling, max(self.min_tokens, budget)))
+
+    def timeout(self, key, ceiling):
+        """Timeout for a call type (the ceiling until enough samples exist)"""
+        samples = self.latencies[key]
+        if len(samples) < self.min_samples:
+            return ceiling
+        return round(min(ceiling, max(self.min_timeout, self.percentile(samples, 0.99) * self.timeout_factor)), 1)
+
+    def record(self, key, latency, tokens):
+        """Record a completed, untruncated response"""
+        self.latencies[key].append(latency)
+        if tokens:
+            self.sizes[key].append(tokens)
+        self.boost[key] = max(1.0, self.boost[key] * 0.9)
+
+    def record_timeout(self, key, timeout):
+        """A timed-out call took at least `timeout` seconds"""
+        self.latencies[key].append(timeout)
+
+    def record_overrun(self, key, latency, tokens):
+        """Record a response cut off by max_tokens and widen the budget"""
+        self.latencies[key].append(latency)
+        self.overruns[key] += 1
+        self.boost[key] = min(8.0, self.boost[key] * 2)
+
+    def stats(self):
+        """Current budget, p99 latency and overruns per call type"""
+        return {
+            key: {
+                "samples": len(self.latencies[key]),
+                "p95_tokens": self.percentile(self.sizes[key], 0.95) if self.sizes[key] else 0,
+                "p99_latency": self.percentile(self.latencies[key], 0.99) if self.latencies[key] else 0.0,
+                "boost": self.boost[key],
+                "overruns": self.overruns[key]
+            }
+            for key in list(self.latencies)
+        }
+
+
+class RateLimiter:
+    """Token-bucket rate limiter shared by every xAI call site (worker threads and the asyncio loop)
+
+    `rate` requests per second refill a bucket of `burst` tokens; callers that find it empty
+    wait their turn. Server hints (Retry-After, x-ratelimit-remaining/reset headers) pause the
+    bucket until the advertised time.
+    """
+
+    def __init__(self, rate=2.0, burst=4):
+        import threading
+
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+        self.throttled_seconds = 0.0  # Total time callers spent waiting on the bucket or a server pause
+        self.server_pauses = 0
+
+    def reserve(self):
+        """Take one token and return how many seconds the caller must wait before sending"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1  # May go negative: later callers queue behind the debt
+            wait = max(0.0, -self.tokens / self.rate, self.blocked_until - now)
+            self.throttled_seconds += wait
+            return wait
+
+    def acquire(self):
+        """Blocking acquire for the requests-based call paths"""
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def try_acquire(self):
+        """Take a token only if one is available right now (for optional extra requests like hedges)"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1 or self.blocked_until > now:
+                return False
+            self.tokens -= 1
+            return True
+
+    async def acquire_async(self):
+        """Non-blocking acquire for the asyncio call paths"""
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    @staticmethod
+    def parse_duration(value):
+        """Seconds from a Retry-After / reset header ("2", "1.5", "250ms", "1m30s" or an HTTP date)"""
+        if value is None:
+            return None
+        value = str(value).strip()
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        match = re.fullmatch(r'(?:(\d+(?:\.\d+)?)h)?(?:(\d+(?:\.\d+)?)m(?!s))?(?:(\d+(?:\.\d+)?)s)?(?:(\d+(?:\.\d+)?)ms)?', value)
+        if match and any(match.groups()):
+            hours, minutes, seconds, millis = (float(g) if g else 0.0 for g in match.groups())
+            return hours * 3600 + minutes * 60 + seconds + millis / 1000
+        try:
+            from email.utils import parsedate_to_datetime
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+    def pause(self, seconds):
+        """Hold every caller back for `seconds` (server asked us to slow down)"""
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            self.server_pauses += 1
+
+    def observe_response(self, status, headers, default_pause=5.0):
+        """Apply rate-limit hints from a response; returns the pause applied (0 if none)"""
+        headers = {k.lower(): v for k, v in (headers or {}).items()}
+        pause = 0.0
+        if status == 429:
+            pause = self.parse_duration(headers.get("retry-after"))
+            if pause is None:
+                pause = self.parse_duration(headers.get("x-ratelimit-reset-requests"))
+            pause = default_pause if pause is None else pause
+        elif headers.get("x-ratelimit-remaining-requests") == "0":
+            pause = self.parse_duration(headers.get("x-ratelimit-reset-requests")) or 1.0
+        if pause:
+            self.pause(pause)
+        return pause
+
+
+class CircuitBreaker:
+    """Fails API calls fast while the upstream is degraded
+
+    closed -> open after `failure_threshold` consecutive failures; while open every call is
+    refused for `cooldown` seconds; then a single half-open probe either closes the circuit
+    again or re-opens it. The caller holding the probe (admit() says so) must resolve it:
+    resolve_probe() counts a probe that ended without a success or failure as a failure.
+    `on_transition(old, new)` is called on every state change.
+    """
+
+    def __init__(self, failure_threshold=3, cooldown=30, on_transition=None):
+        import threading
+        from collections import defaultdict
+
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.on_transition = on_transition
+        self.lock = threading.RLock()  # on_transition may read stats() while we hold the lock
+
+        self.state = "closed"
+        self.failures = 0
+        self.changed_at = time.monotonic()
+        self.probe_in_flight = False
+
+        self.transitions = defaultdict(int)  # "closed->open" -> count
+        self.open_seconds = 0.0
+        self.rejected = 0
+
+    def _transition(self, new_state):
+        old_state, now = self.state, time.monotonic()
+        if old_state != "closed":
+            self.open_seconds += now - self.changed_at
+        self.state, self.changed_at = new_state, now
+        self.transitions[f"{old_state}->{new_state}"] += 1
+        if self.on_transition:
+            self.on_transition(old_state, new_state)
+
+    def admit(self):
+        """(allowed, probe): whether a call may go upstream now, and whether it is the half-open probe"""
+        with self.lock:
+            if self.state == "open" and time.monotonic() - self.changed_at >= self.cooldown:
+                self._transition("half_open")
+            if self.state == "closed" or (self.state == "half_open" and not self.probe_in_flight):
+                self.probe_in_flight = self.state == "half_open"
+                return True, self.probe_in_flight
+            self.rejected += 1
+            return False, False
+
+    def allow(self):
+        """Whether a call may go upstream now"""
+        return self.admit()[0]
+
+    def resolve_probe(self, probe):
+        """End of a call: a probe that recorded no outcome (429, unexpected error) counts as a failure"""
+        with self.lock:
+            if probe and self.probe_in_flight and self.state == "half_open":
+                self.record_failure()
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.probe_in_flight = False
+            if self.state != "closed":
+                self._transition("closed")
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.probe_in_flight = False
+            if self.state == "half_open" or (self.state == "closed" and self.failures >= self.failure_threshold):
+                self._transition("open")
+
+    def stats(self):
+        """State, transition counts and time spent degraded"""
+        with self.lock:
+            open_seconds = self.open_seconds + (time.monotonic() - self.changed_at if self.state != "closed" else 0.0)
+            return {
+                "state": self.state,
+                "transitions": dict(self.transitions),
+                "open_seconds": round(open_seconds, 2),
+                "rejected_calls": self.rejected
+            }
+
+
+class RequestHedger:
+    """Decides when to hedge a slow API call with a duplicate request
+
+    A call that runs past the `percentile` of recent latency for its function name gets a
+    duplicate; whichever valid response arrives first wins. Hedges are capped at `budget`
+    (fraction of calls) so a slow upstream is not hit with double traffic.
+    """
+
+    def __init__(self, percentile=0.9, budget=0.1, min_samples=10, window=100, min_delay=1.0):
+        import threading
+        from collections import deque, defaultdict
+
+        self.percentile = percentile
+        self.budget = budget
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.latencies = defaultdict(lambda: deque(maxlen=window))
+        self.lock = threading.Lock()
+
+        self.calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.primary_wins = 0
+        self.over_budget = 0
+
+    def record(self, function_name, latency):
+        with self.lock:
+            self.latencies[function_name].append(latency)
+
+    def hedge_delay(self, function_name):
+        """Seconds to wait before hedging this call, or None if there is not enough history yet"""
+        with self.lock:
+            self.calls += 1
+            samples = sorted(self.latencies[function_name])
+        if len(samples) < self.min_samples:
+            return None
+        return max(self.min_delay, samples[min(len(samples) - 1, int(len(samples) * self.percentile))])
+
+    def try_spend(self):
+        """Reserve a hedge if it stays within the budget"""
+        with self.lock:
+            if self.hedges + 1 > self.budget * self.calls:
+                self.over_budget += 1
+                return False
+            self.hedges += 1
+            return True
+
+    def refund(self):
+        """Give back a reserved hedge that was never sent (e.g. the rate limiter had no token)"""
+        with self.lock:
+            self.hedges -= 1
+
+    def record_winner(self, hedge_won):
+        with self.lock:
+            if hedge_won:
+                self.hedge_wins += 1
+            else:
+                self.primary_wins += 1
+
+    def stats(self):
+        """Hedge rate and win statistics"""
+        with self.lock:
+            return {
+                "calls": self.calls,
+                "hedges": self.hedges,
+                "hedge_rate": (self.hedges / self.calls) if self.calls else 0.0,
+                "hedge_wins": self.hedge_wins,
+                "primary_wins": self.primary_wins,
+                "over_budget": self.over_budget
+            }
+
+
+class ConversationSession:
+    """Rolling multi-turn context for one decision call type
+
+    Messages are [static system prompt] + committed turns + the new turn. The first turn of a
+    window carries the full memory and later turns only the entries appended since, so the
+    prefix stays byte-identical between calls and server-side prompt caching applies. Images
+    are sent only with the turn that needs them (committed turns keep a text placeholder).
+    When the window would exceed `token_budget`, or the memory changed other than by
+    appending, the next turn opens a new window with a fresh memory snapshot.
+    """
+
+    def __init__(self, system_prompt, token_budget=24000, image_tokens=1800):
+        self.system_prompt = system_prompt
+        self.token_budget = token_budget
+        self.image_tokens = image_tokens
+
+        self.history = []        # Committed user/assistant messages (text only)
+        self.memory_sent = None  # Memory entries the current window already knows
+
+        self.turns = 0
+        self.windows = 0
+        self.request_bytes = 0
+
+    @staticmethod
+    def estimate_tokens(text):
+        return len(text) // 4
+
+    @staticmethod
+    def format_memory(memory_list, start=0, header="//MEMORY//", footer="//END MEMORY//"):
+        entries = "\n".join(f"{start + i + 1}. {memory}" for i, memory in enumerate(memory_list[start:]))
+        return f"{header}\n{entries}\n{footer}\n\n"
+
+    def memory_delta(self, memory_list):
+        """Memory text for the next turn
+        Returns:
+            (text, new_window): new_window is True if the full memory has to be resent
+        """
+        known = self.memory_sent
+        if known is None or memory_list[:len(known)] != known:
+            return self.format_memory(memory_list), True
+        if len(memory_list) == len(known):
+            return "//MEMORY UNCHANGED//\n\n", False
+        return self.format_memory(memory_list, len(known), "//NEW MEMORY ENTRIES//", "//END NEW MEMORY ENTRIES//"), False
+
+    def prepare_turn(self, memory_list, text, image_base64=None):
+        """Build the messages for the next call without changing the session
+        Returns:
+            (messages, turn): pass turn to commit_turn once the reply is in
+        """
+        delta, new_window = self.memory_delta(memory_list)
+        if not new_window:
+            window = self.system_prompt + "".join(message["content"] for message in self.history) + delta + text
+            if self.estimate_tokens(window) + (self.image_tokens if image_base64 else 0) > self.token_budget:
+                delta, new_window = self.format_memory(memory_list), True
+
+        user_text = delta + text
+        content = user_text
+        if image_base64:
+            content = [
+                {"type": "text", "text": user_text},
+                {"type": "image_url", "image_url": {"url": image_data_url(image_base64), "detail": "high"}}
+            ]
+
+        history = [] if new_window else self.history
+        messages = [{"role": "system", "content": self.system_prompt}] + history + [{"role": "user", "content": content}]
+        self.request_bytes += len(json.dumps(messages))
+
+        turn = {
+            "new_window": new_window,
+            "user": {"role": "user", "content": user_text + ("\n[screenshot was attached]" if image_base64 else "")},
+            "memory": list(memory_list)
+        }
+        return messages, turn
+
+    def commit_turn(self, turn, reply):
+        """Append an answered turn to the window"""
+        if turn["new_window"]:
+            self.history = []
+            self.windows += 1
+        self.history = self.history + [turn["user"], {"role": "assistant", "content": reply}]
+        self.memory_sent = turn["memory"]
+        self.turns += 1
+
+    def stats(self):
+        return {
+            "turns": self.turns,
+            "windows": self.windows,
+            "history_messages": len(self.history),
+            "avg_request_bytes": (self.request_bytes // self.turns) if self.turns else 0
+        }
+
+
+class CallLedger:
+    """Per-call token, byte and latency accounting
+
+    Every call is recorded with its function name and frame; aggregates are kept per
+    function name (whole session), over a rolling window of recent calls, and per frame
+    (cost of one loop iteration). Records are optionally appended to a JSON-lines log,
+    directly or through `sink`.
+    """
+
+    FIELDS = ("prompt_tokens", "completion_tokens", "cached_tokens", "reasoning_tokens", "request_bytes", "image_bytes", "latency")
+
+    def __init__(self, window=200, log_path=None, sink=None):
+        import threading
+        from collections import deque, defaultdict
+
+        self.sink = sink  # sink(path, line) appends elsewhere (e.g. a background writer)
+        self.recent = deque(maxlen=window)
+        self.totals = defaultdict(lambda: dict.fromkeys(("calls",) + self.FIELDS, 0))
+        self.frame_tokens = defaultdict(int)  # frame -> prompt + completion tokens
+        self.log_path = log_path
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def payload_sizes(payload):
+        """(request body bytes, decoded image bytes) of a chat completions payload"""
+        body = json.dumps(payload)
+        image_bytes = 0
+        for message in payload.get("messages", []):
+            content = message.get("content")
+            if isinstance(content, list):
+                for part in content:
+                    if part.get("type") == "image_url":
+                        url = part["image_url"]["url"]
+                        image_bytes += len(url.split(",", 1)[-1]) * 3 // 4
+        return len(body.encode('utf-8')), image_bytes
+
+    def record(self, function_name, frame, usage, request_bytes, image_bytes, latency):
+        """Record one completed call"""
+        usage = usage or {}
+        entry = {
+            "time": time.time(),
+            "function": function_name,
+            "frame": frame,
+            "prompt_tokens": usage.get("prompt_tokens") or 0,
+            "completion_tokens": usage.get("completion_tokens") or 0,
+            "cached_tokens": (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0,
+            "reasoning_tokens": (usage.get("completion_tokens_details") or {}).get("reasoning_tokens") or 0,
+            "request_bytes": request_bytes,
+            "image_bytes": image_bytes,
+            "latency": round(latency, 3)
+        }
+        with self.lock:
+            self.recent.append(entry)
+            totals = self.totals[function_name]
+            totals["calls"] += 1
+            for key in self.FIELDS:
+                totals[key] += entry[key]
+            self.frame_tokens[frame] += entry["prompt_tokens"] + entry["completion_tokens"]
+            if self.log_path:
+                if self.sink is not None:
+                    self.sink(self.log_path, json.dumps(entry) + "\n")
+                else:
+                    with open(self.log_path, 'a') as f:
+                        f.write(json.dumps(entry) + "\n")
+        return entry
+
+    def rolling(self):
+        """Means over the recent window"""
+        with self.lock:
+            entries = list(self.recent)
+        if not entries:
+            return {}
+        means = {key: sum(entry[key] for entry in entries) / len(entries) for key in self.FIELDS}
+        means["calls"] = len(entries)
+        return means
+
+    def summary(self):
+        """Session totals and per-call means by function name, plus tokens per loop iteration"""
+        with self.lock:
+            per_function = {}
+            for function_name, totals in self.totals.items():
+                calls = totals["calls"]
+                per_function[function_name] = dict(totals, **{f"mean_{key}": totals[key] / calls for key in self.FIELDS})
+            frames = len(self.frame_tokens)
+            return {
+                "functions": per_function,
+                "total_tokens": sum(t["prompt_tokens"] + t["completion_tokens"] for t in self.totals.values()),
+                "frames": frames,
+                "tokens_per_frame": (sum(self.frame_tokens.values()) / frames) if frames else 0.0
+            }
+
+
+class DevToolsConnection:
+    """Event-receiving Chrome DevTools websocket to the page, alongside ChromeDriver's own session
+
+    Selenium's execute_cdp_cmd can send commands but never sees events; this connection dispatches
+    events (screencast frames, binding calls from page scripts) to handlers on a reader thread.
+    """
+
+    def __init__(self, websocket_url):
+        import threading
+        from collections import defaultdict
+
+        self.websocket_url = websocket_url
+        self.handlers = defaultdict(list)  # event method -> [handler(params)]
+        self.connection = None
+        self.reader = None
+        self.running = False
+        self.message_id = 0
+        self.send_lock = threading.Lock()
+
+    @staticmethod
+    def page_websocket_url(driver):
+        """DevTools websocket URL of the page ChromeDriver is controlling"""
+        debugger_address = driver.capabilities.get('goog:chromeOptions', {}).get('debuggerAddress')
+        if not debugger_address:
+            return None
+        targets = requests.get(f"http://{debugger_address}/json", timeout=5).json()
+        pages = [target for target in targets if target.get('type') == 'page' and target.get('webSocketDebuggerUrl')]
+        current = [target for target in pages if target.get('url') == driver.current_url]
+        return (current or pages or [{}])[0].get('webSocketDebuggerUrl')
+
+    def on(self, method, handler):
+        self.handlers[method].append(handler)
+
+    def send(self, method, params=None):
+        with self.send_lock:
+            self.message_id += 1
+            self.connection.send(json.dumps({"id": self.message_id, "method": method, "params": params or {}}))
+
+    def start(self):
+        import threading
+        import websocket
+
+        # No Origin header: Chrome rejects DevTools websockets from unlisted origins
+        self.connection = websocket.create_connection(self.websocket_url, timeout=None, suppress_origin=True)
+        self.running = True
+        self.reader = threading.Thread(target=self._read, name="devtools-reader", daemon=True)
+        self.reader.start()
+        return self
+
+    def _read(self):
+        while self.running:
+            try:
+                message = json.loads(self.connection.recv())
+            except Exception:
+                self.running = False
+                break
+            for handler in self.handlers.get(message.get("method"), ()):
+                try:
+                    handler(message["params"])
+                except Exception:
+                    pass
+
+    def close(self):
+        self.running = False
+        if self.connection is not None:
+            try:
+                self.connection.close()
+            except Exception:
+                pass
+            self.connection = None
+
+
+class ScreencastRecorder:
+    """Keeps the latest N frames of a Chrome DevTools Page.startScreencast stream in memory
+
+    Frames arrive on the DevTools connection's reader thread, are acknowledged and stored as
+    (received time, image bytes, metadata) in a ring buffer, so the newest frame can be read without
+    a browser round trip. Chrome only sends frames when the page repaints, so the newest frame is
+    current even if it is old.
+    """
+
+    def __init__(self, devtools, capacity=8, image_format="png", quality=80, every_nth_frame=1):
+        import threading
+        from collections import deque
+
+        self.devtools = devtools
+        self.image_format = image_format
+        self.quality = quality
+        self.every_nth_frame = every_nth_frame
+        self.frames = deque(maxlen=capacity)
+        self.frame_count = 0
+        self.streaming = False
+        self.first_frame = threading.Event()
+        devtools.on("Page.screencastFrame", self._on_frame)
+
+    @property
+    def running(self):
+        return self.streaming and self.devtools.running
+
+    def start(self):
+        self.devtools.send("Page.startScreencast", {"format": self.image_format, "quality": self.quality, "everyNthFrame": self.every_nth_frame})
+        self.streaming = True
+        return self
+
+    def _on_frame(self, params):
+        self.devtools.send("Page.screencastFrameAck", {"sessionId": params["sessionId"]})
+        self.frames.append((time.time(), base64.b64decode(params["data"]), params.get("metadata", {})))
+        self.frame_count += 1
+        self.first_frame.set()
+
+    def latest(self, wait=0.0):
+        """(received time, image bytes, metadata) of the newest frame, waiting up to `wait` seconds for the first one"""
+        if not self.frames and wait:
+            self.first_frame.wait(wait)
+        return self.frames[-1] if self.frames else None
+
+    def recent(self, count=None):
+        """Newest-last list of buffered frames"""
+        frames = list(self.frames)
+        return frames[-count:] if count else frames
+
+    def stop(self):
+        if self.streaming and self.devtools.running:
+            try:
+                self.devtools.send("Page.stopScreencast")
+            except Exception:
+                pass
+        self.streaming = False
+
+
+class FrameDiffer:
+    """NumPy frame differencing over captured canvases
+
+    Frames are decoded to grayscale at GBA resolution (nearest neighbour, one sample per game pixel)
+    so the diff itself stays well under a millisecond. Each diff reports the changed-pixel ratio, the
+    changed tiles and their bounding box, and classifies the change:
+        static     - nothing beyond noise changed (blocked movement, ignored key press)
+        animating  - small localized changes (text printing, cursor, idle water/NPC animation)
+        changed    - large changes (walking scrolls the map, transitions, battle start)
+    """
+
+    def __init__(self, size=(240, 160), tile=16, pixel_threshold=24, static_ratio=0.002, changed_ratio=0.10):
+        from collections import deque
+
+        self.size = size
+        self.tile = tile
+        self.pixel_threshold = pixel_threshold
+        self.static_ratio = static_ratio
+        self.changed_ratio = changed_ratio
+
+        self.decode_times = deque(maxlen=200)
+        self.diff_times = deque(maxlen=200)
+        self.states = {"static": 0, "animating": 0, "changed": 0}
+
+    def decode(self, image_bytes):
+        """Encoded frame -> uint8 grayscale array at native resolution"""
+        start = time.perf_counter()
+        image = Image.open(io.BytesIO(image_bytes)).convert('L').resize(self.size, Image.Resampling.NEAREST)
+        frame = np.asarray(image, dtype=np.uint8)
+        self.decode_times.append(time.perf_counter() - start)
+        return frame
+
+    def diff(self, previous, current):
+        """Compare two decoded frames: {"state", "ratio", "tiles", "bbox", "ms"}"""
+        start = time.perf_counter()
+        changed = np.abs(current.astype(np.int16) - previous) > self.pixel_threshold
+        ratio = float(changed.mean())
+
+        # Changed-pixel ratio per tile; a tile counts as changed if any pixel in it did
+        rows, cols = changed.shape[0] // self.tile, changed.shape[1] // self.tile
+        tiles = changed[:rows * self.tile, :cols * self.tile].reshape(rows, self.tile, cols, self.tile).any(axis=(1, 3))
+        tile_rows, tile_cols = np.nonzero(tiles)
+        bbox = None
+        if len(tile_rows):
+            bbox = (int(tile_cols.min()) * self.tile, int(tile_rows.min()) * self.tile,
+                    (int(tile_cols.max()) + 1) * self.tile, (int(tile_rows.max()) + 1) * self.tile)
+
+        if ratio < self.static_ratio:
+            state = "static"
+        elif ratio < self.changed_ratio:
+            state = "animating"
+        else:
+            state = "changed"
+
+        elapsed = time.perf_counter() - start
+        self.diff_times.append(elapsed)
+        self.states[state] += 1
+        return {
+            "state": state,
+            "ratio": ratio,
+            "tiles": list(zip(tile_cols.tolist(), tile_rows.tolist())),
+            "bbox": bbox,
+            "ms": elapsed * 1000
+        }
+
+    def stats(self):
+        def mean_ms(samples):
+            return (sum(samples) / len(samples) * 1000) if samples else 0.0
+
+        return {
+            "states": dict(self.states),
+            "diff_ms_mean": mean_ms(self.diff_times),
+            "diff_ms_max": max(self.diff_times, default=0.0) * 1000,
+            "decode_ms_mean": mean_ms(self.decode_times)
+        }
+
+
+IMAGE_MIME_PREFIXES = {"iVBOR": "image/png", "UklGR": "image/webp", "/9j/": "image/jpeg"}
+
+
+def image_data_url(image_base64):
+    """data: URL for a base64 image, with the MIME type sniffed from its magic bytes"""
+    mime = next((mime for prefix, mime in IMAGE_MIME_PREFIXES.items() if image_base64.startswith(prefix)), "image/png")
+    return f"data:{mime};base64,{image_base64}"
+
+
+class VisionFrameEncoder:
+    """Shrinks captured game frames for vision payloads
+
+    The canvas shows the 240x160 GBA screen upscaled (600x400 x devicePixelRatio), so a frame is
+    resampled nearest-neighbour back to native resolution (times `scale`), snapped to the GBA's
+    15-bit colour space and stored as a palette image - exact when the frame has at most 256 colours,
+    otherwise quantized to `max_colors`. Every format in `formats` (indexed PNG, lossless WebP) is
+    tried and the smallest wins. Frames that are not game-shaped (full browser fallbacks) are only
+    palette-encoded, never resampled.
+    """
+
+    NATIVE_SIZE = (240, 160)
+
+    def __init__(self, scale=2, max_colors=64, formats=("png",)):
+        from collections import deque
+
+        self.scale = scale
+        self.max_colors = max_colors
+        self.formats = formats
+
+        self.frames = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.format_wins = {}
+        self.encode_times = deque(maxlen=200)
+
+    def target_size(self, size):
+        width, height = size
+        native_width, native_height = self.NATIVE_SIZE
+        if abs(width / height - native_width / native_height) > 0.03 or width < native_width:
+            return size
+        return (native_width * self.scale, native_height * self.scale)
+
+    def encode(self, image_bytes, image=None):
+        """Encoded frame (and its decoded RGB image, if already at hand) -> (smallest encoding bytes, format name, info dict)"""
+        start = time.perf_counter()
+        image = image or Image.open(io.BytesIO(image_bytes)).convert('RGB')
+        original_size = image.size
+
+        size = self.target_size(image.size)
+        if size != image.size:
+            image = image.resize(size, Image.Resampling.NEAREST)
+
+        # GBA colour is 5 bits per channel - dropping the low bits also removes scaling/blending noise
+        image = Image.fromarray(np.asarray(image) & 0xF8)
+        colors = image.getcolors(maxcolors=256)
+        if colors is not None:
+            palette_image = image.quantize(colors=len(colors), method=Image.Quantize.FASTOCTREE, dither=Image.Dither.NONE)
+        else:
+            palette_image = image.quantize(colors=self.max_colors, method=Image.Quantize.FASTOCTREE, dither=Image.Dither.NONE)
+
+        encodings = {}
+        for image_format in self.formats:
+            buffer = io.BytesIO()
+            if image_format == "webp":
+                palette_image.convert('RGB').save(buffer, format='WEBP', lossless=True, method=4)
+            else:
+                palette_image.save(buffer, format='PNG', optimize=True)
+            encodings[image_format] = buffer.getvalue()
+        best_format = min(encodings, key=lambda name: len(encodings[name]))
+        encoded = encodings[best_format]
+
+        self.frames += 1
+        self.bytes_in += len(image_bytes)
+        self.bytes_out += len(encoded)
+        self.format_wins[best_format] = self.format_wins.get(best_format, 0) + 1
+        self.encode_times.append(time.perf_counter() - start)
+        return encoded, best_format, {
+            "original_size": original_size,
+            "size": palette_image.size,
+            "colors": len(colors) if colors is not None else self.max_colors,
+            "bytes_in": len(image_bytes),
+            "bytes_out": len(encoded)
+        }
+
+    def stats(self):
+        return {
+            "frames": self.frames,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "saved_ratio": (1 - self.bytes_out / self.bytes_in) if self.bytes_in else 0.0,
+            "format_wins": dict(self.format_wins),
+            "encode_ms_mean": (sum(self.encode_times) / len(self.encode_times) * 1000) if self.encode_times else 0.0
+        }
+
+
+class FrameStore:
+    """Bounded in-memory store of screenshots keyed by screenshot number
+
+    Keeps each captured frame's encoded bytes plus lazily computed derivatives (decoded image,
+    base64, vision payload), so the vision path never re-reads from disk or re-encodes what was
+    just captured. The oldest frames are evicted beyond `capacity`; evicted numbers fall back to disk.
+    """
+
+    def __init__(self, capacity=32):
+        import threading
+        from collections import OrderedDict
+
+        self.capacity = capacity
+        self.frames = OrderedDict()  # number -> {"png": bytes, "derived": {name: value}}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def put(self, number, image_bytes):
+        with self.lock:
+            self.frames[number] = {"png": image_bytes, "derived": {}}
+            self.frames.move_to_end(number)
+            while len(self.frames) > self.capacity:
+                self.frames.popitem(last=False)
+
+    def png(self, number):
+        with self.lock:
+            entry = self.frames.get(number)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry["png"]
+
+    def derived(self, number, name, compute):
+        """compute(frame bytes) once per frame and keep the result (None if the frame is not held)"""
+        with self.lock:
+            entry = self.frames.get(number)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            if name in entry["derived"]:
+                return entry["derived"][name]
+            image_bytes = entry["png"]
+        value = compute(image_bytes)
+        with self.lock:
+            if number in self.frames:
+                self.frames[number]["derived"][name] = value
+        return value
+
+    def image(self, number):
+        """Decoded RGB image of a held frame"""
+        return self.derived(number, "image", lambda image_bytes: Image.open(io.BytesIO(image_bytes)).convert('RGB'))
+
+    def stats(self):
+        with self.lock:
+            return {"frames": len(self.frames), "hits": self.hits, "misses": self.misses}
+
+
+class PersistenceWriter:
+    """Background file writer fed by a bounded queue, so disk I/O never runs on the decision path
+
+    Jobs are whole-file writes (replaced atomically via a temp file), appends, or callables that
+    commit other stores (run once per batch however often they were queued). The worker takes
+    everything queued as one batch, keeps only the last write per path, and fsyncs once per file per
+    batch, with at most `max_open_files` open at a time. A failed whole-file write leaves the old file
+    and no temp file behind. Pending whole-file contents can be read back before they reach disk. A
+    full queue blocks the caller (counted as a stall) rather than dropping data.
+    """
+
+    def __init__(self, max_queue=1024, max_batch=64, fsync=True, max_open_files=16):
+        import atexit
+        import queue
+        import threading
+        from collections import deque
+
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.max_batch = max_batch
+        self.fsync = fsync
+        self.max_open_files = max_open_files
+        self.pending_writes = {}  # path -> latest queued whole-file content
+        self.lock = threading.Lock()
+
+        self.jobs = 0
+        self.batches = 0
+        self.bytes_written = 0
+        self.collapsed = 0
+        self.errors = 0
+        self.max_depth = 0
+        self.stall_seconds = 0.0
+        self.batch_latencies = deque(maxlen=200)
+        self.closed = False
+
+        self.worker = threading.Thread(target=self._run, name="persistence-writer", daemon=True)
+        self.worker.start()
+        atexit.register(self.close)
+
+    def _put(self, job):
+        import queue
+
+        if self.closed:
+            self._write_batch([job])
+            return
+        try:
+            self.queue.put_nowait(job)
+        except queue.Full:
+            start = time.monotonic()
+            self.queue.put(job)
+            self.stall_seconds += time.monotonic() - start
+        self.max_depth = max(self.max_depth, self.queue.qsize())
+
+    def write(self, path, data):
+        """Replace a file's content (str or bytes) in the background"""
+        with self.lock:
+            self.pending_writes[path] = data
+        self._put(("write", path, data))
+
+    def append(self, path, data):
+        """Append to a file in the background"""
+        self._put(("append", path, data))
+
+    def submit(self, commit):
+        """Run a commit callable on the writer thread (deduplicated within a batch)"""
+        self._put(("call", None, commit))
+
+    def pending(self, path):
+        """Content queued for a path but possibly not on disk yet (None if nothing is pending)"""
+        with self.lock:
+            return self.pending_writes.get(path)
+
+    def _run(self):
+        import queue
+
+        while True:
+            job = self.queue.get()
+            if job is None:
+                self.queue.task_done()
+                return
+            batch = [job]
+            while len(batch) < self.max_batch:
+                try:
+                    job = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if job is None:
+                    self.queue.put(None)  # Finish this batch first
+                    self.queue.task_done()
+                    break
+                batch.append(job)
+            try:
+                self._write_batch(batch)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def _write_batch(self, batch):
+        start = time.perf_counter()
+
+        # Only the last whole-file write per path matters; appends keep their order
+        last_write = {}
+        for index, (kind, path, _) in enumerate(batch):
+            if kind == "write":
+                last_write[path] = index
+        writes = []
+        for index, (kind, path, data) in enumerate(batch):
+            if kind == "call":
+                continue
+            if kind == "write" and last_write[path] != index:
+                self.collapsed += 1
+                continue
+            writes.append((kind, path, data))
+        for first in range(0, len(writes), self.max_open_files):
+            self._write_files(writes[first:first + self.max_open_files])
+
+        for commit in dict.fromkeys(data for kind, _, data in batch if kind == "call"):
+            try:
+                commit()
+            except Exception as e:
+                self.errors += 1
+                print(f"❌ Persistence commit failed: {e}")
+
+        self.jobs += len(batch)
+        self.batches += 1
+        self.batch_latencies.append(time.perf_counter() - start)
+
+    def _write_files(self, writes):
+        """Write, then fsync and close, one group of files (every handle is closed, whatever fails)"""
+        files = []
+        try:
+            for kind, path, data in writes:
+                binary = isinstance(data, bytes)
+                target = f"{path}.tmp" if kind == "write" else path
+                try:
+                    f = open(target, ('w' if kind == "write" else 'a') + ('b' if binary else ''), **({} if binary else {"encoding": "utf-8"}))
+                except Exception as e:
+                    self.errors += 1
+                    print(f"❌ Persistence write failed ({path}): {e}")
+                    continue
+                try:
+                    f.write(data)
+                except Exception as e:
+                    self.errors += 1
+                    print(f"❌ Persistence write failed ({path}): {e}")
+                    self._discard(f, kind, path)
+                    continue
+                files.append((f, kind, path, data))
+                self.bytes_written += len(data)
+
+            for f, kind, path, data in files:
+                try:
+                    if self.fsync:
+                        f.flush()
+                        os.fsync(f.fileno())
+                    f.close()
+                    if kind == "write":
+                        os.replace(f"{path}.tmp", path)
+                        with self.lock:
+                            if self.pending_writes.get(path) is data:
+                                del self.pending_writes[path]
+                except Exception as e:
+                    self.errors += 1
+                    print(f"❌ Persistence flush failed ({path}): {e}")
+                    self._discard(f, kind, path)
+        finally:
+            for f, _, _, _ in files:
+                try:
+                    f.close()
+                except OSError:
+                    pass
+
+    @staticmethod
+    def _discard(f, kind, path):
+        """Close a failed file and remove its temp file (the previous content stays in place)"""
+        try:
+            f.close()
+        except OSError:
+            pass
+        if kind == "write":
+            try:
+                os.remove(f"{path}.tmp")
+            except OSError:
+                pass
+
+    def flush(self, timeout=10.0):
+        """Wait until everything queued so far is on disk; False on timeout"""
+        deadline = time.monotonic() + timeout
+        while self.queue.unfinished_tasks:
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def close(self, timeout=10.0):
+        """Flush and stop the worker (later writes happen synchronously)"""
+        if self.closed:
+            return True
+        flushed = self.flush(timeout)
+        self.closed = True
+        self.queue.put(None)
+        self.worker.join(timeout=1.0)
+        return flushed
+
+    def stats(self):
+        latencies = list(self.batch_latencies)
+        return {
+            "queue_depth": self.queue.qsize(),
+            "max_queue_depth": self.max_depth,
+            "jobs": self.jobs,
+            "batches": self.batches,
+            "collapsed_writes": self.collapsed,
+            "bytes_written": self.bytes_written,
+            "errors": self.errors,
+            "stall_seconds": round(self.stall_seconds, 3),
+            "batch_ms_mean": (sum(latencies) / len(latencies) * 1000) if latencies else 0.0,
+            "batch_ms_max": max(latencies, default=0.0) * 1000
+        }
+
+
+class ScreenshotArchive:
+    """Content-addressed screenshot archive in a single SQLite file
+
+    Frames are stored once per SHA-256 of their PNG bytes (dialogue and menu screens repeat
+    constantly), and a (session, number) index maps every screenshot to its frame and description,
+    so screenshot numbers restarting at 1 in a new session never overwrite an older session. New
+    rows are held in memory until commit() writes them in one transaction on the persistence writer
+    thread; reads use a separate connection with SQLite memory-mapped I/O. compact() applies the
+    retention policy (newest sessions kept, total frame bytes capped), drops frames nothing refers
+    to any more and returns the freed pages to the filesystem.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS blobs (hash TEXT PRIMARY KEY, data BLOB NOT NULL, size INTEGER NOT NULL, first_seen REAL NOT NULL);
+    CREATE TABLE IF NOT EXISTS sessions (session TEXT PRIMARY KEY, started REAL NOT NULL);
+    CREATE TABLE IF NOT EXISTS shots (
+        session TEXT NOT NULL, number INTEGER NOT NULL, hash TEXT, description TEXT, created REAL NOT NULL,
+        PRIMARY KEY (session, number)
+    );
+    CREATE INDEX IF NOT EXISTS shots_hash ON shots (hash);
+    """
+
+    def __init__(self, path, session=None, max_sessions=20, max_bytes=512 * 1024 * 1024, mmap_bytes=256 * 1024 * 1024):
+        import sqlite3
+        import threading
+
+        self.path = path
+        self.session = session or f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()  # Guards the pending rows and counters
+        self.db_lock = threading.Lock()  # Guards both connections
+        self.pending_blobs = {}  # hash -> PNG bytes not committed yet
+        self.pending_shots = {}  # number -> hash
+        self.pending_descriptions = {}  # number -> description
+        self.seen = set()  # Hashes recorded this session
+
+        self.frames = 0
+        self.duplicates = 0
+        self.bytes_in = 0
+        self.bytes_stored = 0
+        self.commits = 0
+        self.commit_latencies = []
+        self.compactions = []
+        self.closed = False
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.writer = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.writer.execute("PRAGMA auto_vacuum=INCREMENTAL")  # Only takes effect on a new file
+        self.writer.execute("PRAGMA journal_mode=WAL")
+        self.writer.execute("PRAGMA synchronous=NORMAL")
+        self.writer.executescript(self.SCHEMA)
+        self.writer.execute("INSERT OR IGNORE INTO sessions (session, started) VALUES (?, ?)", (self.session, time.time()))
+        self.writer.commit()
+
+        self.reader = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.reader.execute(f"PRAGMA mmap_size={int(mmap_bytes)}")
+
+    @staticmethod
+    def content_hash(data):
+        import hashlib
+
+        return hashlib.sha256(data).hexdigest()
+
+    def put(self, number, data):
+        """Record screenshot `number` of this session; returns its content hash"""
+        digest = self.content_hash(data)
+        with self.lock:
+            self.frames += 1
+            self.bytes_in += len(data)
+            if digest in self.seen:
+                self.duplicates += 1
+            else:
+                self.seen.add(digest)
+                self.pending_blobs[digest] = data
+            self.pending_shots[number] = digest
+        return digest
+
+    def describe(self, number, description):
+        """Attach a description to screenshot `number` of this session"""
+        with self.lock:
+            self.pending_descriptions[number] = description
+
+    def commit(self):
+        """Write everything recorded so far in one transaction"""
+        with self.lock:
+            blobs, shots, descriptions = dict(self.pending_blobs), dict(self.pending_shots), dict(self.pending_descriptions)
+        if not (blobs or shots or descriptions):
+            return
+        start = time.perf_counter()
+        now = time.time()
+        stored, known = 0, 0
+        with self.db_lock:
+            if self.closed:
+                return
+            with self.writer:
+                for digest, data in blobs.items():
+                    cursor = self.writer.execute(
+                        "INSERT OR IGNORE INTO blobs (hash, data, size, first_seen) VALUES (?, ?, ?, ?)",
+                        (digest, data, len(data), now)
+                    )
+                    if cursor.rowcount:
+                        stored += len(data)
+                    else:
+                        known += 1  # Already archived by an earlier session
+                self.writer.executemany(
+                    "INSERT INTO shots (session, number, hash, created) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (session, number) DO UPDATE SET hash = excluded.hash",
+                    [(self.session, number, digest, now) for number, digest in shots.items()]
+                )
+                self.writer.executemany(
+                    "INSERT INTO shots (session, number, description, created) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (session, number) DO UPDATE SET description = excluded.description",
+                    [(self.session, number, text, now) for number, text in descriptions.items()]
+                )
+        with self.lock:
+            self.bytes_stored += stored
+            self.duplicates += known
+            self.commits += 1
+            self.commit_latencies.append(time.perf_counter() - start)
+            del self.commit_latencies[:-200]
+            for pending, committed in ((self.pending_blobs, blobs), (self.pending_shots, shots), (self.pending_descriptions, descriptions)):
+                for key, value in committed.items():
+                    if pending.get(key) is value:
+                        del pending[key]
+
+    def _lookup(self, number, session, column):
+        session = session or self.session
+        with self.db_lock:
+            if self.closed:
+                return None
+            if column == "data":
+                row = self.reader.execute(
+                    "SELECT blobs.data FROM shots JOIN blobs ON blobs.hash = shots.hash WHERE shots.session = ? AND shots.number = ?",
+                    (session, number)
+                ).fetchone()
+            else:
+                row = self.reader.execute(
+                    "SELECT description FROM shots WHERE session = ? AND number = ?", (session, number)
+                ).fetchone()
+        return row[0] if row else None
+
+    def _blob(self, digest):
+        with self.db_lock:
+            if self.closed:
+                return None
+            row = self.reader.execute("SELECT data FROM blobs WHERE hash = ?", (digest,)).fetchone()
+        return row[0] if row else None
+
+    def image(self, number, session=None):
+        """PNG bytes of a screenshot (this session by default), None if unknown"""
+        if session is None or session == self.session:
+            with self.lock:
+                digest = self.pending_shots.get(number)
+                if digest in self.pending_blobs:
+                    return self.pending_blobs[digest]
+            if digest is not None:
+                # A repeat of an already committed frame: its shots row is still pending, the blob is not
+                return self._blob(digest)
+        return self._lookup(number, session, "data")
+
+    def description(self, number, session=None):
+        """Description of a screenshot (this session by default), None if there is none"""
+        if session is None or session == self.session:
+            with self.lock:
+                if number in self.pending_descriptions:
+                    return self.pending_descriptions[number]
+        return self._lookup(number, session, "description")
+
+    def sessions(self):
+        """(session, started, screenshots) for every archived session, newest first"""
+        with self.db_lock:
+            return self.reader.execute(
+                "SELECT sessions.session, sessions.started, COUNT(shots.number) FROM sessions "
+                "LEFT JOIN shots ON shots.session = sessions.session GROUP BY sessions.session ORDER BY sessions.started DESC"
+            ).fetchall()
+
+    def compact(self):
+        """Apply the retention policy, drop unreferenced frames and shrink the file"""
+        start = time.perf_counter()
+        with self.db_lock:
+            if self.closed:
+                return None
+            db = self.writer
+            sessions = [row[0] for row in db.execute(
+                "SELECT session FROM sessions WHERE session != ? ORDER BY started DESC", (self.session,)
+            )]
+            # Oldest sessions go first: beyond the session limit, then while frames exceed the byte cap
+            expired = sessions[max(self.max_sessions - 1, 0):]
+            sessions = sessions[:len(sessions) - len(expired)]
+            with db:
+                for session in expired:
+                    db.execute("DELETE FROM shots WHERE session = ?", (session,))
+                    db.execute("DELETE FROM sessions WHERE session = ?", (session,))
+                db.execute("DELETE FROM blobs WHERE hash NOT IN (SELECT hash FROM shots WHERE hash IS NOT NULL)")
+                while sessions and (db.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0] > self.max_bytes):
+                    session = sessions.pop()
+                    expired.append(session)
+                    db.execute("DELETE FROM shots WHERE session = ?", (session,))
+                    db.execute("DELETE FROM sessions WHERE session = ?", (session,))
+                    db.execute("DELETE FROM blobs WHERE hash NOT IN (SELECT hash FROM shots WHERE hash IS NOT NULL)")
+            freed = db.execute("PRAGMA freelist_count").fetchone()[0] * db.execute("PRAGMA page_size").fetchone()[0]
+            db.execute("PRAGMA incremental_vacuum")
+            db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        result = {"expired_sessions": len(expired), "freed_bytes": freed, "ms": (time.perf_counter() - start) * 1000}
+        self.compactions.append(result)
+        return result
+
+    def stats(self):
+        with self.lock:
+            latencies = list(self.commit_latencies)
+            stats = {
+                "session": self.session,
+                "frames": self.frames,
+                "duplicates": self.duplicates,
+                "dedup_ratio": self.duplicates / self.frames if self.frames else 0.0,
+                "bytes_in": self.bytes_in,
+                "bytes_stored": self.bytes_stored,
+                "pending_frames": len(self.pending_shots),
+                "commits": self.commits,
+                "commit_ms_mean": (sum(latencies) / len(latencies) * 1000) if latencies else 0.0,
+                "compactions": list(self.compactions)
+            }
+        try:
+            stats["file_bytes"] = os.path.getsize(self.path)
+        except OSError:
+            stats["file_bytes"] = 0
+        return stats
+
+    def close(self):
+        """Commit anything still pending and close both connections"""
+        if self.closed:
+            return
+        self.commit()
+        with self.db_lock:
+            self.closed = True
+            self.reader.close()
+            self.writer.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self.writer.close()
+
+
+class AsyncGrokClient:
+    """Asyncio-native xAI client (aiohttp) so several requests can be in flight at once"""
+
+    def __init__(self, api_key, base_url=XAI_API_BASE_URL, pool_size=4, default_timeout=120):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip('/')
+        self.pool_size = pool_size
+        self.default_timeout = default_timeout
+        self.session = None
+
+        self.request_count = 0
+        self.error_count = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    @property
+    def chat_completions_url(self):
+        return f"{self.base_url}/chat/completions"
+
+    async def _get_session(self):
+        """Create the aiohttp session lazily (it must be created inside a running loop)"""
+        if self.session is None or self.session.closed:
+            import aiohttp
+
+            connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60)
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                headers={
+                    "Authorization": f"Bearer {self.api_key}",
+                    "Content-Type": "application/json"
+                }
+            )
+        return self.session
+
+    async def post_chat(self, payload, timeout=None):
+        """POST a chat completions payload, returns (status_code, body, headers)
+
+        body is the decoded JSON on HTTP 200 and the raw text otherwise.
+        Raises asyncio.TimeoutError / aiohttp.ClientError like requests would raise its own errors.
+        """
+        import aiohttp
+
+        session = await self._get_session()
+        self.request_count += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            async with session.post(
+                self.chat_completions_url,
+                json=payload,
+                timeout=aiohttp.ClientTimeout(total=timeout or self.default_timeout)
+            ) as response:
+                if response.status == 200:
+                    body = await response.json(content_type=None)
+                else:
+                    body = await response.text()
+                return response.status, body, dict(response.headers)
+        except (asyncio.TimeoutError, aiohttp.ClientError):
+            self.error_count += 1
+            raise
+        finally:
+            self.in_flight -= 1
+
+    async def close(self):
+        """Close the aiohttp session"""
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+
+
+GAME_BUTTONS = ["A", "B", "START", "SELECT", "UP", "DOWN", "LEFT", "RIGHT", "L", "R"]
+TOOL_NAMES = ["analyze_with_vision", "take_screenshot", "recall_screenshot", "cleanup_memory"]
+
+_MEMORY_UPDATES_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "add": {"type": "array", "items": {"type": "string"}},
+        "remove": {"type": "array", "items": {"type": "integer"}},
+        "update": {"anyOf": [
+            {"type": "object", "properties": {"index": {"type": "integer"}, "content": {"type": "string"}}, "required": ["index", "content"], "additionalProperties": False},
+            {"type": "null"}
+        ]}
+    },
+    "required": ["add", "remove", "update"],
+    "additionalProperties": False
+}
+_TOOL_CALLS_SCHEMA = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {"tool": {"type": "string", "enum": TOOL_NAMES}, "number": {"type": ["integer", "null"]}},
+        "required": ["tool", "number"],
+        "additionalProperties": False
+    }
+}
+
+# JSON schemas sent as response_format per call type ("actions" first so streamed decisions close it early)
+RESPONSE_SCHEMAS = {
+    "Gameplay Decision": {
+        "type": "object",
+        "properties": {
+            "actions": {"type": "array", "items": {"type": "string", "enum": GAME_BUTTONS}, "minItems": 1},
+            "reasoning": {"type": "string"},
+            "memory_updates": _MEMORY_UPDATES_SCHEMA
+        },
+        "required": ["actions", "reasoning", "memory_updates"],
+        "additionalProperties": False
+    },
+    "Fused Decision": {
+        "type": "object",
+        "properties": {
+            "actions": {"type": "array", "items": {"type": "string", "enum": GAME_BUTTONS}, "minItems": 1},
+            "image_description": {"type": "string"},
+            "reasoning": {"type": "string"},
+            "memory_updates": _MEMORY_UPDATES_SCHEMA,
+            "tool_calls": _TOOL_CALLS_SCHEMA
+        },
+        "required": ["actions", "image_description", "reasoning", "memory_updates", "tool_calls"],
+        "additionalProperties": False
+    },
+    "Tool Selection": {
+        "type": "object",
+        "properties": {"tool_calls": _TOOL_CALLS_SCHEMA, "reasoning": {"type": "string"}},
+        "required": ["tool_calls", "reasoning"],
+        "additionalProperties": False
+    },
+    "Memory Cleanup": {
+        "type": "object",
+        "properties": {
+            "cleaned_memory": {"type": "array", "items": {"type": "string"}},
+            "cleanup_notes": {"type": "string"},
+            "issues_detected": {"type": "array", "items": {"type": "string"}}
+        },
+        "required": ["cleaned_memory", "cleanup_notes", "issues_detected"],
+        "additionalProperties": False
+    }
+}
+
+
+def _expect(condition, message):
+    if not condition:
+        raise ValueError(message)
+
+
+def _tool_calls_from(data):
+    calls = data.get("tool_calls") or []
+    _expect(isinstance(calls, list), "tool_calls must be a list")
+    for call in calls:
+        _expect(isinstance(call, dict) and call.get("tool") in TOOL_NAMES, f"unknown tool call {call!r}")
+    return [{k: v for k, v in call.items() if v is not None} for call in calls]
+
+
+@dataclass
+class GameDecision:
+    """Validated gameplay or fused decision"""
+    actions: list
+    reasoning: str
+    memory_updates: dict = field(default_factory=dict)
+    image_description: str = None
+    tool_calls: list = field(default_factory=list)
+
+    @classmethod
+    def from_dict(cls, data):
+        _expect(isinstance(data, dict), "decision must be a JSON object")
+        actions = data.get("actions")
+        _expect(isinstance(actions, list) and actions, "actions must be a non-empty list")
+        actions = [str(action).upper() for action in actions]
+        _expect(all(action in GAME_BUTTONS for action in actions), f"invalid actions {actions}")
+        _expect(isinstance(data.get("reasoning", ""), str), "reasoning must be a string")
+
+        updates = data.get("memory_updates") or {}
+        _expect(isinstance(updates, dict), "memory_updates must be an object")
+        updates = {key: value for key, value in updates.items() if value is not None}
+        _expect(all(isinstance(i, int) for i in updates.get("remove", [])), "memory_updates.remove must be integers")
+
+        return cls(
+            actions=actions,
+            reasoning=data.get("reasoning", ""),
+            memory_updates=updates,
+            image_description=data.get("image_description"),
+            tool_calls=_tool_calls_from(data)
+        )
+
+    def as_dict(self):
+        decision = asdict(self)
+        if decision["image_description"] is None:
+            del decision["image_description"]
+        return decision
+
+
+@dataclass
+class ToolSelection:
+    """Validated tool selection"""
+    tool_calls: list
+    reasoning: str
+
+    @classmethod
+    def from_dict(cls, data):
+        _expect(isinstance(data, dict), "tool selection must be a JSON object")
+        return cls(tool_calls=_tool_calls_from(data), reasoning=str(data.get("reasoning", "")))
+
+    def as_dict(self):
+        return asdict(self)
+
+
+@dataclass
+class MemoryCleanupResult:
+    """Validated memory cleanup"""
+    cleaned_memory: list
+    cleanup_notes: str = ""
+    issues_detected: list = field(default_factory=list)
+
+    @classmethod
+    def from_dict(cls, data):
+        _expect(isinstance(data, dict), "cleanup must be a JSON object")
+        memory = data.get("cleaned_memory")
+        _expect(isinstance(memory, list) and memory and all(isinstance(m, str) for m in memory), "cleaned_memory must be a non-empty list of strings")
+        return cls(cleaned_memory=memory, cleanup_notes=str(data.get("cleanup_notes", "")), issues_detected=list(data.get("issues_detected") or []))
+
+    def as_dict(self):
+        return asdict(self)
+
+
+# Native function-calling tools for the "tools" loop mode; press_buttons ends the turn with the decision
+_PRESS_BUTTONS_PARAMETERS = {
+    "type": "object",
+    "properties": {k: v for k, v in RESPONSE_SCHEMAS["Fused Decision"]["properties"].items() if k != "tool_calls"},
+    "required": ["actions", "image_description", "reasoning", "memory_updates"],
+    "additionalProperties": False
+}
+GAME_TOOLS = [
+    {"type": "function", "function": {
+        "name": "analyze_with_vision",
+        "description": "See the current game screen. The screenshot is attached to the conversation right after the tool result.",
+        "parameters": {"type": "object", "properties": {}, "additionalProperties": False}
+    }},
+    {"type": "function", "function": {
+        "name": "take_screenshot",
+        "description": "See the current game screen and also save it as a numbered screenshot you can recall later.",
+        "parameters": {"type": "object", "properties": {}, "additionalProperties": False}
+    }},
+    {"type": "function", "function": {
+        "name": "recall_screenshot",
+        "description": "Read the saved description of an earlier screenshot.",
+        "parameters": {"type": "object", "properties": {"number": {"type": "integer"}}, "required": ["number"], "additionalProperties": False}
+    }},
+    {"type": "function", "function": {
+        "name": "cleanup_memory",
+        "description": "Summarize and deduplicate the memory log (use when it is repetitive or contradictory).",
+        "parameters": {"type": "object", "properties": {}, "additionalProperties": False}
+    }},
+    {"type": "function", "function": {
+        "name": "press_buttons",
+        "description": "Final step of every turn: press a batch of buttons and record memory updates.",
+        "parameters": _PRESS_BUTTONS_PARAMETERS,
+        "strict": True
+    }}
+]
+
+STRUCTURED_TYPES = {
+    "Gameplay Decision": GameDecision,
+    "Fused Decision": GameDecision,
+    "Tool Loop": GameDecision,
+    "Tool Selection": ToolSelection,
+    "Memory Cleanup": MemoryCleanupResult
+}
+
+
 class PokemonAIPlayer:
-    def __init__(self):
+    def __init__(self, api_base_url=None):
         self.driver = None
         self.api_key = os.getenv('XAI_API_KEY')
         self.memory_file = "memory.txt"
         self.frame_count = 0
         self.screenshot_count = 0
+        
+        # Fail before any writer thread, atexit hook or archive connection exists
+        if not self.api_key:
+            raise ValueError("❌ XAI_API_KEY not found in environment variables")
+        
+        # SPEED OPTIMIZATION: Recent screenshots (and their vision encodings) stay in memory; all files are written in the background
+        self.frame_store = FrameStore(capacity=int(os.getenv('GROK_FRAME_STORE_SIZE', '32')))
+        self.persistence = PersistenceWriter(
+            max_queue=int(os.getenv('GROK_PERSIST_QUEUE', '1024')),
+            fsync=os.getenv('GROK_PERSIST_FSYNC', '1') == '1'
+        )
         self.screenshots_folder = "screenshots"
         
         # Ensure screenshots folder exists
         os.makedirs(self.screenshots_folder, exist_ok=True)
         
+        # Screenshots and descriptions go into a deduplicated archive indexed by session and number (GROK_SCREENSHOT_ARCHIVE=0 keeps per-file PNG/TXT)
+        self.screenshot_archive = None
+        if os.getenv('GROK_SCREENSHOT_ARCHIVE', '1') == '1':
+            try:
+                self.screenshot_archive = ScreenshotArchive(
+                    os.path.join(self.screenshots_folder, "archive.sqlite"),
+                    max_sessions=int(os.getenv('GROK_ARCHIVE_SESSIONS', '20')),
+                    max_bytes=int(float(os.getenv('GROK_ARCHIVE_MAX_MB', '512')) * 1024 * 1024)
+                )
+                self.persistence.submit(self.screenshot_archive.compact)
+            except Exception as e:
+                print(f"⚠️ Screenshot archive unavailable, writing screenshot files instead: {e}")
+        
         # Game controls mapping (synchronized with JavaScript keyMappings)
         self.controls = {
             'A': 'z',           # KeyZ, keyCode: 90
@@ -48,9 +2223,156 @@ class PokemonAIPlayer:
             'R': 's'            # KeyS, keyCode: 83
         }
         
-        if not self.api_key:
-            raise ValueError("❌ XAI_API_KEY not found in environment variables")
+        # SPEED OPTIMIZATION: One pooled keep-alive client for every xAI call (no per-call handshakes)
+        self.http_pool_size = int(os.getenv('XAI_HTTP_POOL_SIZE', '4'))
+        # Base URL is overridable so the loop can run against xai_stub_server.py offline
+        self.api_base_url = api_base_url or os.getenv('XAI_API_BASE_URL', XAI_API_BASE_URL)
+        self.http_client = GrokHTTPClient(self.api_key, base_url=self.api_base_url, pool_size=self.http_pool_size)
+        
+        # Async loop variant: aiohttp client + single Selenium worker (WebDriver is not thread-safe)
+        self.async_client = None
+        self.selenium_executor = None
+        self.loop_mode = os.getenv('GROK_LOOP_MODE', 'classic').lower()
+        
+        # Streaming decisions: start typing the actions array while reasoning is still streaming in
+        self.stream_decisions = os.getenv('GROK_STREAM_DECISIONS', '0') == '1'
+        self.early_action_thread = None
+        
+        # SPEED OPTIMIZATION: Rolling decision context - stable cached prefix, only deltas per turn
+        self.session_context = os.getenv('GROK_SESSION_CONTEXT', '1') == '1'
+        self.session_token_budget = int(os.getenv('GROK_SESSION_TOKEN_BUDGET', '24000'))
+        self.sessions = {}
+        
+        # Tools mode: native function-calling rounds allowed before press_buttons is forced
+        self.tool_loop_max_rounds = int(os.getenv('GROK_TOOL_LOOP_ROUNDS', '4'))
+        self.tool_loop_screenshot = None
+        
+        # Fused mode: results of follow-up tools requested last frame, sent with the next screenshot
+        self.pending_tool_results = []
+        
+        # SPEED OPTIMIZATION: Read the canvas pixels in the page instead of cropping a full-page screenshot
+        self.capture_backend = os.getenv('GROK_CAPTURE_BACKEND', 'canvas')
+        self.canvas_capture_failures = 0
+        
+        # DevTools: event connection (resize notifications, screencast), cached canvas geometry, screencast ring buffer
+        self.cached_canvas_geometry = None
+        self.devtools = None
+        self.devtools_unavailable = False
+        self.geometry_binding = False
+        self.screencast = None
+        self.screencast_crop = None  # (frame received time, cropped PNG) of the newest frame
+        self.screencast_capacity = int(os.getenv('GROK_SCREENCAST_FRAMES', '8'))
+        self.screencast_format = os.getenv('GROK_SCREENCAST_FORMAT', 'png')
+        
+        # SPEED OPTIMIZATION: Capture + perceive the next frame while the current batch finishes typing
+        self.speculative_perception = os.getenv('GROK_SPECULATIVE', '1') == '1'
+        self.speculation_tolerance = int(os.getenv('GROK_SPECULATION_TOLERANCE', '4'))
+        self.speculation = None
+        self.speculation_executor = None
+        self.speculation_stats = {"started": 0, "used": 0, "discarded": 0}
+        
+        # SPEED OPTIMIZATION: Native-resolution, palette-quantized vision frames instead of upscaled full-colour PNGs
+        self.vision_encoder = None
+        if os.getenv('GROK_VISION_ENCODER', '1') == '1':
+            self.vision_encoder = VisionFrameEncoder(
+                scale=int(os.getenv('GROK_VISION_SCALE', '2')),
+                max_colors=int(os.getenv('GROK_VISION_COLORS', '64')),
+                formats=tuple(os.getenv('GROK_VISION_FORMATS', 'png').split(','))
+            )
+        
+        # SPEED OPTIMIZATION: Repeat decisions on unchanged screens, let animations settle, detect stuck states
+        self.frame_differ = None
+        if os.getenv('GROK_FRAME_DIFF', '1') == '1':
+            self.frame_differ = FrameDiffer(
+                static_ratio=float(os.getenv('GROK_FRAME_STATIC_RATIO', '0.002')),
+                changed_ratio=float(os.getenv('GROK_FRAME_CHANGED_RATIO', '0.10'))
+            )
+        self.stuck_frames = int(os.getenv('GROK_STUCK_FRAMES', '3'))
+        self.settle_checks = int(os.getenv('GROK_SETTLE_CHECKS', '3'))
+        self.decided_frame = None  # Decoded frame the last decision was made on
+        self.last_decision = None
+        self.static_streak = 0
+        self.frame_gate_stats = {"repeated": 0, "deferred": 0, "stuck": 0}
+        
+        # SPEED OPTIMIZATION: Label each frame (battle/dialogue/menu/title/field) locally for routing and prompt hints
+        self.scene_classifier = SceneClassifier() if os.getenv('GROK_SCENE_CLASSIFIER', '1') == '1' else None
+        self.scene_label = None
+        self.turn_notes = []  # Scene, autopilot and stuck hints for this cycle's decision prompt (never stored in memory)
+        
+        # SPEED OPTIMIZATION: Plain text boxes are advanced locally with A until the box closes or a choice appears
+        self.dialogue_autopilot = self.scene_classifier is not None and os.getenv('GROK_DIALOGUE_AUTOPILOT', '1') == '1'
+        self.autopilot_max_presses = int(os.getenv('GROK_AUTOPILOT_MAX_PRESSES', '30'))
+        self.autopilot_delay = float(os.getenv('GROK_AUTOPILOT_DELAY', '0.4'))
+        self.autopilot_blocked = False  # A stopped advancing this text box - leave it to the model
+        self.autopilot_note = None  # What the autopilot did, for the next decision prompt
+        self.autopilot_stats = {"runs": 0, "presses": 0, "pages": 0, "seconds": 0.0, "handbacks": {}}
+        self.llm_cycle_stats = {"cycles": 0, "seconds": 0.0, "actions": 0}  # Decisions that went to the model, for savings estimates
+        
+        # SPEED OPTIMIZATION: Reuse decisions for screens we have already seen (dialogue, title, counters)
+        self.decision_cache = None
+        if os.getenv('GROK_DECISION_CACHE', '1') == '1':
+            self.decision_cache = DecisionCache(
+                max_entries=int(os.getenv('GROK_DECISION_CACHE_SIZE', '256')),
+                ttl=float(os.getenv('GROK_DECISION_CACHE_TTL', '300')),
+                tolerance=int(os.getenv('GROK_DECISION_CACHE_TOLERANCE', '4'))
+            )
+
+        # SPEED OPTIMIZATION: Small/fast model for dialogue and menus, full model for battles and navigation
+        self.model_router = ModelRouter(
+            tiers={
+                "fast": {
+                    "model": os.getenv('GROK_FAST_MODEL', 'grok-4-fast-non-reasoning'),
+                    "detail": os.getenv('GROK_FAST_DETAIL', 'low'),
+                    "timeout": float(os.getenv('GROK_FAST_TIMEOUT', '30')),
+                    "max_tokens": int(os.getenv('GROK_FAST_MAX_TOKENS', '1500'))
+                },
+                "full": {
+                    "model": os.getenv('GROK_FULL_MODEL', 'grok-4'),
+                    "detail": os.getenv('GROK_FULL_DETAIL', 'high'),
+                    "timeout": float(os.getenv('GROK_FULL_TIMEOUT')) if os.getenv('GROK_FULL_TIMEOUT') else None,
+                    "max_tokens": int(os.getenv('GROK_FULL_MAX_TOKENS', '32000'))
+                }
+            },
+            enabled=os.getenv('GROK_ROUTER', '1') == '1',
+            max_fast_streak=int(os.getenv('GROK_ROUTER_MAX_FAST_STREAK', '8'))
+        )
+
+        # SPEED OPTIMIZATION: Token budgets and timeouts sized from observed responses, not worst-case constants
+        self.budgets = None
+        if os.getenv('GROK_ADAPTIVE_BUDGETS', '1') == '1':
+            self.budgets = AdaptiveBudgets(
+                token_headroom=float(os.getenv('GROK_TOKEN_HEADROOM', '1.5')),
+                timeout_factor=float(os.getenv('GROK_TIMEOUT_FACTOR', '2.0'))
+            )
+
+        # One token bucket + circuit breaker for every call site: honour server hints, fail fast when degraded
+        self.rate_limiter = RateLimiter(
+            rate=float(os.getenv('GROK_RATE_LIMIT_RPS', '2')),
+            burst=int(os.getenv('GROK_RATE_LIMIT_BURST', '4'))
+        )
+        self.circuit_breaker = CircuitBreaker(
+            failure_threshold=int(os.getenv('GROK_BREAKER_THRESHOLD', '3')),
+            cooldown=float(os.getenv('GROK_BREAKER_COOLDOWN', '30')),
+            on_transition=self.on_circuit_transition
+        )
+        self.metrics_file = os.getenv('GROK_METRICS_FILE', 'api_metrics.json')
         
+        # Token / byte / latency accounting for every call (optionally logged per call to GROK_CALL_LOG)
+        self.call_ledger = CallLedger(log_path=os.getenv('GROK_CALL_LOG') or None, sink=self.persistence.append)
+        
+        # SPEED OPTIMIZATION: Schema-constrained responses parse with one json.loads (no regex recovery)
+        self.structured_output = os.getenv('GROK_STRUCTURED_OUTPUT', '1') == '1'
+        self.parse_stats = {}  # function_name -> {"responses": n, "failures": n}
+        
+        # SPEED OPTIMIZATION: Optional hedging - duplicate a request stuck past its usual latency
+        self.hedger = None
+        self.hedge_executor = None
+        if os.getenv('GROK_HEDGE', '0') == '1':
+            self.hedger = RequestHedger(
+                percentile=float(os.getenv('GROK_HEDGE_PERCENTILE', '0.9')),
+                budget=float(os.getenv('GROK_HEDGE_BUDGET', '0.1'))
+            )
+
         print("🎮 Advanced Pokemon Fire Red AI Player with Grok-4")
         print("=" * 56)
         print(f"🔑 Using API key: {self.api_key[:10]}...{self.api_key[-4:]}")
@@ -63,11 +2385,12 @@ class PokemonAIPlayer:
     def load_memory(self):
         """Load AI memory from file"""
         try:
-            if os.path.exists(self.memory_file):
+            memory = self.persistence.pending(self.memory_file)
+            if memory is None and os.path.exists(self.memory_file):
                 with open(self.memory_file, 'r') as f:
-                    memory = f.read().strip()
-                    if memory:
-                        return memory.split('\n')
+                    memory = f.read()
+            if memory and memory.strip():
+                return memory.strip().split('\n')
             return [
                 "GOAL: Complete Pokemon Fire Red - beat Elite 4, become Champion, catch Mewtwo",
                 "CURRENT PROGRESS: Just started - need to get through intro and choose starter",
@@ -80,28 +2403,20 @@ class PokemonAIPlayer:
             return ["Fresh start - beginning Pokemon Fire Red adventure"]
 
     def save_memory(self, memory_list):
-        """Save AI memory to file"""
+        """Save AI memory to file (written in the background)"""
         try:
-            with open(self.memory_file, 'w') as f:
-                f.write('\n'.join(memory_list))
+            self.persistence.write(self.memory_file, '\n'.join(memory_list))
         except Exception as e:
             self.log(f"⚠️ Error saving memory: {e}")
 
-    def cleanup_memory_with_ai(self):
-        """Use AI to clean up, summarize, and reorganize memory"""
-        try:
-            self.log("🧠 Starting intelligent memory cleanup...")
-            
-            memory_list = self.load_memory()
-            if len(memory_list) < 50:  # Only cleanup if there's substantial memory
-                return memory_list
-            
-            # Join all memories for AI analysis
-            current_memory = "\n".join([f"{i+1}. {memory}" for i, memory in enumerate(memory_list)])
-            
-            cleanup_prompt = [{
-                "role": "system", 
-                "content": f"""You are an AI memory management system for a Pokemon Fire Red gameplay session. 
+    def build_memory_cleanup_messages(self, memory_list):
+        """Build the memory cleanup prompt for a memory snapshot"""
+        # Join all memories for AI analysis
+        current_memory = "\n".join([f"{i+1}. {memory}" for i, memory in enumerate(memory_list)])
+        
+        return [{
+            "role": "system", 
+            "content": f"""You are an AI memory management system for a Pokemon Fire Red gameplay session. 
 
 CURRENT MEMORY (320 entries max):
 {current_memory}
@@ -132,34 +2447,49 @@ OUTPUT FORMAT - Return cleaned memory as a JSON list:
 }}
 
 Be thorough but preserve important game state information."""
-            }, {
-                "role": "user",
-                "content": "Please analyze and clean up this Pokemon Fire Red memory log. Focus on removing redundancy while preserving all important game state information."
-            }]
+        }, {
+            "role": "user",
+            "content": "Please analyze and clean up this Pokemon Fire Red memory log. Focus on removing redundancy while preserving all important game state information."
+        }]
+
+    def finalize_memory_cleanup(self, content, memory_list):
+        """Turn a memory cleanup response into the cleaned memory list (or the original on failure)"""
+        if content:
+            cleanup_result = self.parse_structured_response(content, "Memory Cleanup", "")
+            
+            if "cleaned_memory" in cleanup_result:
+                cleaned_memory = cleanup_result["cleaned_memory"]
+                self.log(f"✅ Memory cleanup successful: {len(memory_list)} → {len(cleaned_memory)} entries")
+                
+                if "cleanup_notes" in cleanup_result:
+                    self.log(f"📝 Cleanup notes: {cleanup_result['cleanup_notes']}")
+                
+                if "issues_detected" in cleanup_result and cleanup_result["issues_detected"]:
+                    self.log(f"⚠️ Issues detected: {', '.join(cleanup_result['issues_detected'])}")
+                
+                return cleaned_memory
+            else:
+                self.log("❌ Memory cleanup failed - invalid response format")
+                return memory_list
+        else:
+            self.log("❌ Memory cleanup failed - no response")
+            return memory_list
+
+    def cleanup_memory_with_ai(self):
+        """Use AI to clean up, summarize, and reorganize memory"""
+        try:
+            self.log("🧠 Starting intelligent memory cleanup...")
+            
+            memory_list = self.load_memory()
+            if len(memory_list) < 50:  # Only cleanup if there's substantial memory
+                return memory_list
+            
+            cleanup_prompt = self.build_memory_cleanup_messages(memory_list)
             
             # Use robust API call for memory cleanup
             content = self.robust_api_call(cleanup_prompt, max_tokens=32000, temperature=0.3, function_name="Memory Cleanup")
             
-            if content:
-                cleanup_result = self.parse_json_with_fallback(content, "Memory Cleanup", "")
-                
-                if "cleaned_memory" in cleanup_result:
-                    cleaned_memory = cleanup_result["cleaned_memory"]
-                    self.log(f"✅ Memory cleanup successful: {len(memory_list)} → {len(cleaned_memory)} entries")
-                    
-                    if "cleanup_notes" in cleanup_result:
-                        self.log(f"📝 Cleanup notes: {cleanup_result['cleanup_notes']}")
-                    
-                    if "issues_detected" in cleanup_result and cleanup_result["issues_detected"]:
-                        self.log(f"⚠️ Issues detected: {', '.join(cleanup_result['issues_detected'])}")
-                    
-                    return cleaned_memory
-                else:
-                    self.log("❌ Memory cleanup failed - invalid response format")
-                    return memory_list
-            else:
-                self.log("❌ Memory cleanup failed - no response")
-                return memory_list
+            return self.finalize_memory_cleanup(content, memory_list)
                 
         except Exception as e:
             self.log(f"❌ Memory cleanup error: {e}")
@@ -254,6 +2584,7 @@ Be thorough but preserve important game state information."""
             file_url = f"file://{emulator_path}"
             self.log(f"🌐 Navigating to: {file_url}")
             self.driver.get(file_url)
+            self.cached_canvas_geometry = None  # New document: measure again and reinstall the resize observers
             
             # SPEED OPTIMIZATION: Quick page load verification (no unnecessary waits)
             wait = WebDriverWait(self.driver, 5)  # Reduced from 15 to 5
@@ -407,15 +2738,13 @@ Be thorough but preserve important game state information."""
         """
         try:
             self.screenshot_count += 1
-            filename = f"screenshot_{self.screenshot_count}.png"
-            filepath = os.path.join(self.screenshots_folder, filename)
             
             if game_only:
                 # Try to capture just the game canvas
                 screenshot_data = self.capture_game_canvas()
                 if screenshot_data:
-                    with open(filepath, 'wb') as f:
-                        f.write(screenshot_data)
+                    self.frame_store.put(self.screenshot_count, screenshot_data)
+                    filename = self.persist_screenshot(self.screenshot_count, screenshot_data)
                     self.log(f"📸 Game canvas screenshot saved: {filename}")
                     return self.screenshot_count
                 else:
@@ -424,9 +2753,9 @@ Be thorough but preserve important game state information."""
             # Fallback: Take full browser screenshot
             screenshot = self.driver.get_screenshot_as_png()
             
-            # Save to file
-            with open(filepath, 'wb') as f:
-                f.write(screenshot)
+            # Keep it in memory for the vision path; the file is written in the background
+            self.frame_store.put(self.screenshot_count, screenshot)
+            filename = self.persist_screenshot(self.screenshot_count, screenshot)
             
             self.log(f"📸 {'Full browser' if not game_only else 'Fallback'} screenshot saved: {filename}")
             return self.screenshot_count
@@ -435,51 +2764,292 @@ Be thorough but preserve important game state information."""
             self.log(f"❌ Screenshot failed: {e}")
             return None
 
+    def persist_screenshot(self, screenshot_number, image_bytes):
+        """Queue a screenshot for the archive (or its PNG file) and return a label for logging"""
+        if self.screenshot_archive:
+            digest = self.screenshot_archive.put(screenshot_number, image_bytes)
+            self.persistence.submit(self.screenshot_archive.commit)
+            return f"#{screenshot_number} ({digest[:12]})"
+        filename = f"screenshot_{screenshot_number}.png"
+        self.persistence.write(os.path.join(self.screenshots_folder, filename), image_bytes)
+        return filename
+
     def capture_game_canvas(self):
-        """Capture just the game canvas by cropping the full browser screenshot"""
-        try:
-            self.log("🎮 Capturing game area from browser screenshot...")
-            
-            # First, get the full browser screenshot
-            full_screenshot = self.driver.get_screenshot_as_png()
-            
-            # Get the position and size of the game canvas
-            canvas_info_js = """
+        """Capture just the game canvas as PNG bytes
+
+        Uses the GROK_CAPTURE_BACKEND backend (canvas pixels, DevTools clip or screencast buffer);
+        the cropped browser screenshot is the fallback.
+        """
+        capture = {
+            "canvas": self.capture_canvas_pixels,
+            "cdp": self.capture_cdp_clip,
+            "screencast": self.capture_screencast_frame
+        }.get(self.capture_backend)
+        if capture:
+            frame = capture()
+            if frame:
+                self.canvas_capture_failures = 0
+                return frame
+            
+            self.canvas_capture_failures += 1
+            if self.canvas_capture_failures >= 3:
+                self.log(f"⚠️ {self.capture_backend} capture failed 3 times in a row - switching to cropped browser screenshots")
+                self.capture_backend = "crop"
+            else:
+                self.log(f"⚠️ {self.capture_backend} capture failed, falling back to cropped browser screenshot")
+        return self.capture_canvas_crop()
+
+    def capture_canvas_pixels(self):
+        """Read the game canvas pixels in the page and return them as PNG bytes (one WebDriver round trip)
+
+        The canvas is drawn onto a reusable offscreen 2D canvas and encoded there, so no full-page
+        screenshot is taken or decoded. A WebGL canvas only keeps its drawing buffer until the frame is
+        composited, so the copy is made in an animation frame callback (queued after the emulator's own).
+        """
+        canvas_pixels_js = """
+        const done = arguments[arguments.length - 1];
+        const canvas = document.querySelector('#game canvas');
+        if (!canvas || !canvas.width || !canvas.height) { done({ error: 'No canvas found' }); return; }
+        
+        let finished = false;
+        const grab = () => {
+            if (finished) return;
+            finished = true;
             try {
-                const gameDiv = document.getElementById('game');
-                if (!gameDiv) return { error: 'No game div found' };
-                
-                const canvas = gameDiv.querySelector('canvas');
-                if (!canvas) return { error: 'No canvas found' };
-                
-                // Get the canvas position and size relative to the viewport
-                const rect = canvas.getBoundingClientRect();
-                const scrollX = window.pageXOffset || document.documentElement.scrollLeft;
-                const scrollY = window.pageYOffset || document.documentElement.scrollTop;
+                const capture = window.__grokCapture || (window.__grokCapture = document.createElement('canvas'));
+                if (capture.width !== canvas.width || capture.height !== canvas.height) {
+                    capture.width = canvas.width;
+                    capture.height = canvas.height;
+                }
+                const context = capture.getContext('2d', { willReadFrequently: true });
+                context.drawImage(canvas, 0, 0);
                 
-                return {
-                    success: true,
-                    x: Math.round(rect.left + scrollX),
-                    y: Math.round(rect.top + scrollY),
-                    width: Math.round(rect.width),
-                    height: Math.round(rect.height),
-                    viewportWidth: window.innerWidth,
-                    viewportHeight: window.innerHeight,
-                    devicePixelRatio: window.devicePixelRatio || 1
-                };
+                // Game frames are opaque - a transparent centre means the drawing buffer was already cleared
+                const centre = context.getImageData(capture.width >> 1, capture.height >> 1, 1, 1).data;
+                if (centre[3] === 0) { done({ error: 'Drawing buffer not readable (blank frame)' }); return; }
                 
+                done({ success: true, png: capture.toDataURL('image/png').split(',')[1] });
             } catch (error) {
-                return { error: error.message };
+                done({ error: error.message });
             }
-            """
+        };
+        requestAnimationFrame(grab);
+        setTimeout(grab, 250);  // Background tabs may never fire animation frames
+        """
+        try:
+            result = self.driver.execute_async_script(canvas_pixels_js)
+            if not isinstance(result, dict) or not result.get('success'):
+                error = result.get('error') if isinstance(result, dict) else result
+                self.log(f"❌ Direct canvas capture failed: {error}")
+                return None
+            return base64.b64decode(result['png'])
+        except Exception as e:
+            self.log(f"❌ Direct canvas capture error: {e}")
+            return None
+
+    def canvas_geometry(self):
+        """Game canvas rectangle, measured once and cached until the page reports a resize
+
+        The cache is only kept when the page can notify us (DevTools binding); otherwise the
+        canvas is re-measured on every capture as before.
+        """
+        geometry = self.cached_canvas_geometry
+        if geometry is None:
+            watching = self.watch_canvas_geometry()
+            geometry = self.measure_canvas_geometry()
+            if geometry and watching:
+                self.cached_canvas_geometry = geometry
+        return geometry
+
+    def measure_canvas_geometry(self):
+        """Measure the game canvas position/size (CSS pixels) and install the in-page resize observers"""
+        canvas_info_js = """
+        try {
+            const gameDiv = document.getElementById('game');
+            if (!gameDiv) return { error: 'No game div found' };
+            
+            const canvas = gameDiv.querySelector('canvas');
+            if (!canvas) return { error: 'No canvas found' };
+            
+            // Report anything that moves or resizes the canvas through the DevTools binding
+            const notify = (reason) => { if (window.grokGeometryChanged) window.grokGeometryChanged(reason); };
+            if (!window.__grokGeometryWatch) {
+                window.__grokGeometryWatch = true;
+                window.addEventListener('resize', () => notify('window resize'));
+                window.addEventListener('scroll', () => notify('scroll'), { passive: true });
+                document.addEventListener('fullscreenchange', () => notify('fullscreen change'));
+            }
+            if (!canvas.__grokGeometryWatch) {
+                canvas.__grokGeometryWatch = true;
+                let observed = false;  // ResizeObserver fires once on observe()
+                new ResizeObserver(() => { if (observed) notify('canvas resize'); observed = true; }).observe(canvas);
+            }
+            
+            // Get the canvas position and size relative to the viewport
+            const rect = canvas.getBoundingClientRect();
+            const scrollX = window.pageXOffset || document.documentElement.scrollLeft;
+            const scrollY = window.pageYOffset || document.documentElement.scrollTop;
             
-            canvas_info = self.driver.execute_script(canvas_info_js)
+            return {
+                success: true,
+                x: Math.round(rect.left + scrollX),
+                y: Math.round(rect.top + scrollY),
+                viewportX: Math.round(rect.left),
+                viewportY: Math.round(rect.top),
+                width: Math.round(rect.width),
+                height: Math.round(rect.height),
+                viewportWidth: window.innerWidth,
+                viewportHeight: window.innerHeight,
+                devicePixelRatio: window.devicePixelRatio || 1
+            };
+            
+        } catch (error) {
+            return { error: error.message };
+        }
+        """
+        
+        canvas_info = self.driver.execute_script(canvas_info_js)
+        
+        if isinstance(canvas_info, dict) and canvas_info.get('error'):
+            self.log(f"❌ Canvas position detection failed: {canvas_info['error']}")
+            return None
+        elif not isinstance(canvas_info, dict) or not canvas_info.get('success'):
+            self.log(f"❌ Unexpected canvas info result: {canvas_info}")
+            return None
+        
+        self.log(f"📐 Canvas detected at ({canvas_info['x']}, {canvas_info['y']}) size {canvas_info['width']}x{canvas_info['height']}, pixel ratio: {canvas_info['devicePixelRatio']}")
+        
+        # Validate canvas dimensions
+        if canvas_info['width'] < 100 or canvas_info['height'] < 100:
+            self.log(f"⚠️ Canvas too small: {canvas_info['width']}x{canvas_info['height']}")
+            return None
+        return canvas_info
+
+    def watch_canvas_geometry(self):
+        """Expose the grokGeometryChanged binding to the page; True if resize notifications can reach us"""
+        if self.geometry_binding:
+            return True
+        devtools = self.devtools_connection()
+        if devtools is None:
+            return False
+        try:
+            devtools.on("Runtime.bindingCalled", self.on_page_binding)
+            devtools.send("Runtime.addBinding", {"name": "grokGeometryChanged"})
+            self.geometry_binding = True
+        except Exception as e:
+            self.log(f"⚠️ Canvas geometry binding failed: {e}")
+        return self.geometry_binding
+
+    def on_page_binding(self, params):
+        """DevTools reader thread: a page script called one of our bindings"""
+        if params.get("name") == "grokGeometryChanged" and self.cached_canvas_geometry is not None:
+            self.cached_canvas_geometry = None
+            self.log(f"📐 Canvas geometry invalidated ({params.get('payload')})")
+
+    def devtools_connection(self):
+        """Shared event-receiving DevTools connection to the page (None if the browser does not offer one)"""
+        if self.devtools is not None and self.devtools.running:
+            return self.devtools
+        if self.devtools_unavailable:
+            return None
+        try:
+            websocket_url = DevToolsConnection.page_websocket_url(self.driver)
+            if not websocket_url:
+                raise RuntimeError("no DevTools address for this browser")
+            self.devtools = DevToolsConnection(websocket_url).start()
+            self.geometry_binding = False  # Bindings belong to the connection that added them
+            return self.devtools
+        except Exception as e:
+            self.log(f"⚠️ DevTools connection unavailable ({e}) - canvas geometry is re-measured every capture")
+            self.devtools_unavailable = True
+            return None
+
+    def close_devtools(self):
+        self.stop_screencast()
+        if self.devtools is not None:
+            self.devtools.close()
+            self.devtools = None
+
+    def capture_cdp_clip(self):
+        """Capture the game canvas with DevTools Page.captureScreenshot clipped to its rectangle (one round trip)"""
+        try:
+            clip = self.canvas_geometry()
+            if not clip:
+                return None
+            result = self.driver.execute_cdp_cmd('Page.captureScreenshot', {
+                "format": "png",
+                "fromSurface": True,
+                "clip": {"x": clip['x'], "y": clip['y'], "width": clip['width'], "height": clip['height'], "scale": 1}
+            })
+            return base64.b64decode(result['data'])
+        except Exception as e:
+            self.cached_canvas_geometry = None  # Re-measure next time in case the layout moved
+            self.log(f"❌ DevTools clipped capture error: {e}")
+            return None
+
+    def start_screencast(self):
+        """Start streaming page frames into the screencast ring buffer"""
+        try:
+            devtools = self.devtools_connection()
+            if devtools is None:
+                self.log("❌ Screencast unavailable without a DevTools connection")
+                return False
+            self.screencast = ScreencastRecorder(devtools, capacity=self.screencast_capacity, image_format=self.screencast_format).start()
+            self.log(f"🎞️ Screencast started ({self.screencast_capacity}-frame ring buffer, {self.screencast_format})")
+            return True
+        except Exception as e:
+            self.log(f"❌ Screencast start failed: {e}")
+            self.screencast = None
+            return False
+
+    def stop_screencast(self):
+        if self.screencast is not None:
+            self.log(f"🎞️ Screencast stopped after {self.screencast.frame_count} frames")
+            self.screencast.stop()
+            self.screencast = None
+
+    def capture_screencast_frame(self):
+        """Newest screencast frame cropped to the game canvas - no browser round trip once streaming"""
+        try:
+            if (self.screencast is None or not self.screencast.running) and not self.start_screencast():
+                return None
+            latest = self.screencast.latest(wait=1.0)
+            if latest is None:
+                self.log("❌ No screencast frame received yet")
+                return None
             
-            if isinstance(canvas_info, dict) and canvas_info.get('error'):
-                self.log(f"❌ Canvas position detection failed: {canvas_info['error']}")
+            received, image_bytes, metadata = latest
+            clip = self.canvas_geometry()
+            if not clip:
                 return None
-            elif not isinstance(canvas_info, dict) or not canvas_info.get('success'):
-                self.log(f"❌ Unexpected canvas info result: {canvas_info}")
+            if self.screencast_crop and self.screencast_crop[0] == (received, clip['x'], clip['y'], clip['width'], clip['height']):
+                return self.screencast_crop[1]
+            
+            # Frames cover the viewport, scaled from CSS pixels to the frame size
+            image = Image.open(io.BytesIO(image_bytes))
+            scale = image.width / (metadata.get('deviceWidth') or image.width)
+            left, top = int(clip['viewportX'] * scale), int(clip['viewportY'] * scale)
+            game_image = image.crop((left, top, left + int(clip['width'] * scale), top + int(clip['height'] * scale)))
+            
+            buffer = io.BytesIO()
+            game_image.save(buffer, format='PNG')
+            self.screencast_crop = ((received, clip['x'], clip['y'], clip['width'], clip['height']), buffer.getvalue())
+            return self.screencast_crop[1]
+        except Exception as e:
+            self.log(f"❌ Screencast frame error: {e}")
+            return None
+
+    def capture_canvas_crop(self):
+        """Capture just the game canvas by cropping the full browser screenshot"""
+        try:
+            self.log("🎮 Capturing game area from browser screenshot...")
+            
+            # First, get the full browser screenshot
+            full_screenshot = self.driver.get_screenshot_as_png()
+            
+            # Position and size of the game canvas (cached until the page reports a resize)
+            canvas_info = self.canvas_geometry()
+            if not canvas_info:
                 return None
             
             # Extract canvas position and dimensions
@@ -489,13 +3059,6 @@ Be thorough but preserve important game state information."""
             canvas_height = canvas_info['height']
             pixel_ratio = canvas_info['devicePixelRatio']
             
-            self.log(f"📐 Canvas detected at ({canvas_x}, {canvas_y}) size {canvas_width}x{canvas_height}, pixel ratio: {pixel_ratio}")
-            
-            # Validate canvas dimensions
-            if canvas_width < 100 or canvas_height < 100:
-                self.log(f"⚠️ Canvas too small: {canvas_width}x{canvas_height}")
-                return None
-            
             # Use PIL to crop the screenshot
             from PIL import Image
             import io
@@ -543,25 +3106,19 @@ Be thorough but preserve important game state information."""
             return None
     
     def save_screenshot_description(self, screenshot_number, description):
-        """Save screenshot description to .txt file"""
+        """Save screenshot description to the archive (or a .txt file)"""
         try:
             desc_filename = f"screenshot_{screenshot_number}.txt"
             desc_filepath = os.path.join(self.screenshots_folder, desc_filename)
             
-            self.log(f"🔍 DEBUG: Saving to {desc_filepath}")
-            self.log(f"🔍 DEBUG: Description length: {len(description) if description else 0}")
-            self.log(f"🔍 DEBUG: Description preview: {description[:100] if description else 'EMPTY'}...")
-            
-            with open(desc_filepath, 'w', encoding='utf-8') as f:
-                f.write(description or "No description provided")
-            
-            # Verify the file was written
-            if os.path.exists(desc_filepath):
-                with open(desc_filepath, 'r', encoding='utf-8') as f:
-                    saved_content = f.read()
-                    self.log(f"✅ Verified saved content length: {len(saved_content)}")
+            # Written in the background; recall_screenshot reads pending content until it lands
+            if self.screenshot_archive:
+                self.screenshot_archive.describe(screenshot_number, description or "No description provided")
+                self.persistence.submit(self.screenshot_archive.commit)
+            else:
+                self.persistence.write(desc_filepath, description or "No description provided")
             
-            self.log(f"📝 Description saved: {desc_filename}")
+            self.log(f"📝 Description saved: {desc_filename} ({len(description) if description else 0} chars)")
             return True
             
         except Exception as e:
@@ -576,6 +3133,17 @@ Be thorough but preserve important game state information."""
             desc_filename = f"screenshot_{screenshot_number}.txt"
             desc_filepath = os.path.join(self.screenshots_folder, desc_filename)
             
+            if self.screenshot_archive:
+                description = self.screenshot_archive.description(int(screenshot_number))
+                if description is not None:
+                    self.log(f"📖 Retrieved description: #{screenshot_number}")
+                    return description
+            
+            pending = self.persistence.pending(desc_filepath)
+            if pending is not None:
+                self.log(f"📖 Retrieved description: {desc_filename}")
+                return pending
+            
             if os.path.exists(desc_filepath):
                 with open(desc_filepath, 'r', encoding='utf-8') as f:
                     description = f.read()
@@ -600,7 +3168,7 @@ Be thorough but preserve important game state information."""
                 self.log("❌ Failed to capture game canvas for vision analysis")
                 return None
             
-            screenshot_b64 = base64.b64encode(screenshot_data).decode('utf-8')
+            screenshot_b64 = self.encode_frame_for_vision(screenshot_data)
             
             # Load current memory for context
             memory_list = self.load_memory()
@@ -653,7 +3221,7 @@ Be specific about game elements: coordinates, distances, exact button sequences
                         {
                             "type": "image_url",
                             "image_url": {
-                                "url": f"data:image/png;base64,{screenshot_b64}",
+                                "url": image_data_url(screenshot_b64),
                                 "detail": "high"
                             }
                         }
@@ -675,14 +3243,13 @@ Be specific about game elements: coordinates, distances, exact button sequences
             self.log(f"❌ Direct vision analysis error: {e}")
             return None
 
-    def ask_ai_what_to_do(self, memory_list):
-        """Ask AI what tools to use and actions to take"""
-        try:
-            memory_context = "\n".join([f"- {memory}" for memory in memory_list])
-            
-            messages = [{
-                "role": "system",
-                "content": f"""You're playing Pokemon Fire Red. Frame {self.frame_count}.
+    def build_tool_selection_messages(self, memory_list):
+        """Build the tool selection prompt for the current frame"""
+        memory_context = "\n".join([f"- {memory}" for memory in memory_list])
+        
+        return [{
+            "role": "system",
+            "content": f"""You're playing Pokemon Fire Red. Frame {self.frame_count}.
 
 MEMORY: {memory_context}
 
@@ -715,29 +3282,38 @@ STRATEGY:
 - You'll make gameplay decisions AFTER seeing the visual info
 
 Focus: Choose the right tool to get visual information you need."""
-            }, {
-                "role": "user",
-                "content": f"Frame {self.frame_count}: What should you do? Use tools to see the game."
-            }]
+        }, {
+            "role": "user",
+            "content": f"{self.turn_notes_context()}Frame {self.frame_count}: What should you do? Use tools to see the game."
+        }]
+
+    def finalize_tool_selection(self, content):
+        """Turn a tool selection response into a tool decision with defaults filled in"""
+        if content:
+            result = self.parse_structured_response(content, "Tool Selection")
+            
+            # Ensure we always have tool_calls
+            if "tool_calls" not in result:
+                result["tool_calls"] = [{"tool": "analyze_with_vision"}]
+            if "reasoning" not in result:
+                result["reasoning"] = "Default reasoning"
+                
+            return result
+        else:
+            return {
+                "tool_calls": [{"tool": "analyze_with_vision"}],
+                "reasoning": "API failed, taking screenshot"
+            }
+
+    def ask_ai_what_to_do(self, memory_list):
+        """Ask AI what tools to use and actions to take"""
+        try:
+            messages = self.build_tool_selection_messages(memory_list)
             
             # Use robust API call
             content = self.robust_api_call(messages, max_tokens=32000, temperature=0.7, function_name="Tool Selection")
             
-            if content:
-                result = self.parse_json_with_fallback(content, "Tool Selection")
-                
-                # Ensure we always have tool_calls
-                if "tool_calls" not in result:
-                    result["tool_calls"] = [{"tool": "analyze_with_vision"}]
-                if "reasoning" not in result:
-                    result["reasoning"] = "Default reasoning"
-                    
-                return result
-            else:
-                return {
-                    "tool_calls": [{"tool": "analyze_with_vision"}],
-                    "reasoning": "API failed, taking screenshot"
-                }
+            return self.finalize_tool_selection(content)
                 
         except Exception as e:
             self.log(f"❌ AI query error: {e}")
@@ -758,11 +3334,12 @@ Focus: Choose the right tool to get visual information you need."""
                 screenshot_num = self.take_screenshot_tool()  # Uses game_only=True by default
                 if screenshot_num:
                     # Get screenshot and analyze it
-                    screenshot_b64 = self.get_screenshot_base64(screenshot_num)
+                    # Vision payload straight from the in-memory frame (no file re-read, encoded once)
+                    screenshot_b64 = self.get_screenshot_vision_base64(screenshot_num)
                     if screenshot_b64:
                         # Get vision analysis
                         self.log("🧠 Analyzing screenshot with Grok-4 Vision...")
-                        description = self.analyze_screenshot_with_vision(screenshot_b64)
+                        description = self.analyze_screenshot_with_vision(screenshot_b64, optimized=True)
                         # Save description
                         self.save_screenshot_description(screenshot_num, description)
                         results.append(f"Screenshot {screenshot_num}: {description}")
@@ -809,12 +3386,37 @@ Focus: Choose the right tool to get visual information you need."""
         
         return results
     
+    def get_screenshot_vision_base64(self, screenshot_number):
+        """Vision payload (optimized base64) of a screenshot, encoded once from the in-memory frame"""
+        encoded = self.frame_store.derived(
+            screenshot_number, "vision",
+            lambda image_bytes: self.encode_frame_for_vision(image_bytes, self.frame_store.image(screenshot_number))
+        )
+        if encoded is None:
+            image_base64 = self.get_screenshot_base64(screenshot_number)
+            encoded = self.optimize_image_for_vision(image_base64) if image_base64 else None
+        return encoded
+
     def get_screenshot_base64(self, screenshot_number):
-        """Get a previous screenshot by number and return as base64"""
+        """Get a previous screenshot by number and return as base64 (from memory if still held, else from disk)"""
+        image_base64 = self.frame_store.derived(screenshot_number, "base64", lambda image_bytes: base64.b64encode(image_bytes).decode('utf-8'))
+        if image_base64 is not None:
+            return image_base64
+        
         try:
             filename = f"screenshot_{screenshot_number}.png"
             filepath = os.path.join(self.screenshots_folder, filename)
             
+            if self.screenshot_archive:
+                image_data = self.screenshot_archive.image(int(screenshot_number))
+                if image_data is not None:
+                    self.log(f"📷 Retrieved screenshot: #{screenshot_number} from archive")
+                    return base64.b64encode(image_data).decode('utf-8')
+            
+            pending = self.persistence.pending(filepath)
+            if pending is not None:
+                return base64.b64encode(pending).decode('utf-8')
+            
             if os.path.exists(filepath):
                 with open(filepath, 'rb') as f:
                     image_data = f.read()
@@ -856,35 +3458,39 @@ Focus: Choose the right tool to get visual information you need."""
             self.log(f"❌ Canvas screenshot error: {e}")
             return None
 
-    def analyze_screenshot_with_vision(self, image_base64):
+    def build_vision_description_messages(self, image_base64):
+        """Build the short screenshot description prompt"""
+        return [
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": "Describe this Pokemon Fire Red screenshot briefly: what you see, menus, characters, dialog, battles."
+                    },
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": image_data_url(image_base64),
+                            "detail": "high"
+                        }
+                    }
+                ]
+            }
+        ]
+
+    def analyze_screenshot_with_vision(self, image_base64, optimized=False):
         """Analyze a screenshot with Grok-4 Vision and return description"""
         try:
             self.log(f"🔍 Starting vision analysis (image size: {len(image_base64)} chars)")
             
             # Optimize image size if it's too large
-            optimized_image_b64 = self.optimize_image_for_vision(image_base64)
+            optimized_image_b64 = image_base64 if optimized else self.optimize_image_for_vision(image_base64)
             if len(optimized_image_b64) < len(image_base64):
                 self.log(f"📸 Image optimized: {len(image_base64)} -> {len(optimized_image_b64)} chars")
                 image_base64 = optimized_image_b64
             
-            messages = [
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": "Describe this Pokemon Fire Red screenshot briefly: what you see, menus, characters, dialog, battles."
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/png;base64,{image_base64}",
-                                "detail": "high"
-                            }
-                        }
-                    ]
-                }
-            ]
+            messages = self.build_vision_description_messages(image_base64)
             
             # Use robust API call for vision analysis
             content = self.robust_api_call(messages, max_tokens=32000, temperature=0.3, function_name="Vision Analysis")
@@ -901,8 +3507,23 @@ Focus: Choose the right tool to get visual information you need."""
             self.log(f"❌ {error_msg}")
             return error_msg
 
-    def optimize_image_for_vision(self, image_base64):
-        """Optimize image size for vision analysis if needed"""
+    def encode_frame_for_vision(self, image_bytes, image=None):
+        """Encoded frame bytes (plus its decoded image, if at hand) -> optimized base64 for vision calls"""
+        if self.vision_encoder is not None:
+            try:
+                encoded, image_format, info = self.vision_encoder.encode(image_bytes, image)
+                (width, height), (new_width, new_height) = info["original_size"], info["size"]
+                self.log(f"🗜️ Vision frame {width}x{height} -> {new_width}x{new_height}, {info['colors']} colours, {image_format} {info['bytes_out'] / 1024:.1f} KB (was {info['bytes_in'] / 1024:.1f} KB, -{1 - info['bytes_out'] / info['bytes_in']:.0%})")
+                return base64.b64encode(encoded).decode('utf-8')
+            except Exception as e:
+                self.log(f"⚠️ Vision frame encoding failed: {e}, using the original image")
+        return self.optimize_image_for_vision(base64.b64encode(image_bytes).decode('utf-8'), encode=False)
+
+    def optimize_image_for_vision(self, image_base64, encode=True):
+        """Optimize image size for vision analysis (native-resolution palette encoding, or downscaling very large images)"""
+        if encode and self.vision_encoder is not None:
+            return self.encode_frame_for_vision(base64.b64decode(image_base64))
+        
         try:
             # Only optimize if image is very large (>500KB base64)
             if len(image_base64) < 500000:
@@ -910,10 +3531,6 @@ Focus: Choose the right tool to get visual information you need."""
             
             self.log("📸 Optimizing large image for vision analysis...")
             
-            import base64
-            from PIL import Image
-            import io
-            
             # Decode base64 to image
             image_data = base64.b64decode(image_base64)
             image = Image.open(io.BytesIO(image_data))
@@ -997,20 +3614,34 @@ START BUTTON USAGE:
                 }
             ]
             
-            response = requests.post(
-                "https://api.x.ai/v1/chat/completions",
-                headers={
-                    "Authorization": f"Bearer {self.api_key}",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "model": "grok-4",
-                    "messages": messages,
-                    "temperature": 0.7,
-                    "max_tokens": 500  # Increased from 300 to 500
-                },
-                timeout=20
-            )
+            probe = self.admit_call("Simple Decision")
+            if probe is None:
+                return {
+                    "reasoning": "API degraded, trying START",
+                    "actions": ["START"],
+                    "memory_updates": {},
+                    "image_description": vision_description,
+                    "fallback": True
+                }
+            
+            self.rate_limiter.acquire()
+            try:
+                response = self.http_client.post_chat(
+                    self.build_chat_payload(messages, max_tokens=500, temperature=0.7, function_name="Simple Decision"),
+                    timeout=20
+                )
+                self.rate_limiter.observe_response(response.status_code, response.headers)
+                if response.status_code == 200:
+                    self.circuit_breaker.record_success()
+                elif response.status_code >= 500:
+                    self.circuit_breaker.record_failure()
+                else:
+                    self.record_client_error(response.status_code, probe)
+            except requests.exceptions.RequestException:
+                self.circuit_breaker.record_failure()
+                raise
+            finally:
+                self.circuit_breaker.resolve_probe(probe)
             
             if response.status_code == 200:
                 result = response.json()
@@ -1046,35 +3677,9 @@ START BUTTON USAGE:
                 "image_description": vision_description
             }
 
-    def query_grok4_with_vision(self, memory_list, image_base64):
-        """Query Grok-4 with vision capabilities for both image analysis and decision making"""
-        try:
-            # Format memory context
-            memory_context = "//MEMORY//\n" + "\n".join([f"{i+1}. {mem}" for i, mem in enumerate(memory_list)]) + "\n//END MEMORY//\n\n"
-            
-            # Add control hints
-            controls_hint = """//KEYBOARD CONTROLS//
-A Button (z key): Interact/Confirm - Use to talk to NPCs, select menu options, advance dialogue
-B Button (x key): Cancel/Back - Use to go back in menus, cancel actions
-START (Enter): Start/Menu - Opens the main menu, confirms on title screen  
-SELECT (Shift): Select/Options - Special functions, item shortcuts
-Arrow Keys: Move character Up/Down/Left/Right in overworld
-L/R Shoulder (a/s keys): Quick actions, menu shortcuts
-//END CONTROLS//
-
-"""
-            
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
-            
-            payload = {
-                "model": "grok-4",
-                "messages": [
-                    {
-                        "role": "system",
-                        "content": """You are an AI playing Pokemon Fire Red. You can see the game screen and must decide what actions to take.
+    def fused_decision_instructions(self):
+        """Static system prompt of the fused decision call (shared by the stateless prompt and the rolling session)"""
+        return """You are an AI playing Pokemon Fire Red. You can see the game screen and must decide what actions to take.
 
 Respond with JSON containing:
 {
@@ -1140,62 +3745,215 @@ Examples of good memory entries:
 
 REMEMBER: You have MASSIVE memory capacity - use detailed, structured entries!
 🚀 BATCH ACTIONS AGGRESSIVELY: Chain movements and interactions for maximum efficiency with 0.75s delays.
-⚡ SPEED RULE: For intro sequences, tutorials, and repetitive dialogue - BATCH 4-5 A's at once! Don't be cautious!"""
+⚡ SPEED RULE: For intro sequences, tutorials, and repetitive dialogue - BATCH 4-5 A's at once! Don't be cautious!
+
+OPTIONAL FOLLOW-UP TOOLS: You already see the screen, so only add "tool_calls" when you really need more context next frame:
+  "tool_calls": [{"tool": "recall_screenshot", "number": 3}] or [{"tool": "cleanup_memory"}]
+Their results are included with the next screenshot."""
+
+    def controls_hint(self):
+        """Keyboard control hints included with fused decision prompts"""
+        return """//KEYBOARD CONTROLS//
+A Button (z key): Interact/Confirm - Use to talk to NPCs, select menu options, advance dialogue
+B Button (x key): Cancel/Back - Use to go back in menus, cancel actions
+START (Enter): Start/Menu - Opens the main menu, confirms on title screen  
+SELECT (Shift): Select/Options - Special functions, item shortcuts
+Arrow Keys: Move character Up/Down/Left/Right in overworld
+L/R Shoulder (a/s keys): Quick actions, menu shortcuts
+//END CONTROLS//
+
+"""
+
+    def turn_notes_context(self):
+        """This cycle's scene, autopilot and stuck hints as a block for the per-turn user text"""
+        if not self.turn_notes:
+            return ""
+        return "//NOTES FOR THIS TURN//\n" + "\n".join(self.turn_notes) + "\n//END NOTES//\n\n"
+
+    def build_fused_decision_messages(self, memory_list, image_base64, follow_up_results=None):
+        """Build the single-call perceive-and-decide prompt (image description, actions and memory in one response)"""
+        # Format memory context
+        memory_context = "//MEMORY//\n" + "\n".join([f"{i+1}. {mem}" for i, mem in enumerate(memory_list)]) + "\n//END MEMORY//\n\n"
+        
+        # Add control hints
+        controls_hint = self.controls_hint()
+        
+        # Results of tools requested last frame ride along with this screenshot
+        follow_ups = ""
+        if follow_up_results:
+            follow_ups = "//FOLLOW-UP TOOL RESULTS//\n" + "\n".join(follow_up_results) + "\n//END TOOL RESULTS//\n\n"
+        
+        return [
+            {
+                "role": "system",
+                "content": self.fused_decision_instructions()
+            },
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": f"{memory_context}{controls_hint}{follow_ups}{self.turn_notes_context()}Please analyze this Pokemon Fire Red game screenshot and decide what actions to take next."
                     },
                     {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "text",
-                                "text": f"{memory_context}{controls_hint}Please analyze this Pokemon Fire Red game screenshot and decide what actions to take next."
-                            },
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/png;base64,{image_base64}",
-                                    "detail": "high"
-                                }
-                            }
-                        ]
+                        "type": "image_url",
+                        "image_url": {
+                            "url": image_data_url(image_base64),
+                            "detail": "high"
+                        }
                     }
-                ],
-                "max_tokens": 1000,
-                "temperature": 0.3
+                ]
+            }
+        ]
+
+    def finalize_fused_decision(self, content, function_name="Fused Decision"):
+        """Turn a fused perceive-and-decide response (or press_buttons arguments) into a decision with required fields filled in"""
+        if not content:
+            return {
+                "image_description": "API error occurred",
+                "reasoning": "API error, defaulting to A button",
+                "actions": ["A"],
+                "memory_updates": {"add": [], "remove": [], "update": {}},
+                "fallback": True
             }
+        
+        decision = self.parse_structured_response(content, function_name, "A")
+        decision.setdefault("image_description", "Unable to parse image description")
+        decision.setdefault("reasoning", "AI made a decision")
+        decision.setdefault("actions", ["A"])
+        decision.setdefault("memory_updates", {})
+        decision.setdefault("tool_calls", [])
+        return decision
+
+    def build_tool_loop_messages(self, memory_list):
+        """Build the opening messages of a function-calling turn (memory is sent once per turn)"""
+        memory_context = "\n".join([f"{i+1}. {mem}" for i, mem in enumerate(memory_list)])
+        
+        return [{
+            "role": "system",
+            "content": f"""You are an AI playing Pokemon Fire Red. Frame {self.frame_count}.
+
+//MEMORY//
+{memory_context}
+//END MEMORY//
+
+Use the tools to play:
+- analyze_with_vision() shows you the current screen (usually your first call)
+- take_screenshot() shows the screen and saves it for recall_screenshot(N) later
+- recall_screenshot(number) reads what an earlier screenshot showed
+- cleanup_memory() when the memory is repetitive or contradictory
+- press_buttons(...) ends the turn: describe the screen, explain your reasoning, give the button batch and memory updates
+
+Buttons: A (confirm/advance dialogue), B (back), START (menu), SELECT, UP/DOWN/LEFT/RIGHT (move), L, R.
+🚀 Batch aggressively: ["A", "A", "A", "A", "A"] through dialogue, ["UP", "UP", "UP"] to walk. Each button takes 0.75s.
+Memory entries: "SCREENSHOTS: [N] | LOCATION: ... | ACTION: ... | RESULT: ... | NEXT: ..." (~100 tokens, rich detail)."""
+        }, {
+            "role": "user",
+            "content": f"{self.turn_notes_context()}Frame {self.frame_count}: look at the game and decide what to press."
+        }]
+
+    def run_native_tool(self, name, arguments):
+        """Execute one function-calling tool
+        Returns:
+            (result_text, image_base64): image_base64 is attached to the conversation for screen tools, else None
+        """
+        if name == "analyze_with_vision":
+            image_base64 = self.capture_vision_frame_base64()
+            return ("Current screen attached below." if image_base64 else "Screen capture failed."), image_base64
+        
+        if name == "take_screenshot":
+            screenshot_num = self.take_screenshot_tool()
+            image_base64 = self.get_screenshot_vision_base64(screenshot_num) if screenshot_num else None
+            if not image_base64:
+                return "Failed to take screenshot.", None
+            self.tool_loop_screenshot = screenshot_num
+            return f"Saved as screenshot {screenshot_num}; attached below.", image_base64
+        
+        if name in ("recall_screenshot", "cleanup_memory"):
+            return "\n".join(self.execute_tools([dict(arguments, tool=name)])) or "No result.", None
+        
+        return f"Unknown tool: {name}", None
+
+    def tool_calling_decision(self, memory_list):
+        """Native function-calling turn: the model requests tools and sees their results in the same
+        conversation until it calls press_buttons (forced on the last round)"""
+        messages = self.build_tool_loop_messages(memory_list)
+        self.tool_loop_screenshot = None
+        
+        for round_num in range(self.tool_loop_max_rounds):
+            last_round = round_num == self.tool_loop_max_rounds - 1
+            tool_choice = {"type": "function", "function": {"name": "press_buttons"}} if last_round else "required"
+            message = self.robust_api_call(messages, max_tokens=2000, temperature=0.3, function_name="Tool Loop", tools=GAME_TOOLS, tool_choice=tool_choice)
             
-            response = requests.post(
-                "https://api.x.ai/v1/chat/completions",
-                headers=headers,
-                json=payload,
-                timeout=60
-            )
+            if not message:
+                break
+            tool_calls = message.get("tool_calls") or []
+            if not tool_calls:
+                # Answered in plain text instead of calling press_buttons
+                return self.finalize_fused_decision(message.get("content"), "Tool Loop")
+            
+            decision_call = next((call for call in tool_calls if call["function"]["name"] == "press_buttons"), None)
+            if decision_call is not None:
+                decision = self.finalize_fused_decision(decision_call["function"].get("arguments"), "Tool Loop")
+                if self.tool_loop_screenshot:
+                    self.save_screenshot_description(self.tool_loop_screenshot, decision.get("image_description"))
+                self.log(f"🛠️ Tool loop decided after {round_num + 1} round(s)")
+                return decision
             
-            if response.status_code == 200:
-                result = response.json()
-                response_text = result['choices'][0]['message']['content']
-                
+            messages.append({"role": "assistant", "content": message.get("content"), "tool_calls": tool_calls})
+            attachments = []
+            for call in tool_calls:
+                name = call["function"]["name"]
                 try:
-                    # Try to parse JSON response
-                    json_response = json.loads(response_text)
-                    return json_response
+                    arguments = json.loads(call["function"].get("arguments") or "{}")
                 except json.JSONDecodeError:
-                    # Fallback for non-JSON responses
-                    self.log("⚠️ Non-JSON response from Grok-4, parsing manually")
-                    return {
-                        "image_description": "Unable to parse image description",
-                        "reasoning": response_text,
-                        "actions": ["A"],
-                        "memory_updates": {"add": [], "remove": [], "update": {}}
-                    }
-                    
-            else:
-                self.log(f"❌ Grok-4 Vision API Error: {response.status_code} - {response.text}")
-                return {
-                    "image_description": "API error occurred",
-                    "reasoning": "API error, defaulting to A button",
-                    "actions": ["A"],
-                    "memory_updates": {"add": [], "remove": [], "update": {}}
-                }
+                    arguments = {}
+                self.log(f"🛠️ Tool call: {name}({arguments})")
+                result, image_base64 = self.run_native_tool(name, arguments)
+                messages.append({"role": "tool", "tool_call_id": call["id"], "content": result})
+                if image_base64:
+                    attachments.append(image_base64)
+            
+            # Images cannot go in tool results - attach them as a user turn right after
+            for image_base64 in attachments:
+                messages.append({"role": "user", "content": [
+                    {"type": "text", "text": "Current game screen:"},
+                    {"type": "image_url", "image_url": {"url": image_data_url(image_base64), "detail": "high"}}
+                ]})
+        
+        return {
+            "image_description": "API error occurred",
+            "reasoning": "Tool loop failed, defaulting to A button",
+            "actions": ["A"],
+            "memory_updates": {"add": [], "remove": [], "update": {}},
+            "fallback": True
+        }
+
+    def prepare_fused_decision(self, memory_list, image_base64, follow_up_results=None):
+        """Fused decision messages, as the next turn of the rolling session when it is enabled
+        Returns:
+            (messages, session, turn): session and turn are None for a stateless prompt
+        """
+        session = self.decision_session("Fused Decision")
+        if session is None:
+            return self.build_fused_decision_messages(memory_list, image_base64, follow_up_results), None, None
+        follow_ups = ""
+        if follow_up_results:
+            follow_ups = "//FOLLOW-UP TOOL RESULTS//\n" + "\n".join(follow_up_results) + "\n//END TOOL RESULTS//\n\n"
+        messages, turn = session.prepare_turn(memory_list, f"{follow_ups}{self.turn_notes_context()}Frame {self.frame_count}: analyze this screenshot and decide what actions to take next.", image_base64)
+        return messages, session, turn
+
+    def query_grok4_with_vision(self, memory_list, image_base64, follow_up_results=None):
+        """Query Grok-4 with vision capabilities for both image analysis and decision making"""
+        try:
+            messages, session, turn = self.prepare_fused_decision(memory_list, image_base64, follow_up_results)
+            
+            # One round trip instead of tool selection + vision + decision
+            content, dispatched = self.decision_api_call(messages, max_tokens=1000, temperature=0.3, function_name="Fused Decision")
+            if session is not None and content:
+                session.commit_turn(turn, content)
+            
+            return self.mark_dispatched_actions(self.finalize_fused_decision(content), dispatched)
                 
         except Exception as e:
             self.log(f"❌ Grok-4 Vision error: {e}")
@@ -1203,11 +3961,55 @@ REMEMBER: You have MASSIVE memory capacity - use detailed, structured entries!
                 "image_description": "Error analyzing image",
                 "reasoning": "Error occurred, defaulting to A button",
                 "actions": ["A"], 
-                "memory_updates": {"add": [], "remove": [], "update": {}}
+                "memory_updates": {"add": [], "remove": [], "update": {}},
+                "fallback": True
             }
 
-    def update_memory(self, memory_list, updates):
-        """Update memory based on AI instructions"""
+    def fused_perceive_and_decide(self, memory_list, speculative_decision=None):
+        """Fused loop step: capture the canvas and get description, actions and memory updates in one call
+        Args:
+            speculative_decision (dict): A decision already computed speculatively for this frame, if any
+        """
+        if speculative_decision is not None:
+            decision = speculative_decision
+        else:
+            image_base64 = self.capture_vision_frame_base64()
+            if not image_base64:
+                return {
+                    "reasoning": "No visual information available, taking conservative action",
+                    "actions": ["A"],
+                    "memory_updates": {},
+                    "image_description": "No screenshot taken",
+                    "fallback": True
+                }
+            
+            follow_up_results, self.pending_tool_results = self.pending_tool_results, []
+            decision = self.query_grok4_with_vision(memory_list, image_base64, follow_up_results)
+        
+        # Tool requests are optional follow-ups: run them now, feed results into the next frame
+        follow_up_tools = [call for call in decision.get("tool_calls") or [] if isinstance(call, dict) and call.get("tool") in ("recall_screenshot", "cleanup_memory")]
+        if follow_up_tools:
+            self.log(f"🛠️ Follow-up tools requested: {[call.get('tool') for call in follow_up_tools]}")
+            self.pending_tool_results = self.execute_tools(follow_up_tools)
+        
+        return decision
+
+    def memory_cleanup_due(self, memory_list):
+        """Check whether memory reached a cleanup checkpoint and looks repetitive"""
+        if len(memory_list) <= 100 or len(memory_list) % 50 != 0:  # Every 50 entries after 100
+            return False
+        
+        self.log("🧠 Memory checkpoint reached - checking for cleanup needs...")
+        
+        # Quick analysis for repetitive patterns
+        recent_entries = memory_list[-20:]  # Last 20 entries
+        return len(set(recent_entries)) < len(recent_entries) * 0.5  # If >50% are duplicates
+
+    def update_memory(self, memory_list, updates, allow_cleanup=True):
+        """Update memory based on AI instructions
+        Args:
+            allow_cleanup (bool): If False, skip the inline AI cleanup (the async loop runs it in the background)
+        """
         try:
             new_memory = memory_list.copy()
             
@@ -1240,17 +4042,12 @@ REMEMBER: You have MASSIVE memory capacity - use detailed, structured entries!
                 self.log("🧠 Trimmed memory to last 320 items")
             
             # Trigger intelligent cleanup if memory is getting repetitive
-            elif len(new_memory) > 100 and len(new_memory) % 50 == 0:  # Every 50 entries after 100
-                self.log("🧠 Memory checkpoint reached - checking for cleanup needs...")
-                
-                # Quick analysis for repetitive patterns
-                recent_entries = new_memory[-20:]  # Last 20 entries
-                if len(set(recent_entries)) < len(recent_entries) * 0.5:  # If >50% are duplicates
-                    self.log("🔄 Repetitive memory detected - triggering AI cleanup...")
-                    cleaned_memory = self.cleanup_memory_with_ai()
-                    if cleaned_memory and len(cleaned_memory) < len(new_memory):
-                        new_memory = cleaned_memory
-                        self.log(f"✅ Memory optimized via AI cleanup")
+            elif allow_cleanup and self.memory_cleanup_due(new_memory):
+                self.log("🔄 Repetitive memory detected - triggering AI cleanup...")
+                cleaned_memory = self.cleanup_memory_with_ai()
+                if cleaned_memory and len(cleaned_memory) < len(new_memory):
+                    new_memory = cleaned_memory
+                    self.log(f"✅ Memory optimized via AI cleanup")
             
             return new_memory
             
@@ -1258,33 +4055,25 @@ REMEMBER: You have MASSIVE memory capacity - use detailed, structured entries!
             self.log(f"⚠️ Memory update error: {e}")
             return memory_list
 
-    def analyze_current_screen_with_vision(self):
-        """Direct vision analysis when text descriptions aren't sufficient"""
-        try:
-            self.log("🔍 Taking current screenshot for direct vision analysis...")
-            
-            # Take a fresh screenshot
-            canvas_screenshot_data = self.capture_game_canvas()
-            if not canvas_screenshot_data:
-                self.log("❌ Failed to capture game canvas for vision analysis")
-                return None
-            
-            # Convert to base64
-            canvas_b64 = base64.b64encode(canvas_screenshot_data).decode('utf-8')
-            
-            # Optimize if needed
-            optimized_b64 = self.optimize_image_for_vision(canvas_b64)
-            
-            self.log("🧠 Performing direct vision analysis with context...")
-            
-            # Load memory for context
-            memory_list = self.load_memory()
-            memory_context = "\n".join([f"- {memory}" for memory in memory_list])
-            
-            messages = [
-                {
-                    "role": "system",
-                    "content": f"""You are an AI playing Pokemon Fire Red. You have been asked to analyze the current screen directly because text descriptions were insufficient.
+    def capture_vision_frame_base64(self):
+        """Capture the game canvas and return it as optimized base64 for vision calls"""
+        # Take a fresh screenshot
+        canvas_screenshot_data = self.capture_game_canvas()
+        if not canvas_screenshot_data:
+            self.log("❌ Failed to capture game canvas for vision analysis")
+            return None
+        
+        # Encode straight from the captured bytes (no base64 round trip)
+        return self.encode_frame_for_vision(canvas_screenshot_data)
+
+    def build_direct_vision_messages(self, optimized_b64, memory_list):
+        """Build the direct vision analysis prompt for a captured frame"""
+        memory_context = "\n".join([f"- {memory}" for memory in memory_list])
+        
+        return [
+            {
+                "role": "system",
+                "content": f"""You are an AI playing Pokemon Fire Red. You have been asked to analyze the current screen directly because text descriptions were insufficient.
 
 MEMORY CONTEXT:
 {memory_context}
@@ -1315,24 +4104,38 @@ FOR BATTLES/MENUS:
 ⏱️ SPEED PRIORITY: Don't waste time with single actions during obvious repetitive sequences!
 
 Be specific about visual details and provide actionable navigation guidance."""
-                },
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": "I need direct vision analysis of this Pokemon Fire Red screen. Text descriptions weren't clear enough for navigation/decision making. What exactly do you see and what should I do?"
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/png;base64,{optimized_b64}",
-                                "detail": "high"
-                            }
+            },
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": "I need direct vision analysis of this Pokemon Fire Red screen. Text descriptions weren't clear enough for navigation/decision making. What exactly do you see and what should I do?"
+                    },
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": image_data_url(optimized_b64),
+                            "detail": "high"
                         }
-                    ]
-                }
-            ]
+                    }
+                ]
+            }
+        ]
+
+    def analyze_current_screen_with_vision(self):
+        """Direct vision analysis when text descriptions aren't sufficient"""
+        try:
+            self.log("🔍 Taking current screenshot for direct vision analysis...")
+            
+            optimized_b64 = self.capture_vision_frame_base64()
+            if not optimized_b64:
+                return None
+            
+            self.log("🧠 Performing direct vision analysis with context...")
+            
+            # Load memory for context
+            messages = self.build_direct_vision_messages(optimized_b64, self.load_memory())
             
             # Use robust API call instead of direct requests
             content = self.robust_api_call(messages, max_tokens=32000, temperature=0.3, function_name="Direct Vision")
@@ -1348,29 +4151,34 @@ Be specific about visual details and provide actionable navigation guidance."""
             self.log(f"❌ Direct vision analysis error: {e}")
             return None
 
-    def make_gameplay_decision(self, memory_list, screenshot_info):
-        """Make gameplay decisions based on memory and current screenshot"""
-        try:
-            memory_context = "\n".join([f"- {memory}" for memory in memory_list])
-            
-            # Extract screenshot description from the info
-            if "Screenshot" in screenshot_info and ":" in screenshot_info:
-                screenshot_desc = screenshot_info.split(":", 1)[1].strip()
+    def decision_session(self, function_name):
+        """Rolling conversation for a decision call type (None when GROK_SESSION_CONTEXT=0)"""
+        if not self.session_context:
+            return None
+        if function_name not in self.sessions:
+            if function_name == "Fused Decision":
+                system_prompt = self.fused_decision_instructions() + "\n\n" + self.controls_hint()
             else:
-                screenshot_desc = screenshot_info
-            
-            messages = [
-                {
-                    "role": "system",
-                    "content": f"""You are playing Pokemon Fire Red. You have memory context and current visual information.
+                system_prompt = "You are playing Pokemon Fire Red. Each turn brings the current visual information and any changes to your memory (entries are numbered for memory_updates).\n\n" + self.gameplay_decision_instructions()
+            self.sessions[function_name] = ConversationSession(system_prompt, token_budget=self.session_token_budget)
+        return self.sessions[function_name]
 
-MEMORY (your persistent scratchpad - up to 320 entries):
-{memory_context}
+    def log_session_stats(self):
+        """Log rolling context turns, windows and request size"""
+        for function_name, session in self.sessions.items():
+            stats = session.stats()
+            self.log(f"🧵 {function_name} session: {stats['turns']} turns in {stats['windows']} windows, avg request {stats['avg_request_bytes'] / 1024:.1f} KB")
 
-CURRENT VISUAL: {screenshot_desc}
-CURRENT SCREENSHOT: This is screenshot #{self.screenshot_count} - reference this number in your memory entries
+    @staticmethod
+    def screenshot_description(screenshot_info):
+        """Strip the "Screenshot N:" prefix from tool output"""
+        if "Screenshot" in screenshot_info and ":" in screenshot_info:
+            return screenshot_info.split(":", 1)[1].strip()
+        return screenshot_info
 
-BUTTON SELECTION STRATEGY:
+    def gameplay_decision_instructions(self):
+        """Static part of the gameplay decision prompt (shared by the stateless prompt and the rolling session)"""
+        return """BUTTON SELECTION STRATEGY:
 - A button: Primary for dialogue, tutorials, confirmations, and most navigation
 - START button: For accessing in-game menus, pause screens, and game options
 - If unsure which to use, A is usually the safer choice for progression
@@ -1397,11 +4205,11 @@ MEMORY SELF-MONITORING:
 - Use screenshot associations to cross-reference visual evidence with memories
 
 Respond with JSON:
-{{
+{
     "reasoning": "what you see and your strategy",
     "actions": ["A", "B", "UP", "DOWN", "LEFT", "RIGHT", "START", "SELECT"],
-    "memory_updates": {{"add": [], "remove": [], "update": {{"index": 1, "content": "new content"}}}}
-}}
+    "memory_updates": {"add": [], "remove": [], "update": {"index": 1, "content": "new content"}}
+}
 
 CONTROLS:
 - A: Interact/advance text/confirm (USE MOST)
@@ -1429,36 +4237,82 @@ MEMORY MANAGEMENT TOOLS:
 - Useful when stuck in loops or when memory seems inconsistent with current state
 
 Strategy: Based on what you see, decide the best actions to progress the game. If START fails, fallback to A."""
-                },
-                {
-                    "role": "user", 
-                    "content": f"Current screen: {screenshot_desc}. What should you do next?"
-                }
-            ]
+
+    def build_gameplay_decision_messages(self, memory_list, screenshot_info):
+        """Build the gameplay decision prompt from memory and the latest visual info"""
+        memory_context = "\n".join([f"- {memory}" for memory in memory_list])
+        
+        # Extract screenshot description from the info
+        screenshot_desc = self.screenshot_description(screenshot_info)
+        
+        return [
+            {
+                "role": "system",
+                "content": f"""You are playing Pokemon Fire Red. You have memory context and current visual information.
+
+MEMORY (your persistent scratchpad - up to 320 entries):
+{memory_context}
+
+CURRENT VISUAL: {screenshot_desc}
+CURRENT SCREENSHOT: This is screenshot #{self.screenshot_count} - reference this number in your memory entries
+
+""" + self.gameplay_decision_instructions()
+            },
+            {
+                "role": "user", 
+                "content": f"{self.turn_notes_context()}Current screen: {screenshot_desc}. What should you do next?"
+            }
+        ]
+
+    def finalize_gameplay_decision(self, content, screenshot_info):
+        """Turn a gameplay decision response into a decision with required fields filled in"""
+        if content:
+            decision = self.parse_structured_response(content, "Gameplay Decision", "A")
+            decision["image_description"] = screenshot_info
+            
+            # Ensure required fields exist
+            if "reasoning" not in decision:
+                decision["reasoning"] = "AI made a decision"
+            if "actions" not in decision:
+                decision["actions"] = ["A"]
+            if "memory_updates" not in decision:
+                decision["memory_updates"] = {}
+                
+            return decision
+        else:
+            return {
+                "reasoning": "API failed, using fallback",
+                "actions": ["A"],
+                "memory_updates": {},
+                "image_description": screenshot_info,
+                "fallback": True
+            }
+
+    def prepare_gameplay_decision(self, memory_list, screenshot_info):
+        """Gameplay decision messages, as the next turn of the rolling session when it is enabled
+        Returns:
+            (messages, session, turn): session and turn are None for a stateless prompt
+        """
+        session = self.decision_session("Gameplay Decision")
+        if session is None:
+            return self.build_gameplay_decision_messages(memory_list, screenshot_info), None, None
+        messages, turn = session.prepare_turn(
+            memory_list,
+            f"{self.turn_notes_context()}CURRENT SCREENSHOT: #{self.screenshot_count}\nCurrent screen: {self.screenshot_description(screenshot_info)}. What should you do next?"
+        )
+        return messages, session, turn
+
+    def make_gameplay_decision(self, memory_list, screenshot_info):
+        """Make gameplay decisions based on memory and current screenshot"""
+        try:
+            messages, session, turn = self.prepare_gameplay_decision(memory_list, screenshot_info)
             
             # Use robust API call with higher token limit to prevent truncation
-            content = self.robust_api_call(messages, max_tokens=32000, temperature=0.7, function_name="Gameplay Decision")
+            content, dispatched = self.decision_api_call(messages, max_tokens=32000, temperature=0.7, function_name="Gameplay Decision")
+            if session is not None and content:
+                session.commit_turn(turn, content)
              
-            if content:
-                decision = self.parse_json_with_fallback(content, "Gameplay Decision", "A")
-                decision["image_description"] = screenshot_info
-                 
-                 # Ensure required fields exist
-                if "reasoning" not in decision:
-                     decision["reasoning"] = "AI made a decision"
-                if "actions" not in decision:
-                     decision["actions"] = ["A"]
-                if "memory_updates" not in decision:
-                     decision["memory_updates"] = {}
-                     
-                return decision
-            else:
-                return {
-                     "reasoning": "API failed, using fallback",
-                     "actions": ["A"],
-                     "memory_updates": {},
-                     "image_description": screenshot_info
-                 }
+            return self.mark_dispatched_actions(self.finalize_gameplay_decision(content, screenshot_info), dispatched)
                 
         except Exception as e:
             self.log(f"❌ Gameplay decision error: {e}")
@@ -1466,7 +4320,8 @@ Strategy: Based on what you see, decide the best actions to progress the game. I
                 "reasoning": f"Error: {e}",
                 "actions": ["A"],
                 "memory_updates": {},
-                "image_description": screenshot_info
+                "image_description": screenshot_info,
+                "fallback": True
             }
 
     def send_ai_thought(self, image_desc, reasoning, action):
@@ -1652,74 +4507,84 @@ Strategy: Based on what you see, decide the best actions to progress the game. I
         except Exception as e:
             self.log(f"❌ Fallback AI thought failed: {e}")
 
-    def execute_action_sequence(self, actions):
-        """Execute a sequence of actions"""
+    def dispatch_key(self, action):
+        """Press and release one button on the game canvas
+        Returns:
+            'SUCCESS', 'NO_MAPPING' or an 'ERROR: ...' message from the page
+        """
+        js_script = f"""
+        try {{
+            const canvas = document.querySelector('#game canvas') || document.querySelector('canvas');
+            const target = canvas || document;
+            
+            const keyMappings = {{
+                'A': {{ code: 'KeyZ', key: 'z', keyCode: 90 }},
+                'B': {{ code: 'KeyX', key: 'x', keyCode: 88 }},
+                'START': {{ code: 'Enter', key: 'Enter', keyCode: 13 }},
+                'SELECT': {{ code: 'ShiftLeft', key: 'Shift', keyCode: 16 }},
+                'UP': {{ code: 'ArrowUp', key: 'ArrowUp', keyCode: 38 }},
+                'DOWN': {{ code: 'ArrowDown', key: 'ArrowDown', keyCode: 40 }},
+                'LEFT': {{ code: 'ArrowLeft', key: 'ArrowLeft', keyCode: 37 }},
+                'RIGHT': {{ code: 'ArrowRight', key: 'ArrowRight', keyCode: 39 }},
+                'L': {{ code: 'KeyA', key: 'a', keyCode: 65 }},
+                'R': {{ code: 'KeyS', key: 's', keyCode: 83 }}
+            }};
+            
+            const mapping = keyMappings['{action}'];
+            if (!mapping) return 'NO_MAPPING';
+            
+            const eventProps = {{
+                key: mapping.key,
+                code: mapping.code,
+                keyCode: mapping.keyCode,
+                which: mapping.keyCode,
+                bubbles: true,
+                cancelable: true,
+                composed: true
+            }};
+            
+            const keyDown = new KeyboardEvent('keydown', eventProps);
+            const keyUp = new KeyboardEvent('keyup', eventProps);
+            
+            const targets = [target, document, window];
+            targets.forEach(t => {{
+                if (t && t.dispatchEvent) {{
+                    t.dispatchEvent(keyDown);
+                }}
+            }});
+            
+            setTimeout(() => {{
+                targets.forEach(t => {{
+                    if (t && t.dispatchEvent) {{
+                        t.dispatchEvent(keyUp);
+                    }}
+                }});
+            }}, 100);
+            
+            // DEBUG: Log key press for troubleshooting
+            console.log('🎮 Key pressed:', '{action}', 'keyCode:', mapping.keyCode, 'key:', mapping.key);
+            
+            return 'SUCCESS';
+            
+        }} catch (error) {{
+            return 'ERROR: ' + error.message;
+        }}
+        """
+        
+        return self.driver.execute_script(js_script)
+
+    def execute_action_sequence(self, actions, on_batch_ending=None):
+        """Execute a sequence of actions
+        Args:
+            on_batch_ending (callable): Called once the last key has been pressed and has settled, before the trailing delay
+        """
         for i, action in enumerate(actions):
             if action in self.controls:
                 key = self.controls[action]
                 
                 try:
                     # Enhanced JavaScript input method
-                    js_script = f"""
-                    try {{
-                        const canvas = document.querySelector('#game canvas') || document.querySelector('canvas');
-                        const target = canvas || document;
-                        
-                        const keyMappings = {{
-                            'A': {{ code: 'KeyZ', key: 'z', keyCode: 90 }},
-                            'B': {{ code: 'KeyX', key: 'x', keyCode: 88 }},
-                            'START': {{ code: 'Enter', key: 'Enter', keyCode: 13 }},
-                            'SELECT': {{ code: 'ShiftLeft', key: 'Shift', keyCode: 16 }},
-                            'UP': {{ code: 'ArrowUp', key: 'ArrowUp', keyCode: 38 }},
-                            'DOWN': {{ code: 'ArrowDown', key: 'ArrowDown', keyCode: 40 }},
-                            'LEFT': {{ code: 'ArrowLeft', key: 'ArrowLeft', keyCode: 37 }},
-                            'RIGHT': {{ code: 'ArrowRight', key: 'ArrowRight', keyCode: 39 }},
-                            'L': {{ code: 'KeyA', key: 'a', keyCode: 65 }},
-                            'R': {{ code: 'KeyS', key: 's', keyCode: 83 }}
-                        }};
-                        
-                        const mapping = keyMappings['{action}'];
-                        if (!mapping) return 'NO_MAPPING';
-                        
-                        const eventProps = {{
-                            key: mapping.key,
-                            code: mapping.code,
-                            keyCode: mapping.keyCode,
-                            which: mapping.keyCode,
-                            bubbles: true,
-                            cancelable: true,
-                            composed: true
-                        }};
-                        
-                        const keyDown = new KeyboardEvent('keydown', eventProps);
-                        const keyUp = new KeyboardEvent('keyup', eventProps);
-                        
-                        const targets = [target, document, window];
-                        targets.forEach(t => {{
-                            if (t && t.dispatchEvent) {{
-                                t.dispatchEvent(keyDown);
-                            }}
-                        }});
-                        
-                        setTimeout(() => {{
-                            targets.forEach(t => {{
-                                if (t && t.dispatchEvent) {{
-                                    t.dispatchEvent(keyUp);
-                                }}
-                            }});
-                        }}, 100);
-                        
-                        // DEBUG: Log key press for troubleshooting
-                        console.log('🎮 Key pressed:', '{action}', 'keyCode:', mapping.keyCode, 'key:', mapping.key);
-                        
-                        return 'SUCCESS';
-                        
-                    }} catch (error) {{
-                        return 'ERROR: ' + error.message;
-                    }}
-                    """
-                    
-                    result = self.driver.execute_script(js_script)
+                    result = self.dispatch_key(action)
                     
                     if result == 'SUCCESS':
                         self.log(f"⌨️ Action {i+1}/{len(actions)}: {action} -> {key}")
@@ -1743,8 +4608,369 @@ Strategy: Based on what you see, decide the best actions to progress the game. I
             else:
                 self.log(f"❌ Unknown action: {action}")
         
-        # Brief delay after sequence completion
-        time.sleep(0.3)
+        if on_batch_ending:
+            on_batch_ending()
+        
+        # Brief delay after sequence completion
+        time.sleep(0.3)
+
+    def check_decision_cache(self, memory_list, frame=None, lookup=True):
+        """Hash the current canvas (or an already captured frame) and look up a cached decision
+        Args:
+            lookup (bool): If False, only compute the key so a fresh decision can be stored (stuck screens)
+        Returns:
+            (cache_key, decision): decision is None on a miss; cache_key is None if caching is off, the
+            scene classifier did not label the frame as a cacheable scene or capture failed
+        """
+        if self.decision_cache is None or self.scene_label not in DecisionCache.SCENES:
+            return None, None
+        
+        try:
+            frame = frame or self.capture_game_canvas()
+            if not frame:
+                return None, None
+            cache_key = (DecisionCache.frame_hash(frame), DecisionCache.memory_digest(memory_list))
+        except Exception as e:
+            self.log(f"⚠️ Decision cache lookup failed: {e}")
+            return None, None
+        
+        cached = self.decision_cache.get(*cache_key) if lookup else None
+        if cached is None:
+            return cache_key, None
+        
+        stats = self.decision_cache.stats()
+        self.log(f"♻️ Known screen - reusing cached decision (hit rate {stats['hit_rate']:.0%})")
+        
+        # Lightly adapt: same actions, but never replay memory updates for a screen we already logged
+        decision = dict(cached)
+        decision["reasoning"] = f"(cached) {cached.get('reasoning', '')}"
+        decision["memory_updates"] = {}
+        decision["cached"] = True
+        return cache_key, decision
+
+    def frame_gate(self, frame):
+        """Diff this cycle's frame against the frame the last decision was made on
+        Returns:
+            (frame, decision, stuck_note): decision is the last decision to repeat without an API call
+            (the screen did not change), stuck_note a prompt hint once repeating stopped helping; frame
+            is a later capture if the screen was still animating
+        """
+        if self.frame_differ is None or not frame:
+            return frame, None, None
+        
+        try:
+            current = self.frame_differ.decode(frame)
+            previous, self.decided_frame = self.decided_frame, current
+            if previous is None:
+                return frame, None, None
+            change = self.frame_differ.diff(previous, current)
+            
+            if change["state"] == "animating":
+                # Text printing, cursor blinks, transitions: decide on the settled screen instead
+                self.frame_gate_stats["deferred"] += 1
+                for _ in range(self.settle_checks):
+                    time.sleep(0.15)
+                    later = self.capture_game_canvas()
+                    if not later:
+                        break
+                    settled = self.frame_differ.decode(later)
+                    still = self.frame_differ.diff(current, settled)["state"] == "static"
+                    frame, current = later, settled
+                    if still:
+                        break
+                self.decided_frame = current
+                change = self.frame_differ.diff(previous, current)
+                self.log(f"⏳ Screen was animating - deciding on the settled frame ({change['state']}, {change['ratio']:.1%} changed)")
+            
+            if change["state"] != "static":
+                self.static_streak = 0
+                return frame, None, None
+            
+            self.static_streak += 1
+            if self.last_decision is None:
+                return frame, None, None
+            
+            actions = self.last_decision.get("actions", [])
+            if self.static_streak % self.stuck_frames == 0:
+                self.frame_gate_stats["stuck"] += 1
+                self.log(f"🧱 Stuck: screen unchanged after {self.static_streak} action batches ({actions}) - asking for a new decision")
+                return frame, None, f"STUCK: the screen has not changed after the last {self.static_streak} action batches ({', '.join(actions)}) - those inputs are being blocked or ignored, try different buttons or directions"
+            
+            self.frame_gate_stats["repeated"] += 1
+            self.log(f"🟰 Screen unchanged since the last decision ({change['ratio']:.2%} pixels, diff {change['ms']:.2f}ms) - repeating {actions} without an API call")
+            decision = dict(self.last_decision)
+            decision["reasoning"] = f"(screen unchanged) {self.last_decision.get('reasoning', '')}"
+            decision["memory_updates"] = {}
+            decision["repeated"] = True
+            decision.pop("actions_dispatched", None)
+            return frame, decision, None
+        
+        except Exception as e:
+            self.log(f"⚠️ Frame diff failed: {e}")
+            return frame, None, None
+
+    def note_decision(self, decision):
+        """Remember the decision the frame gate may repeat (fallback decisions are never repeated)"""
+        self.turn_notes = []  # Hints were for this turn only - prefetched and speculative prompts must not see them
+        if not decision.get("repeated"):
+            self.last_decision = None if decision.get("fallback") else decision
+            self.autopilot_note = None
+
+    def note_llm_cycle(self, started, decision):
+        """Account a decision the model made (time from cycle start to decision, batch length)"""
+        self.llm_cycle_stats["cycles"] += 1
+        self.llm_cycle_stats["seconds"] += time.time() - started
+        self.llm_cycle_stats["actions"] += len(decision.get("actions", []))
+
+    def run_dialogue_autopilot(self, frame):
+        """Advance a plain text box locally: press A until the box closes, a choice menu or another
+        scene appears, or A stops changing the screen, then hand control back to the model
+        Returns:
+            The number of A presses (0 if the frame is not a plain text box)
+        """
+        if self.scene_label != "dialogue":
+            self.autopilot_blocked = False
+            return 0
+        if not self.dialogue_autopilot or self.autopilot_blocked or not frame:
+            return 0
+        
+        start = time.time()
+        presses, pages, unchanged = 0, 0, 0
+        reason = "press limit"
+        try:
+            current = self.scene_classifier.decode(frame)
+            state = self.scene_classifier.classify(rgb=current)
+            while presses < self.autopilot_max_presses:
+                arrow = state["features"]["continue_arrow"]
+                pages += arrow
+                if self.dispatch_key("A") != 'SUCCESS':
+                    reason = "key dispatch failed"
+                    break
+                presses += 1
+                time.sleep(self.autopilot_delay)
+                
+                frame = self.capture_game_canvas()
+                if not frame:
+                    reason = "capture failed"
+                    break
+                previous, current = current, self.scene_classifier.decode(frame)
+                state = self.scene_classifier.classify(rgb=current)
+                if state["scene"] != "dialogue":
+                    reason = "text box closed" if state["scene"] == "field" else f"{state['scene']} on screen"
+                    pages += not arrow  # The last page has no arrow and A closed it
+                    break
+                # Only the blinking arrow moved: this box is waiting for something other than A
+                unchanged = unchanged + 1 if (np.abs(current - previous) > 24).any(axis=2).mean() < 0.002 else 0
+                if unchanged >= 2:
+                    reason = "no progress"
+                    self.autopilot_blocked = True
+                    break
+        except Exception as e:
+            reason = f"error: {e}"
+        
+        elapsed = time.time() - start
+        stats = self.autopilot_stats
+        stats["runs"] += 1
+        stats["presses"] += presses
+        stats["pages"] += pages
+        stats["seconds"] += elapsed
+        stats["handbacks"][reason.split(":")[0]] = stats["handbacks"].get(reason.split(":")[0], 0) + 1
+        if presses:
+            self.autopilot_note = f"AUTOPILOT: {presses} A presses advanced {pages} dialogue pages without you ({reason}) - the text itself was not read; check the current screen"
+        self.log(f"💬 Dialogue autopilot: {presses} A presses, {pages} pages in {elapsed:.1f}s - handing back ({reason})")
+        return presses
+
+    def autopilot_savings(self):
+        """Estimated model decisions, API calls and seconds the autopilot replaced"""
+        stats, cycles = self.autopilot_stats, self.llm_cycle_stats
+        if not stats["presses"]:
+            return {"decisions": 0, "api_calls": 0, "seconds": 0.0}
+        # Without the autopilot each run costs at least one decision; longer dialogue one per batch of the model's usual length
+        actions_per_decision = cycles["actions"] / cycles["cycles"] if cycles["cycles"] else 5.0
+        decisions = max(stats["runs"], round(stats["presses"] / max(actions_per_decision, 1.0)))
+        requests = self.http_client.request_count + (self.async_client.request_count if self.async_client is not None else 0)
+        calls_per_decision = requests / cycles["cycles"] if cycles["cycles"] else 1.0
+        seconds_per_decision = cycles["seconds"] / cycles["cycles"] if cycles["cycles"] else 0.0
+        typing = stats["presses"] * 0.75 + decisions * 0.3  # execute_action_sequence pacing
+        return {
+            "decisions": decisions,
+            "api_calls": round(decisions * calls_per_decision),
+            "seconds": round(decisions * seconds_per_decision + typing - stats["seconds"], 1)
+        }
+
+    def log_autopilot_stats(self):
+        """Log what the dialogue autopilot did and the estimated savings"""
+        stats = self.autopilot_stats
+        if not stats["runs"]:
+            return
+        saved = self.autopilot_savings()
+        self.log(f"💬 Dialogue autopilot: {stats['runs']} text boxes, {stats['presses']} A presses, {stats['pages']} pages in {stats['seconds']:.1f}s, handbacks {stats['handbacks']}; saved ~{saved['decisions']} decisions, ~{saved['api_calls']} API calls, ~{saved['seconds']:.0f}s")
+
+    def observe_scene(self, frame):
+        """Label this cycle's frame with the local scene classifier and pass the label to the router
+        Returns:
+            A prompt hint for the scene (None for the overworld, blank frames or no label)
+        """
+        self.scene_label = None
+        if self.scene_classifier is not None and frame:
+            try:
+                result = self.scene_classifier.classify(frame)
+                self.scene_label = result["scene"]
+                self.log(f"🏷️ Scene: {self.scene_label} ({result['ms']:.1f}ms)")
+            except Exception as e:
+                self.log(f"⚠️ Scene classification failed: {e}")
+        self.model_router.observe_scene(self.scene_label)
+        return SceneClassifier.HINTS.get(self.scene_label)
+
+    def log_vision_encoder_stats(self):
+        """Log bytes saved by the vision frame encoder"""
+        if self.vision_encoder is not None and self.vision_encoder.frames:
+            stats = self.vision_encoder.stats()
+            self.log(f"🗜️ Vision frames: {stats['frames']} encoded, {stats['bytes_in'] / 1024:.0f} KB -> {stats['bytes_out'] / 1024:.0f} KB ({stats['saved_ratio']:.0%} saved), formats {stats['format_wins']}, {stats['encode_ms_mean']:.1f}ms per frame")
+
+    def log_frame_diff_stats(self):
+        """Log frame gate outcomes and diff timing"""
+        if self.frame_differ is not None:
+            stats = self.frame_differ.stats()
+            gate = self.frame_gate_stats
+            self.log(f"🟰 Frame diff: {stats['states']}, {gate['repeated']} decisions repeated without an API call, {gate['deferred']} deferred for animations, {gate['stuck']} stuck escalations; diff {stats['diff_ms_mean']:.2f}ms mean / {stats['diff_ms_max']:.2f}ms max, decode {stats['decode_ms_mean']:.1f}ms")
+
+    def remember_decision(self, cache_key, decision):
+        """Store a fresh decision in the cache (fallback decisions are never cached)"""
+        if self.decision_cache is None or cache_key is None or decision.get("fallback"):
+            return
+        self.decision_cache.put(*cache_key, {k: v for k, v in decision.items() if k != "actions_dispatched"})
+
+    def log_decision_cache_stats(self):
+        """Log decision cache hit/miss statistics"""
+        if self.decision_cache is not None:
+            stats = self.decision_cache.stats()
+            self.log(f"♻️ Decision cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.0%}), {stats['entries']} entries, {stats['evictions']} evicted, {stats['expirations']} expired")
+
+    def start_speculative_perception(self, memory_list):
+        """Capture the canvas now and start the next frame's perception call in the background"""
+        if not self.speculative_perception or self.loop_mode != "fused" or self.speculation:
+            return
+        
+        try:
+            frame = self.capture_game_canvas()
+            if not frame:
+                return
+            frame_hash = DecisionCache.frame_hash(frame)
+            image_base64 = self.encode_frame_for_vision(frame)
+        except Exception as e:
+            self.log(f"⚠️ Speculative capture failed: {e}")
+            return
+        
+        if self.speculation_executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            self.speculation_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="speculation")
+        
+        # The turn is prepared now and only committed to the rolling session if the result is used
+        follow_ups, self.pending_tool_results = self.pending_tool_results, []
+        messages, session, turn = self.prepare_fused_decision(memory_list, image_base64, follow_ups)
+        future = self.speculation_executor.submit(self.speculative_fused_call, messages)
+        
+        self.speculation = {"frame_hash": frame_hash, "future": future, "follow_ups": follow_ups, "session": session, "turn": turn, "started": time.time()}
+        self.speculation_stats["started"] += 1
+        self.log("🔮 Speculative perception of the next frame started")
+
+    def speculative_fused_call(self, messages):
+        """Background fused decision for a speculatively captured frame (never streams or types keys)
+        Returns:
+            (content, decision): content is committed to the session if the decision is used
+        """
+        content = self.robust_api_call(messages, max_tokens=1000, temperature=0.3, function_name="Fused Decision")
+        return content, self.finalize_fused_decision(content)
+
+    def take_speculative_perception(self, frame, wanted=True):
+        """Claim the pending speculative result if the screen has not changed materially since it was captured"""
+        speculation, self.speculation = self.speculation, None
+        if speculation is None:
+            return None
+        
+        reason = None
+        if not wanted:
+            reason = "not needed"
+        elif not frame:
+            reason = "no frame to compare"
+        else:
+            distance = bin(DecisionCache.frame_hash(frame) ^ speculation["frame_hash"]).count("1")
+            if distance > self.speculation_tolerance:
+                reason = f"screen changed ({distance} bits)"
+        
+        content = result = None
+        if reason is None:
+            try:
+                content, result = speculation["future"].result()
+            except Exception as e:
+                reason = f"error: {e}"
+            if result is None or result.get("fallback"):
+                reason = reason or "no usable result"
+                result = None
+        
+        if reason is not None:
+            speculation["future"].cancel()
+            # Follow-up tool results were not used - send them with the real call instead
+            self.pending_tool_results = speculation["follow_ups"] + self.pending_tool_results
+            self.speculation_stats["discarded"] += 1
+            self.log(f"🗑️ Speculative perception discarded ({reason})")
+            return None
+        
+        if speculation["session"] is not None:
+            speculation["session"].commit_turn(speculation["turn"], content)
+        self.speculation_stats["used"] += 1
+        self.log(f"🔮 Using speculative perception (started {time.time() - speculation['started']:.1f}s ago)")
+        return result
+
+    def stop_speculation(self):
+        """Drop any in-flight speculation and log how often it paid off"""
+        if self.speculation is not None:
+            self.speculation["future"].cancel()
+            self.speculation = None
+        if self.speculation_executor is not None:
+            self.speculation_executor.shutdown(wait=False)
+            self.speculation_executor = None
+        stats = self.speculation_stats
+        if stats["started"]:
+            self.log(f"🔮 Speculation: {stats['used']}/{stats['started']} used, {stats['discarded']} discarded")
+
+    def report_decision(self, ai_response):
+        """Log a decision and send it to the browser overlay"""
+        image_desc = ai_response.get("image_description", "No image description provided")
+        reasoning = ai_response.get("reasoning", "No reasoning provided")
+        actions = ai_response.get("actions", ["A"])
+        
+        self.log(f"🔍 Image: {image_desc[:100]}...")
+        self.log(f"💭 AI Reasoning: {reasoning}")
+        self.log(f"🎯 AI Actions: {actions}")
+        
+        # Send AI thoughts to the browser overlay with better formatting
+        # Extract just the screenshot number and core description
+        screenshot_info = "No screenshot"
+        if "Screenshot" in image_desc:
+            try:
+                # Extract screenshot number and brief description
+                parts = image_desc.split(": ", 1)
+                if len(parts) > 1:
+                    screenshot_info = parts[0]  # e.g., "Screenshot 5"
+                    # Get the first sentence of the description
+                    desc_text = parts[1]
+                    first_sentence = desc_text.split('.')[0][:100] + "..."
+                    image_desc_short = f"{screenshot_info}: {first_sentence}"
+                else:
+                    image_desc_short = image_desc[:80] + "..."
+            except:
+                image_desc_short = image_desc[:80] + "..."
+        else:
+            image_desc_short = image_desc[:80] + "..."
+        
+        # Send thought to overlay with cleaned up content
+        self.send_ai_thought(
+            image_desc_short,
+            reasoning[:150] + "..." if len(reasoning) > 150 else reasoning,
+            str(actions)
+        )
 
     def play_game(self):
         """Main game loop with AI decision making"""
@@ -1763,72 +4989,93 @@ Strategy: Based on what you see, decide the best actions to progress the game. I
             while True:
                 self.frame_count += 15  # Faster cycles
                 self.log(f"📸 Frame {self.frame_count}: Analyzing game state...")
+                cycle_start = time.time()
                 
-                # Let AI decide when to take screenshots
-                # Step 1: AI decides what tools to use (usually take_screenshot)
-                self.log("🧠 AI deciding what to observe...")
-                tool_decision = self.ask_ai_what_to_do(memory_list)
+                # One capture per cycle, shared by the frame diff, scene classifier, decision cache and speculation check
+                frame = self.capture_game_canvas() if (self.frame_differ is not None or self.scene_classifier is not None or self.decision_cache is not None or self.speculation or self.model_router.enabled) else None
                 
-                # Step 2: Execute tools to gather information
-                tool_results = self.execute_tools(tool_decision.get("tool_calls", []))
+                # SPEED OPTIMIZATION: Unchanged screen? Repeat the last decision (or flag a stuck state)
+                frame, ai_response, stuck_note = self.frame_gate(frame)
+                scene_note = self.observe_scene(frame)
                 
-                # Step 3: Now make actual gameplay decisions with the new information
-                if tool_results:
-                    latest_screenshot_info = tool_results[-1] if tool_results else "No visual information"
-                    self.log("🎯 AI making decisions based on visual information...")
-                    ai_response = self.make_gameplay_decision(memory_list, latest_screenshot_info)
-                else:
-                    # Fallback if no tools were used
-                    ai_response = {
-                        "reasoning": "No visual information available, taking conservative action",
-                        "actions": ["A"],
-                        "memory_updates": {},
-                        "image_description": "No screenshot taken"
-                    }
+                # SPEED OPTIMIZATION: Plain text box? Advance it locally and decide on whatever follows it
+                if self.run_dialogue_autopilot(frame):
+                    continue
+                self.turn_notes = [note for note in (self.autopilot_note, scene_note, stuck_note) if note]
+                
+                # SPEED OPTIMIZATION: Known screen? Reuse the cached decision and skip all API calls
+                cache_key = None
+                if ai_response is None:
+                    # No lookup when stuck - the cached decision is what got us stuck
+                    cache_key, ai_response = self.check_decision_cache(memory_list, frame, lookup=not stuck_note)
+                
+                # Perception started while the last batch was typing - usable if the screen did not change
+                # A stuck screen needs the stuck hint, which the speculative prompt did not carry
+                speculative = self.take_speculative_perception(frame, wanted=ai_response is None and not stuck_note)
+                llm_decision = ai_response is None
+                
+                if ai_response is None and self.loop_mode == "fused":
+                    # SPEED OPTIMIZATION: One call returns description, actions and memory updates
+                    self.log("🎯 AI perceiving and deciding in a single call...")
+                    ai_response = self.fused_perceive_and_decide(memory_list, speculative)
+                    self.remember_decision(cache_key, ai_response)
+                
+                elif ai_response is None and self.loop_mode == "tools":
+                    # Tool requests and their results stay in one conversation that ends with press_buttons
+                    self.log("🎯 AI looking and deciding via function calling...")
+                    ai_response = self.tool_calling_decision(memory_list)
+                    self.remember_decision(cache_key, ai_response)
+                
+                elif ai_response is None:
+                    # Let AI decide when to take screenshots
+                    # Step 1: AI decides what tools to use (usually take_screenshot)
+                    self.log("🧠 AI deciding what to observe...")
+                    tool_decision = self.ask_ai_what_to_do(memory_list)
+                    
+                    # Step 2: Execute tools to gather information
+                    tool_results = self.execute_tools(tool_decision.get("tool_calls", []))
+                    
+                    # Step 3: Now make actual gameplay decisions with the new information
+                    if tool_results:
+                        latest_screenshot_info = tool_results[-1] if tool_results else "No visual information"
+                        self.log("🎯 AI making decisions based on visual information...")
+                        ai_response = self.make_gameplay_decision(memory_list, latest_screenshot_info)
+                    else:
+                        # Fallback if no tools were used
+                        ai_response = {
+                            "reasoning": "No visual information available, taking conservative action",
+                            "actions": ["A"],
+                            "memory_updates": {},
+                            "image_description": "No screenshot taken",
+                            "fallback": True
+                        }
+                    
+                    self.remember_decision(cache_key, ai_response)
+                
+                if llm_decision:
+                    self.note_llm_cycle(cycle_start, ai_response)
                 
-                image_desc = ai_response.get("image_description", "No image description provided")
-                reasoning = ai_response.get("reasoning", "No reasoning provided")
                 actions = ai_response.get("actions", ["A"])
                 memory_updates = ai_response.get("memory_updates", {})
                 
-                self.log(f"🔍 Image: {image_desc[:100]}...")
-                self.log(f"💭 AI Reasoning: {reasoning}")
-                self.log(f"🎯 AI Actions: {actions}")
-                
-                # Send AI thoughts to the browser overlay with better formatting
-                # Extract just the screenshot number and core description
-                screenshot_info = "No screenshot"
-                if "Screenshot" in image_desc:
-                    try:
-                        # Extract screenshot number and brief description
-                        parts = image_desc.split(": ", 1)
-                        if len(parts) > 1:
-                            screenshot_info = parts[0]  # e.g., "Screenshot 5"
-                            # Get the first sentence of the description
-                            desc_text = parts[1]
-                            first_sentence = desc_text.split('.')[0][:100] + "..."
-                            image_desc_short = f"{screenshot_info}: {first_sentence}"
-                        else:
-                            image_desc_short = image_desc[:80] + "..."
-                    except:
-                        image_desc_short = image_desc[:80] + "..."
-                else:
-                    image_desc_short = image_desc[:80] + "..."
+                # Streamed decisions may already be typing - finish before touching the driver again
+                if ai_response.get("actions_dispatched"):
+                    self.wait_for_early_actions()
                 
-                # Send thought to overlay with cleaned up content
-                self.send_ai_thought(
-                    image_desc_short,
-                    reasoning[:150] + "..." if len(reasoning) > 150 else reasoning,
-                    str(actions)
-                )
+                self.report_decision(ai_response)
+                self.model_router.observe_decision(ai_response)
+                self.note_decision(ai_response)
                 
                 # Update memory
                 if memory_updates:
                     memory_list = self.update_memory(memory_list, memory_updates)
                     self.save_memory(memory_list)
                 
-                # Execute action sequence
-                self.execute_action_sequence(actions)
+                # Execute action sequence (the next frame is perceived speculatively as the batch ends)
+                if not ai_response.get("actions_dispatched"):
+                    self.execute_action_sequence(actions, on_batch_ending=lambda: self.start_speculative_perception(memory_list))
+                else:
+                    self.start_speculative_perception(memory_list)
                 
                 # Wait before next cycle (much faster)
                 time.sleep(0.5)
@@ -1838,6 +5085,17 @@ Strategy: Based on what you see, decide the best actions to progress the game. I
         except Exception as e:
             self.log(f"❌ Game loop error: {e}")
         finally:
+            self.log_decision_cache_stats()
+            self.log_frame_diff_stats()
+            self.log_autopilot_stats()
+            self.log_vision_encoder_stats()
+            self.log_router_stats()
+            self.log_budget_stats()
+            self.log_parse_stats()
+            self.log_session_stats()
+            self.log_call_summary()
+            self.log_api_metrics()
+            self.stop_speculation()
             if self.driver:
                 self.driver.quit()
                 self.log("🔒 Browser closed")
@@ -1858,15 +5116,387 @@ Strategy: Based on what you see, decide the best actions to progress the game. I
                 self.log("")
                 self.log("🚀 Everything ready! Starting Pokemon adventure!")
                 time.sleep(1.5)
-                self.play_game()
+                self.start_game_loop()
             else:
                 self.log("❌ Failed to load ROM, exiting...")
                 
         except Exception as e:
             self.log(f"💥 Critical error: {e}")
         finally:
+            self.close_devtools()
             if self.driver:
                 self.driver.quit()
+            stats = self.http_client.connection_stats()
+            self.log(f"🔌 xAI connections: {stats['requests']} requests, {stats['new_connections']} new, {stats['reused_connections']} reused")
+            self.http_client.close()
+            if self.hedge_executor is not None:
+                self.hedge_executor.shutdown(wait=False)
+            self.close_persistence()
+
+    def start_game_loop(self):
+        """Start the game loop selected by GROK_LOOP_MODE (classic, fused, tools or async)"""
+        if self.loop_mode == "async":
+            self.log("⚡ Loop mode: async (overlapping API calls)")
+            asyncio.run(self.async_play_game())
+        else:
+            if self.loop_mode == "fused":
+                self.log("⚡ Loop mode: fused (one perceive-and-decide call per frame)")
+            elif self.loop_mode == "tools":
+                self.log("⚡ Loop mode: tools (native function calling, one conversation per frame)")
+            self.play_game()
+
+    # ------------------------------------------------------------------
+    # Async game loop variant
+    # ------------------------------------------------------------------
+
+    def get_async_client(self):
+        """Return the shared asyncio xAI client, creating it on first use"""
+        if self.async_client is None:
+            self.async_client = AsyncGrokClient(self.api_key, base_url=self.http_client.base_url, pool_size=self.http_pool_size)
+        return self.async_client
+
+    async def run_in_selenium(self, func, *args):
+        """Run a blocking Selenium call on the dedicated WebDriver thread so the event loop never stalls"""
+        if self.selenium_executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            self.selenium_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="selenium")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.selenium_executor, func, *args)
+
+    async def run_blocking(self, func, *args):
+        """Run blocking disk or CPU work on the default executor"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, func, *args)
+
+    async def async_post_chat_hedged(self, client, payload, timeout, function_name):
+        """Async twin of post_chat_hedged: the losing request is cancelled outright"""
+        delay = self.hedger.hedge_delay(function_name) if self.hedger is not None else None
+        if delay is None or delay >= timeout:
+            return await client.post_chat(payload, timeout=timeout)
+
+        primary = asyncio.create_task(client.post_chat(payload, timeout=timeout))
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done or self.circuit_breaker.state != "closed" or not self.hedger.try_spend():
+            return await primary
+        if not self.rate_limiter.try_acquire():
+            self.hedger.refund()
+            return await primary
+
+        self.log(f"🪞 {function_name} still running after {delay:.1f}s (p{self.hedger.percentile * 100:.0f}) - sending hedge request")
+        hedge = asyncio.create_task(client.post_chat(payload, timeout=timeout))
+        pending = {primary, hedge}
+
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None and task.result()[0] == 200:
+                    hedge_won = task is hedge
+                    self.hedger.record_winner(hedge_won)
+                    self.log(f"🪞 {function_name}: {'hedge' if hedge_won else 'primary'} request won")
+                    for loser in pending:
+                        loser.cancel()
+                    return task.result()
+
+        return await primary
+
+    async def async_robust_api_call(self, messages, max_tokens=32000, temperature=0.7, function_name="API"):
+        """Async twin of robust_api_call: same payload, timeouts and retry policy, but non-blocking"""
+        import aiohttp
+
+        client = self.get_async_client()
+        initial_timeout, max_retries = self.api_call_policy(function_name)
+        payload = self.build_chat_payload(messages, max_tokens, temperature, function_name)
+
+        for attempt in range(max_retries):
+            probe = self.admit_call(function_name)
+            if probe is None:
+                return None
+            await self.rate_limiter.acquire_async()
+            timeout = initial_timeout
+            try:
+                self.log(f"📡 {function_name} async API call (attempt {attempt + 1}/{max_retries}, timeout: {timeout}s, in flight: {client.in_flight + 1})")
+                start_time = time.time()
+                status, body, headers = await self.async_post_chat_hedged(client, payload, timeout, function_name)
+
+                self.rate_limiter.observe_response(status, headers, default_pause=5 + attempt * 5)
+                if status == 200:
+                    self.circuit_breaker.record_success()
+                    content = body['choices'][0]['message']['content']
+                    if body['choices'][0].get('finish_reason') == 'length' and attempt < max_retries - 1:
+                        if self.handle_overrun(function_name, start_time, payload, max_tokens):
+                            payload = self.build_chat_payload(messages, max_tokens, temperature, function_name)
+                            continue
+                    self.log(f"✅ {function_name} async API success in {self.record_call_result(function_name, start_time, content, body, payload)}")
+                    return content
+                elif status == 429:
+                    self.log(f"⏳ Rate limited, backing off {self.rate_limiter.blocked_until - time.monotonic():.1f}s...")
+                    continue
+                else:
+                    self.log(f"❌ {function_name} API error: {status}")
+                    if status >= 500:
+                        self.circuit_breaker.record_failure()
+                    self.record_client_error(status, probe)
+                    if attempt == max_retries - 1:
+                        return None
+                    await asyncio.sleep(self.retry_backoff(attempt))
+
+            except asyncio.TimeoutError:
+                self.circuit_breaker.record_failure()
+                if self.budgets is not None:
+                    self.budgets.record_timeout(self.budget_key(function_name), timeout)
+                self.log(f"⏰ {function_name} timeout after {timeout}s")
+                if attempt == max_retries - 1:
+                    return None
+                await asyncio.sleep(self.retry_backoff(attempt))
+
+            except aiohttp.ClientError as e:
+                self.circuit_breaker.record_failure()
+                self.log(f"🌐 {function_name} connection error: {e}")
+                if attempt == max_retries - 1:
+                    return None
+                await asyncio.sleep(self.retry_backoff(attempt))
+
+            finally:
+                self.circuit_breaker.resolve_probe(probe)
+
+        return None
+
+    async def async_ask_ai_what_to_do(self, memory_list):
+        """Async version of ask_ai_what_to_do"""
+        try:
+            messages = self.build_tool_selection_messages(memory_list)
+            content = await self.async_robust_api_call(messages, max_tokens=32000, temperature=0.7, function_name="Tool Selection")
+            return self.finalize_tool_selection(content)
+        except Exception as e:
+            self.log(f"❌ AI query error: {e}")
+            return {
+                "tool_calls": [{"tool": "analyze_with_vision"}],
+                "reasoning": f"Error: {e}"
+            }
+
+    async def async_make_gameplay_decision(self, memory_list, screenshot_info):
+        """Async version of make_gameplay_decision (same rolling session, no streaming)"""
+        try:
+            messages, session, turn = self.prepare_gameplay_decision(memory_list, screenshot_info)
+            content = await self.async_robust_api_call(messages, max_tokens=32000, temperature=0.7, function_name="Gameplay Decision")
+            if session is not None and content:
+                session.commit_turn(turn, content)
+            return self.finalize_gameplay_decision(content, screenshot_info)
+        except Exception as e:
+            self.log(f"❌ Gameplay decision error: {e}")
+            return {
+                "reasoning": f"Error: {e}",
+                "actions": ["A"],
+                "memory_updates": {},
+                "image_description": screenshot_info,
+                "fallback": True
+            }
+
+    async def async_analyze_screenshot_with_vision(self, image_base64, optimized=False):
+        """Async version of analyze_screenshot_with_vision"""
+        try:
+            if not optimized:
+                image_base64 = await self.run_blocking(self.optimize_image_for_vision, image_base64)
+            messages = self.build_vision_description_messages(image_base64)
+            content = await self.async_robust_api_call(messages, max_tokens=32000, temperature=0.3, function_name="Vision Analysis")
+            if content and len(content.strip()) > 0:
+                return content
+            return "Vision analysis failed"
+        except Exception as e:
+            self.log(f"❌ Vision analysis error: {e}")
+            return f"Vision analysis error: {e}"
+
+    async def async_analyze_current_screen_with_vision(self):
+        """Async version of analyze_current_screen_with_vision (capture runs on the Selenium thread)"""
+        try:
+            optimized_b64 = await self.run_in_selenium(self.capture_vision_frame_base64)
+            if not optimized_b64:
+                return None
+
+            messages = self.build_direct_vision_messages(optimized_b64, self.load_memory())
+            return await self.async_robust_api_call(messages, max_tokens=32000, temperature=0.3, function_name="Direct Vision")
+        except Exception as e:
+            self.log(f"❌ Direct vision analysis error: {e}")
+            return None
+
+    async def async_cleanup_memory(self, memory_list):
+        """Async memory cleanup over a snapshot - runs in parallel with gameplay"""
+        try:
+            self.log(f"🧠 Background memory cleanup started ({len(memory_list)} entries)...")
+            messages = self.build_memory_cleanup_messages(memory_list)
+            content = await self.async_robust_api_call(messages, max_tokens=32000, temperature=0.3, function_name="Memory Cleanup")
+            return self.finalize_memory_cleanup(content, memory_list)
+        except Exception as e:
+            self.log(f"❌ Memory cleanup error: {e}")
+            return memory_list
+
+    async def async_execute_tools(self, tool_calls):
+        """Async version of execute_tools"""
+        results = []
+
+        for tool_call in tool_calls:
+            tool_name = tool_call.get("tool")
+
+            if tool_name == "take_screenshot":
+                screenshot_num = await self.run_in_selenium(self.take_screenshot_tool)
+                screenshot_b64 = await self.run_blocking(self.get_screenshot_vision_base64, screenshot_num) if screenshot_num else None
+                if screenshot_b64:
+                    description = await self.async_analyze_screenshot_with_vision(screenshot_b64, optimized=True)
+                    await self.run_blocking(self.save_screenshot_description, screenshot_num, description)
+                    results.append(f"Screenshot {screenshot_num}: {description}")
+                else:
+                    results.append("Failed to take screenshot")
+
+            elif tool_name == "recall_screenshot":
+                number = tool_call.get("number") or tool_call.get("screenshot_number") or tool_call.get("N")
+                if number:
+                    description = await self.run_blocking(self.recall_screenshot_tool, number)
+                    results.append(f"Screenshot {number}: {description}")
+                else:
+                    results.append("No screenshot number provided for recall")
+
+            elif tool_name == "analyze_with_vision":
+                vision_analysis = await self.async_analyze_current_screen_with_vision()
+                if vision_analysis:
+                    results.append(f"Direct Vision Analysis: {vision_analysis}")
+                else:
+                    results.append("Direct vision analysis failed")
+
+            elif tool_name == "cleanup_memory":
+                memory_list = self.load_memory()
+                cleaned_memory = await self.async_cleanup_memory(memory_list)
+                if cleaned_memory and len(cleaned_memory) != len(memory_list):
+                    self.save_memory(cleaned_memory)
+                    results.append(f"Memory cleanup completed: {len(memory_list)} → {len(cleaned_memory)} entries")
+                else:
+                    results.append("Memory cleanup completed - no changes needed")
+
+        return results
+
+    async def async_play_game(self):
+        """Async game loop: the next tool selection is requested while the action batch is typed,
+        and memory cleanup runs in the background instead of blocking gameplay"""
+        self.log("🎮 Starting AI Pokemon adventure (async loop)!")
+        self.log("🚨 CRITICAL: DO NOT TOUCH THE BROWSER WINDOW!")
+        self.log("")
+
+        memory_list = self.load_memory()
+        self.log(f"🧠 Loaded {len(memory_list)} memories")
+
+        next_tool_decision = None
+        cleanup_task = None
+        cleanup_snapshot = []
+
+        try:
+            while True:
+                if next_tool_decision is None:
+                    self.frame_count += 15
+                    next_tool_decision = asyncio.create_task(self.async_ask_ai_what_to_do(memory_list))
+                self.log(f"📸 Frame {self.frame_count}: Analyzing game state...")
+
+                # Fold a finished background cleanup into memory, keeping entries added since the snapshot
+                if cleanup_task is not None and cleanup_task.done():
+                    cleaned_memory = cleanup_task.result()
+                    if cleaned_memory and len(cleaned_memory) < len(cleanup_snapshot):
+                        if memory_list[:len(cleanup_snapshot)] == cleanup_snapshot:
+                            memory_list = cleaned_memory + memory_list[len(cleanup_snapshot):]
+                            self.save_memory(memory_list)
+                            self.log(f"✅ Background memory cleanup applied ({len(memory_list)} entries)")
+                        else:
+                            # Entries the cleanup saw were since removed, rewritten or trimmed - merging would resurrect or drop them
+                            self.log("⚠️ Memory changed beyond appends during background cleanup - discarding the cleanup result")
+                    cleanup_task = None
+
+                # One capture shared by the frame diff, scene classifier, decision cache and model router
+                frame = await self.run_in_selenium(self.capture_game_canvas) if (self.frame_differ is not None or self.scene_classifier is not None or self.decision_cache is not None or self.model_router.enabled) else None
+                frame, ai_response, stuck_note = await self.run_in_selenium(self.frame_gate, frame)
+                scene_note = self.observe_scene(frame)
+                if await self.run_in_selenium(self.run_dialogue_autopilot, frame):
+                    # The prefetched tool selection was made before the text box was advanced
+                    next_tool_decision.cancel()
+                    next_tool_decision = None
+                    continue
+                self.turn_notes = [note for note in (self.autopilot_note, scene_note, stuck_note) if note]
+                cache_key = None
+                if ai_response is None:
+                    cache_key, ai_response = await self.run_in_selenium(self.check_decision_cache, memory_list, frame, not stuck_note)
+
+                if ai_response is not None:
+                    # Unchanged or known screen - the prefetched tool selection is not needed
+                    next_tool_decision.cancel()
+                    next_tool_decision = None
+                else:
+                    cycle_start = time.time()
+                    
+                    # Step 1: Tool selection (usually already answered while the last batch was typed)
+                    tool_decision = await next_tool_decision
+                    next_tool_decision = None
+
+                    # Step 2: Execute tools
+                    tool_results = await self.async_execute_tools(tool_decision.get("tool_calls", []))
+
+                    # Step 3: Gameplay decision
+                    if tool_results:
+                        ai_response = await self.async_make_gameplay_decision(memory_list, tool_results[-1])
+                    else:
+                        ai_response = {
+                            "reasoning": "No visual information available, taking conservative action",
+                            "actions": ["A"],
+                            "memory_updates": {},
+                            "image_description": "No screenshot taken",
+                            "fallback": True
+                        }
+
+                    self.remember_decision(cache_key, ai_response)
+                    self.note_llm_cycle(cycle_start, ai_response)
+
+                actions = ai_response.get("actions", ["A"])
+                memory_updates = ai_response.get("memory_updates", {})
+                await self.run_in_selenium(self.report_decision, ai_response)
+                self.model_router.observe_decision(ai_response)
+                self.note_decision(ai_response)
+
+                if memory_updates:
+                    memory_list = self.update_memory(memory_list, memory_updates, allow_cleanup=False)
+                    self.save_memory(memory_list)
+                    if cleanup_task is None and self.memory_cleanup_due(memory_list):
+                        cleanup_snapshot = list(memory_list)
+                        cleanup_task = asyncio.create_task(self.async_cleanup_memory(cleanup_snapshot))
+
+                # Step 4: Type the batch while the next tool selection is already in flight
+                action_task = asyncio.create_task(self.run_in_selenium(self.execute_action_sequence, actions))
+                self.frame_count += 15
+                next_tool_decision = asyncio.create_task(self.async_ask_ai_what_to_do(memory_list))
+                await action_task
+
+                await asyncio.sleep(0.5)
+
+        except (KeyboardInterrupt, asyncio.CancelledError):
+            self.log("🛑 Stopping AI Pokemon player...")
+        except Exception as e:
+            self.log(f"❌ Async game loop error: {e}")
+        finally:
+            for task in (next_tool_decision, cleanup_task):
+                if task is not None and not task.done():
+                    task.cancel()
+            self.log_decision_cache_stats()
+            self.log_frame_diff_stats()
+            self.log_autopilot_stats()
+            self.log_vision_encoder_stats()
+            self.log_router_stats()
+            self.log_budget_stats()
+            self.log_parse_stats()
+            self.log_session_stats()
+            self.log_call_summary()
+            self.log_api_metrics()
+            if self.async_client is not None:
+                self.log(f"⚡ Async client: {self.async_client.request_count} requests, max {self.async_client.max_in_flight} in flight")
+                await self.async_client.close()
+            if self.driver:
+                await self.run_in_selenium(self.driver.quit)
+                self.log("🔒 Browser closed")
+            if self.selenium_executor is not None:
+                self.selenium_executor.shutdown(wait=False)
 
     def take_comparison_screenshots(self):
         """Take both full browser and game-only screenshots for comparison"""
@@ -2232,20 +5862,269 @@ Strategy: Based on what you see, decide the best actions to progress the game. I
             self.log(f"❌ Manual start check failed: {e}")
             return False
 
-    def robust_api_call(self, messages, max_tokens=32000, temperature=0.7, function_name="API"):
-        """Robust API call with smart timeout handling and minimal retries"""
-        
+    def api_call_policy(self, function_name):
+        """Return (initial_timeout, max_retries) for an API call type"""
+        # Per-tier timeout first: the fast tier should fail fast rather than wait minutes
+        tier_timeout = self.model_router.tiers[self.model_router.route(function_name)]["timeout"]
+        if tier_timeout:
+            timeout = tier_timeout
         # Smart timeout strategy: Start high, only retry on real failures
-        if function_name == "Gameplay Decision":
+        elif function_name == "Gameplay Decision":
             # For complex decisions: Start with very generous timeout
-            initial_timeout = 180  # 3 minutes - let it think!
-            max_retries = 2  # Only retry once on real failures
+            timeout = 180  # 3 minutes - let it think! Only retry once on real failures
         else:
             # For other APIs: Still generous but faster
-            initial_timeout = 120  # 2 minutes  
-            max_retries = 2
+            timeout = 120  # 2 minutes
+        
+        # Once we have seen enough calls, p99 x factor replaces the constant (never above it)
+        if self.budgets is not None:
+            timeout = self.budgets.timeout(self.budget_key(function_name), timeout)
+        return timeout, 2
+
+    def budget_key(self, function_name):
+        """Adaptive budgets are tracked per call type and model tier"""
+        return f"{function_name}/{self.model_router.route(function_name)}"
+
+    def build_chat_payload(self, messages, max_tokens=32000, temperature=0.7, function_name="API", tools=None, tool_choice=None):
+        """Build the chat completions request body shared by the sync and async clients"""
+        payload = {
+            "model": "grok-4",
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens
+        }
+        if tools:
+            payload["tools"] = tools
+            payload["tool_choice"] = tool_choice or "auto"
+        
+        if self.structured_output and function_name in RESPONSE_SCHEMAS:
+            payload["response_format"] = {
+                "type": "json_schema",
+                "json_schema": {"name": function_name.lower().replace(" ", "_"), "schema": RESPONSE_SCHEMAS[function_name], "strict": True}
+            }
+        
+        if self.budgets is not None:
+            payload["max_tokens"] = self.budgets.max_tokens(self.budget_key(function_name), max_tokens)
+        
+        tier = self.model_router.route(function_name)
+        self.model_router.apply(payload, tier, function_name, max_tokens)
+        if self.model_router.enabled:
+            self.log(f"🔀 Router: {function_name} -> {tier} tier ({payload['model']}, scene: {self.model_router.scene() or 'unknown'})")
+        return payload
+
+    def record_call_result(self, function_name, start_time, content, result=None, payload=None):
+        """Feed a successful call into the router, budget, hedging and token accounting; returns a short label for the success log"""
+        elapsed = time.time() - start_time
+        tier = self.model_router.record_latency(function_name, elapsed)
+        if self.hedger is not None:
+            self.hedger.record(function_name, elapsed)
+        
+        usage = (result or {}).get("usage") or {}
+        if self.budgets is not None:
+            # Reasoning tokens count against max_tokens too
+            reasoning = (usage.get("completion_tokens_details") or {}).get("reasoning_tokens") or 0
+            tokens = (usage.get("completion_tokens") or len(content or "") // 4) + reasoning
+            self.budgets.record(self.budget_key(function_name), elapsed, tokens)
+        
+        request_bytes, image_bytes = CallLedger.payload_sizes(payload) if payload else (0, 0)
+        entry = self.call_ledger.record(function_name, self.frame_count, usage, request_bytes, image_bytes, elapsed)
+        if self.call_ledger.totals[function_name]["calls"] % 20 == 0:
+            self.log_rolling_call_stats()
+        return f"{elapsed:.2f}s, {tier} tier, {entry['prompt_tokens']}+{entry['completion_tokens']} tokens ({entry['cached_tokens']} cached), {request_bytes / 1024:.0f} KB sent"
+
+    def log_rolling_call_stats(self):
+        """Log means over the recent call window"""
+        rolling = self.call_ledger.rolling()
+        if rolling:
+            self.log(f"📊 Last {rolling['calls']} calls: {rolling['prompt_tokens']:.0f} prompt ({rolling['cached_tokens']:.0f} cached) + {rolling['completion_tokens']:.0f} completion tokens, {rolling['request_bytes'] / 1024:.0f} KB ({rolling['image_bytes'] / 1024:.0f} KB images), {rolling['latency']:.2f}s per call")
+
+    def log_call_summary(self):
+        """Shutdown summary of tokens, bytes and latency per call type"""
+        summary = self.call_ledger.summary()
+        if not summary["functions"]:
+            return
+        self.log(f"📊 Token usage: {summary['total_tokens']} tokens over {summary['frames']} frames ({summary['tokens_per_frame']:.0f} per frame)")
+        for function_name, stats in summary["functions"].items():
+            self.log(f"📊   {function_name}: {stats['calls']} calls, mean {stats['mean_prompt_tokens']:.0f} prompt ({stats['mean_cached_tokens']:.0f} cached) + {stats['mean_completion_tokens']:.0f} completion tokens, {stats['mean_request_bytes'] / 1024:.0f} KB sent, {stats['mean_latency']:.2f}s")
+
+    def handle_overrun(self, function_name, start_time, payload, requested_max_tokens):
+        """Overrun policy for a response cut off by max_tokens
+        Returns:
+            True if the call should be retried with the widened budget, False to keep the truncated content
+        """
+        if self.budgets is None:
+            return False
+        self.budgets.record_overrun(self.budget_key(function_name), time.time() - start_time, payload["max_tokens"])
+        # The router's tier cap can be lower than what the caller asked for - widening cannot get past it
+        ceiling = min(requested_max_tokens, self.model_router.last_ceiling.get(function_name, requested_max_tokens))
+        if payload["max_tokens"] >= ceiling:
+            self.log(f"✂️ {function_name} truncated at its full {payload['max_tokens']} token budget - using partial response")
+            return False
+        self.log(f"✂️ {function_name} truncated at {payload['max_tokens']} tokens - widening budget and retrying")
+        return True
+
+    def log_budget_stats(self):
+        """Log learned token budgets, p99 latencies and truncations per call type"""
+        if self.budgets is None:
+            return
+        for key, stats in self.budgets.stats().items():
+            self.log(f"📏 {key}: p95 {stats['p95_tokens']} tokens, p99 {stats['p99_latency']:.2f}s over {stats['samples']} calls, {stats['overruns']} truncated")
+
+    def log_router_stats(self):
+        """Log local scene labels and per-tier call counts and latencies so routing thresholds can be tuned"""
+        if self.scene_classifier is not None and self.scene_classifier.latencies:
+            stats = self.scene_classifier.stats()
+            self.log(f"🏷️ Scenes: {stats['scenes']} over {stats['frames']} frames, {stats['ms_mean']:.1f}ms mean / {stats['ms_p95']:.1f}ms p95")
+        if not self.model_router.enabled:
+            return
+        for tier, stats in self.model_router.stats().items():
+            if stats["calls"]:
+                self.log(f"🔀 {tier} tier ({self.model_router.tiers[tier]['model']}): {stats['calls']} calls, mean {stats['mean']:.2f}s, p50 {stats['p50']:.2f}s, p95 {stats['p95']:.2f}s")
+
+    def retry_backoff(self, attempt):
+        """Short exponential backoff with jitter between retries (the breaker handles long outages)"""
+        return min(10.0, 2 ** attempt) + random.uniform(0, 0.5)
+
+    def admit_call(self, function_name):
+        """Circuit breaker admission: None (logged) if the call is refused - callers use their local fallback -
+        else whether it is the half-open probe, which must be passed to circuit_breaker.resolve_probe() when the call ends"""
+        allowed, probe = self.circuit_breaker.admit()
+        if allowed:
+            return probe
+        self.log(f"🔌 {function_name}: xAI circuit open - skipping call, using local fallback")
+        return None
+
+    def record_client_error(self, status, probe):
+        """A 4xx other than 429 means xAI is answering: it closes a half-open probe (it never opens the circuit)"""
+        if probe and status < 500 and status != 429:
+            self.circuit_breaker.record_success()
+
+    def on_circuit_transition(self, old_state, new_state):
+        """Log circuit breaker state changes and export metrics"""
+        icons = {"open": "🔴", "half_open": "🟡", "closed": "🟢"}
+        self.log(f"{icons.get(new_state, '🔌')} xAI circuit {old_state} -> {new_state}")
+        self.export_api_metrics()
+
+    def api_metrics(self):
+        """Throttling and circuit breaker metrics"""
+        return {
+            "timestamp": time.time(),
+            "circuit": self.circuit_breaker.stats(),
+            "rate_limiter": {
+                "throttled_seconds": round(self.rate_limiter.throttled_seconds, 2),
+                "server_pauses": self.rate_limiter.server_pauses
+            },
+            "hedging": self.hedger.stats() if self.hedger is not None else None,
+            "parse_failures": self.parse_stats,
+            "tokens": self.call_ledger.summary(),
+            "vision_encoding": self.vision_encoder.stats() if self.vision_encoder is not None else None,
+            "scenes": self.scene_classifier.stats() if self.scene_classifier is not None else None,
+            "dialogue_autopilot": dict(self.autopilot_stats, saved=self.autopilot_savings()),
+            "persistence": self.persistence.stats(),
+            "screenshot_archive": self.screenshot_archive.stats() if self.screenshot_archive is not None else None,
+            "requests": self.http_client.request_count,
+            "errors": self.http_client.error_count
+        }
+
+    def export_api_metrics(self):
+        """Write api_metrics() to GROK_METRICS_FILE (set it empty to disable)"""
+        if not self.metrics_file:
+            return
+        try:
+            self.persistence.write(self.metrics_file, json.dumps(self.api_metrics(), indent=2))
+        except Exception as e:
+            self.log(f"⚠️ Could not export API metrics: {e}")
+
+    def close_persistence(self):
+        """Flush queued file writes (screenshots, descriptions, memory, metrics) and stop the writer"""
+        if self.persistence.closed:
+            return
+        self.export_api_metrics()
+        depth = self.persistence.queue.qsize()
+        flushed = self.persistence.close()
+        if self.screenshot_archive:
+            self.screenshot_archive.close()
+            archive = self.screenshot_archive.stats()
+            self.log(f"🗄️ Screenshot archive: {archive['frames']} frames, {archive['duplicates']} duplicates ({archive['dedup_ratio']:.0%}), {archive['bytes_stored'] / 1024:.0f} of {archive['bytes_in'] / 1024:.0f} KB stored, {archive['file_bytes'] / 1024 / 1024:.1f} MB on disk (session {archive['session']})")
+        stats = self.persistence.stats()
+        self.log(f"💾 Persistence: {stats['jobs']} writes in {stats['batches']} batches ({stats['collapsed_writes']} superseded), {stats['bytes_written'] / 1024:.0f} KB, batch {stats['batch_ms_mean']:.1f}ms mean / {stats['batch_ms_max']:.1f}ms max, max queue depth {stats['max_queue_depth']}, stalled {stats['stall_seconds']:.2f}s, {stats['errors']} errors")
+        if not flushed:
+            self.log(f"⚠️ Persistence flush timed out ({depth} writes were queued at shutdown)")
+
+    def log_api_metrics(self):
+        """Log time spent throttled and circuit breaker activity"""
+        metrics = self.api_metrics()
+        circuit = metrics["circuit"]
+        self.log(f"🚦 Throttled {metrics['rate_limiter']['throttled_seconds']:.1f}s ({metrics['rate_limiter']['server_pauses']} server pauses); circuit {circuit['state']}, open {circuit['open_seconds']:.1f}s, {circuit['rejected_calls']} calls failed fast")
+        hedging = metrics["hedging"]
+        if hedging:
+            self.log(f"🪞 Hedging: {hedging['hedges']}/{hedging['calls']} calls hedged ({hedging['hedge_rate']:.0%}), hedge won {hedging['hedge_wins']}, primary won {hedging['primary_wins']}, {hedging['over_budget']} over budget")
+        self.export_api_metrics()
+
+    @staticmethod
+    def release_abandoned_response(future):
+        """Return a losing hedge's connection to the pool once it finishes"""
+        if future.exception() is None:
+            future.result().close()
+
+    def post_chat_hedged(self, payload, timeout, function_name):
+        """post_chat, plus a duplicate request if the first runs past its usual latency
+
+        Returns the first 200 response (or the primary's outcome if neither succeeds). The loser
+        cannot be interrupted mid-read by requests, so it is abandoned and its connection released
+        when it returns.
+        """
+        delay = self.hedger.hedge_delay(function_name) if self.hedger is not None else None
+        if delay is None or delay >= timeout:
+            return self.http_client.post_chat(payload, timeout=timeout)
+        
+        from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait, TimeoutError as FutureTimeout
+        if self.hedge_executor is None:
+            self.hedge_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="hedge")
+        
+        primary = self.hedge_executor.submit(self.http_client.post_chat, payload, timeout)
+        try:
+            return primary.result(timeout=delay)
+        except FutureTimeout:
+            pass
+        
+        if self.circuit_breaker.state != "closed" or not self.hedger.try_spend():
+            return primary.result()
+        if not self.rate_limiter.try_acquire():
+            self.hedger.refund()
+            return primary.result()
+        
+        self.log(f"🪞 {function_name} still running after {delay:.1f}s (p{self.hedger.percentile * 100:.0f}) - sending hedge request")
+        hedge = self.hedge_executor.submit(self.http_client.post_chat, payload, timeout)
+        pending = {primary, hedge}
+        
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None and future.result().status_code == 200:
+                    hedge_won = future is hedge
+                    self.hedger.record_winner(hedge_won)
+                    self.log(f"🪞 {function_name}: {'hedge' if hedge_won else 'primary'} request won")
+                    for loser in pending:
+                        if not loser.cancel():
+                            loser.add_done_callback(self.release_abandoned_response)
+                    return future.result()
+        
+        # Neither succeeded - report the primary's outcome like an unhedged call
+        return primary.result()
+
+    def robust_api_call(self, messages, max_tokens=32000, temperature=0.7, function_name="API", tools=None, tool_choice=None):
+        """Robust API call with smart timeout handling and minimal retries
+        Returns:
+            The response content, or the whole assistant message (with tool_calls) when tools are given
+        """
+        initial_timeout, max_retries = self.api_call_policy(function_name)
         
         for attempt in range(max_retries):
+            probe = self.admit_call(function_name)
+            if probe is None:
+                return None
+            self.rate_limiter.acquire()
             try:
                 # Use the initial generous timeout for all attempts
                 # Only retry on connection failures, not timeouts
@@ -2257,58 +6136,178 @@ Strategy: Based on what you see, decide the best actions to progress the game. I
                     self.log(f"⏳ Processing {function_name}... being patient with AI")
                 
                 # Make the API call with generous timeout
-                response = requests.post(
-                    "https://api.x.ai/v1/chat/completions",
-                    headers={
-                        "Authorization": f"Bearer {self.api_key}",
-                        "Content-Type": "application/json"
-                    },
-                    json={
-                        "model": "grok-4",
-                        "messages": messages,
-                        "temperature": temperature,
-                        "max_tokens": max_tokens
-                    },
-                    timeout=timeout
-                )
-                
+                start_time = time.time()
+                payload = self.build_chat_payload(messages, max_tokens, temperature, function_name, tools, tool_choice)
+                response = self.post_chat_hedged(payload, timeout, function_name)
+
+                self.rate_limiter.observe_response(response.status_code, response.headers, default_pause=5 + attempt * 5)
                 if response.status_code == 200:
+                    self.circuit_breaker.record_success()
                     result = response.json()
                     content = result['choices'][0]['message']['content']
-                    self.log(f"✅ {function_name} API success")
-                    return content
+                    if result['choices'][0].get('finish_reason') == 'length' and attempt < max_retries - 1:
+                        if self.handle_overrun(function_name, start_time, payload, max_tokens):
+                            continue
+                    latency = self.record_call_result(function_name, start_time, content, result, payload)
+                    stats = self.http_client.connection_stats()
+                    self.log(f"✅ {function_name} API success in {latency} (connections: {stats['new_connections']} new, {stats['reused_connections']} reused)")
+                    return result['choices'][0]['message'] if tools else content
                 elif response.status_code == 429:
-                    wait_time = 5 + (attempt * 5)
-                    self.log(f"⏳ Rate limited, waiting {wait_time}s...")
-                    time.sleep(wait_time)
+                    # The limiter is now paused for Retry-After (or the old 5s/10s default); the next acquire waits it out
+                    self.log(f"⏳ Rate limited, backing off {self.rate_limiter.blocked_until - time.monotonic():.1f}s...")
                     continue
                 else:
                     self.log(f"❌ {function_name} API error: {response.status_code}")
+                    if response.status_code >= 500:
+                        self.circuit_breaker.record_failure()
+                    self.record_client_error(response.status_code, probe)
                     if attempt == max_retries - 1:
                         return None
-                    time.sleep(3)
+                    time.sleep(self.retry_backoff(attempt))
                     continue
                     
             except requests.exceptions.Timeout:
+                self.circuit_breaker.record_failure()
+                if self.budgets is not None:
+                    self.budgets.record_timeout(self.budget_key(function_name), timeout)
                 self.log(f"⏰ {function_name} timeout after {timeout}s - this might be normal for complex reasoning")
                 if function_name == "Gameplay Decision" and attempt == 0:
-                    # For gameplay decisions, one timeout might be normal - try once more with even longer timeout
+                    # For gameplay decisions, one timeout might be normal - try once more
                     self.log(f"🤔 Complex AI reasoning can take time, trying once more with extra patience...")
                 elif attempt == max_retries - 1:
                     self.log(f"❌ {function_name} failed after {timeout}s - API might be overloaded")
                     return None
                 else:
                     self.log(f"🔄 Retrying {function_name} - might be network issue...")
-                time.sleep(10)  # Longer wait before retry
+                time.sleep(self.retry_backoff(attempt))
                 
             except requests.exceptions.RequestException as e:
+                self.circuit_breaker.record_failure()
                 self.log(f"🌐 {function_name} connection error: {e}")
                 if attempt == max_retries - 1:
                     return None
-                time.sleep(5)
+                time.sleep(self.retry_backoff(attempt))
+            
+            finally:
+                # A probe that got a 429 or an unexpected error must not hold the circuit half-open forever
+                self.circuit_breaker.resolve_probe(probe)
                 
         return None
 
+    def streaming_api_call(self, messages, max_tokens=32000, temperature=0.7, function_name="API", on_actions=None):
+        """Streaming (SSE) API call that hands the actions array to on_actions as soon as it is complete
+
+        Falls back to robust_api_call if the stream fails before any actions were dispatched.
+        """
+        timeout, _ = self.api_call_policy(function_name)
+        parser = StreamingDecisionParser(self.controls)
+        
+        # Ask for actions first so they close long before the reasoning finishes
+        messages = [dict(messages[0], content=messages[0]["content"] + "\n\nSTREAMING: Put the \"actions\" field FIRST in your JSON object, before \"reasoning\".")] + messages[1:]
+        payload = self.build_chat_payload(messages, max_tokens, temperature, function_name)
+        
+        probe = self.admit_call(function_name)
+        if probe is None:
+            return None
+        self.rate_limiter.acquire()
+        
+        start_time = time.time()
+        chunks = []
+        usage = {}
+        try:
+            self.log(f"📡 {function_name} streaming API call (timeout: {timeout}s)")
+            for delta in self.http_client.stream_chat(payload, timeout=timeout, usage=usage):
+                chunks.append(delta)
+                actions = parser.feed(delta)
+                if actions and on_actions:
+                    self.log(f"⚡ {function_name}: actions {actions} ready after {time.time() - start_time:.2f}s - dispatching early")
+                    on_actions(actions)
+            
+            content = "".join(chunks)
+            self.circuit_breaker.record_success()
+            latency = self.record_call_result(function_name, start_time, content, {"usage": usage}, payload)
+            self.log(f"✅ {function_name} stream complete in {latency} ({len(content)} chars)")
+            return content
+            
+        except requests.exceptions.RequestException as e:
+            self.log(f"🌐 {function_name} stream failed: {e}")
+            response = getattr(e, "response", None)
+            if response is not None:
+                self.rate_limiter.observe_response(response.status_code, response.headers)
+            if response is None or response.status_code >= 500:
+                self.circuit_breaker.record_failure()
+            else:
+                self.record_client_error(response.status_code, probe)
+            self.circuit_breaker.resolve_probe(probe)  # Before the fallback asks for admission again
+            if parser.actions:
+                # Actions are already on their way - keep whatever arrived
+                return "".join(chunks)
+            self.log(f"🔄 Falling back to non-streaming {function_name}")
+            return self.robust_api_call(messages, max_tokens, temperature, function_name)
+        
+        finally:
+            self.circuit_breaker.resolve_probe(probe)
+
+    def decision_api_call(self, messages, max_tokens=32000, temperature=0.7, function_name="API"):
+        """API call for decision responses - streams with early action dispatch when enabled
+        Returns:
+            (content, dispatched_actions): dispatched_actions is empty unless actions are already being typed
+        """
+        if not self.stream_decisions:
+            return self.robust_api_call(messages, max_tokens, temperature, function_name), []
+        
+        # SPEED OPTIMIZATION: Stream the response and dispatch actions as soon as the array closes
+        dispatched = []
+        
+        def on_actions(actions):
+            dispatched.extend(actions)
+            self.dispatch_actions_early(actions)
+        
+        content = self.streaming_api_call(messages, max_tokens, temperature, function_name, on_actions=on_actions)
+        return content, dispatched
+
+    def mark_dispatched_actions(self, decision, dispatched):
+        """Record early-dispatched actions on a decision so the loop does not type them twice"""
+        if dispatched:
+            decision["actions"] = list(dispatched)
+            decision["actions_dispatched"] = True
+        return decision
+
+    def dispatch_actions_early(self, actions):
+        """Start typing an action batch on a worker thread while the response keeps streaming"""
+        import threading
+        
+        self.wait_for_early_actions()
+        self.early_action_thread = threading.Thread(target=self.execute_action_sequence, args=(list(actions),), daemon=True)
+        self.early_action_thread.start()
+
+    def wait_for_early_actions(self):
+        """Block until an early-dispatched action batch has finished typing"""
+        if self.early_action_thread is not None:
+            self.early_action_thread.join()
+            self.early_action_thread = None
+
+    def parse_structured_response(self, content, function_name, fallback_action="A"):
+        """Single json.loads + validation into the call type's typed object (returned as a dict)
+
+        Anything that does not validate counts as a parse failure and goes through
+        parse_json_with_fallback's recovery passes instead.
+        """
+        stats = self.parse_stats.setdefault(function_name, {"responses": 0, "failures": 0})
+        stats["responses"] += 1
+        try:
+            return STRUCTURED_TYPES[function_name].from_dict(json.loads(content)).as_dict()
+        except (ValueError, TypeError) as e:
+            stats["failures"] += 1
+            self.log(f"⚠️ {function_name}: structured parse failed ({e}) - using fallback parser")
+            return self.parse_json_with_fallback(content, function_name, fallback_action)
+
+    def log_parse_stats(self):
+        """Log the structured parse failure rate per call type"""
+        for function_name, stats in self.parse_stats.items():
+            rate = stats["failures"] / stats["responses"] if stats["responses"] else 0.0
+            self.log(f"🧾 {function_name}: {stats['failures']}/{stats['responses']} responses failed structured parsing ({rate:.0%})")
+
     def parse_json_with_fallback(self, content, function_name="API", fallback_action="A"):
         """Parse JSON with robust fallback handling"""
         if not content:
@@ -2369,7 +6368,8 @@ Strategy: Based on what you see, decide the best actions to progress the game. I
         return {
             "reasoning": f"Parsed from text: {reasoning}",
             "actions": [action],
-            "memory_updates": {"add": [f"AI response: {reasoning}"]}
+            "memory_updates": {"add": [f"AI response: {reasoning}"]},
+            "fallback": True
         }
 
 if __name__ == "__main__":
@@ -95,8 +95,8 @@ def production_run():
         print("=" * 60)
         print()
         
-        # Start the AI gameplay loop
-        player.play_game()
+        # Start the AI gameplay loop (GROK_LOOP_MODE selects classic/async)
+        player.start_game_loop()
         
     except KeyboardInterrupt:
         print("\n🛑 Pokemon adventure stopped by user")
@@ -109,6 +109,9 @@ def production_run():
         return False
         
     finally:
+        if 'player' in locals():
+            # Screenshots, descriptions and memory are written in the background - flush them before exiting
+            player.close_persistence()
         if 'player' in locals() and player.driver:
             input("\n⏸️ Press Enter to close browser and exit...")
             player.driver.quit()
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Labelled-frame fixtures for the local scene classifier: renders native 240x160 frames laid out like
+Fire Red screens (overworld, text box, start/choice menus, battle with HP boxes, title, fade) and
+writes them to fixtures/scenes/<scene>/NN.png (text boxes showing the continue arrow are
+NN-arrow.png). The frames are drawn, not captured, so they can ship with the repo. They were drawn
+while the classifier thresholds were tuned, so they only check that the thresholds reproduce - not
+that they generalise to the real game; real captures dropped into the same folder layout are
+picked up by the benchmark.
+
+Usage: python "test suites/scene_fixtures.py" [per_scene] [output_dir]
+"""
+
+import os
+import sys
+import numpy as np
+from PIL import Image
+
+WIDTH, HEIGHT = 240, 160
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "scenes")
+
+WHITE = (248, 248, 248)
+TEXT = (96, 96, 96)
+TEXT_SHADOW = (208, 208, 216)
+FRAME_DARK = (72, 88, 112)
+FRAME_LIGHT = (160, 184, 208)
+ARROW = (224, 64, 48)
+HP_COLOURS = ((112, 248, 168), (248, 224, 56), (248, 88, 56))
+FIELD_TILES = ((136, 200, 104), (120, 184, 96), (224, 208, 152), (56, 104, 64), (104, 160, 240), (200, 72, 64), (184, 176, 168))
+
+
+def box(frame, top, left, bottom, right, colour):
+    frame[top:bottom, left:right] = colour
+
+
+def text_lines(frame, rng, top, left, right, lines, line_height=16):
+    """Glyph-sized blocks with a drop shadow, roughly like a line of text"""
+    for line in range(lines):
+        x = left
+        y = top + line * line_height
+        end = rng.integers((left + right) // 2, right)
+        while x < end:
+            glyph = int(rng.integers(3, 7))
+            box(frame, y + 1, x + 1, y + 11, x + glyph + 1, TEXT_SHADOW)
+            box(frame, y, x, y + 10, x + glyph, TEXT)
+            x += glyph + int(rng.integers(2, 5))
+
+
+def framed_window(frame, top, left, bottom, right):
+    """White window with the two-tone Fire Red frame"""
+    box(frame, top, left, bottom, right, FRAME_DARK)
+    box(frame, top + 2, left + 2, bottom - 2, right - 2, FRAME_LIGHT)
+    box(frame, top + 3, left + 3, bottom - 3, right - 3, WHITE)
+
+
+def field(rng):
+    """Overworld: 16x16 tiles of grass, paths, trees, water and buildings with a player sprite"""
+    frame = np.zeros((HEIGHT, WIDTH, 3), dtype=np.uint8)
+    weights = np.array([5, 3, 2, 2, 1, 1, 1], dtype=float)
+    for ty in range(HEIGHT // 16):
+        for tx in range(WIDTH // 16):
+            colour = FIELD_TILES[rng.choice(len(FIELD_TILES), p=weights / weights.sum())]
+            box(frame, ty * 16, tx * 16, ty * 16 + 16, tx * 16 + 16, colour)
+            if rng.random() < 0.3:
+                # Tile detail (grass tufts, flowers, roof lines)
+                y, x = ty * 16 + int(rng.integers(2, 12)), tx * 16 + int(rng.integers(2, 12))
+                box(frame, y, x, y + 3, x + 3, tuple(max(0, c - 48) for c in colour))
+    y, x = 72 + int(rng.integers(-8, 8)), 112 + int(rng.integers(-8, 8))
+    box(frame, y, x, y + 20, x + 14, (208, 64, 56))
+    box(frame, y + 6, x + 2, y + 14, x + 12, (248, 208, 176))
+    return frame
+
+
+def dialogue(rng, arrow=None):
+    """Text box over the overworld, with the continue arrow if `arrow` (random if None)"""
+    frame = field(rng)
+    framed_window(frame, 116, 2, 158, 238)
+    text_lines(frame, rng, 122, 12, 210, int(rng.integers(1, 3)))
+    if arrow if arrow is not None else rng.random() < 0.6:
+        box(frame, 144, 220, 148, 228, ARROW)
+        box(frame, 148, 222, 150, 226, ARROW)
+    return frame
+
+
+def menu(rng):
+    """Start menu, or a YES/NO choice box above a text box"""
+    frame = field(rng)
+    if rng.random() < 0.5:
+        bottom = int(rng.integers(88, 140))
+        framed_window(frame, 2, 168, bottom, 238)
+        text_lines(frame, rng, 10, 184, 232, (bottom - 16) // 16)
+        box(frame, 10, 176, 20, 181, TEXT)  # Cursor
+    else:
+        framed_window(frame, 116, 2, 158, 238)
+        text_lines(frame, rng, 122, 12, 220, 1)
+        framed_window(frame, 70, 180, 114, 238)
+        text_lines(frame, rng, 78, 196, 232, 2)
+        box(frame, 78, 186, 88, 191, TEXT)
+    return frame
+
+
+def hp_box(frame, rng, top, left, bar_left, bar_top):
+    box(frame, top, left, top + 30, left + 104, (80, 96, 88))
+    box(frame, top + 2, left + 2, top + 28, left + 102, (248, 248, 216))
+    text_lines(frame, rng, top + 4, left + 8, left + 90, 1)
+    box(frame, bar_top - 1, bar_left - 1, bar_top + 4, bar_left + 49, (72, 72, 72))
+    hp = rng.random()
+    colour = HP_COLOURS[0] if hp > 0.5 else HP_COLOURS[1] if hp > 0.2 else HP_COLOURS[2]
+    box(frame, bar_top, bar_left, bar_top + 3, bar_left + max(4, int(48 * hp)), colour)
+
+
+def battle(rng):
+    """Battle: background and platforms, both HP boxes, message box or action menu"""
+    frame = np.zeros((HEIGHT, WIDTH, 3), dtype=np.uint8)
+    box(frame, 0, 0, 112, WIDTH, (200, 232, 184) if rng.random() < 0.5 else (168, 200, 224))
+    box(frame, 48, 132, 64, 228, (152, 200, 120))
+    box(frame, 100, 8, 112, 120, (152, 200, 120))
+    box(frame, 8, 150, 56, 198, tuple(int(c) for c in rng.integers(40, 240, 3)))   # Foe sprite
+    box(frame, 64, 30, 112, 86, tuple(int(c) for c in rng.integers(40, 240, 3)))   # Own sprite (back)
+    hp_box(frame, rng, 14, 12, 56, 34)
+    hp_box(frame, rng, 76, 126, 172, 96)
+    box(frame, 112, 0, HEIGHT, WIDTH, (40, 80, 104))
+    box(frame, 114, 2, HEIGHT - 2, WIDTH - 2, (56, 104, 136))
+    if rng.random() < 0.5:
+        framed_window(frame, 112, 120, 160, 240)
+        text_lines(frame, rng, 120, 136, 232, 2)
+    else:
+        x = 12
+        while x < 200:
+            glyph = int(rng.integers(3, 7))
+            box(frame, 124, x, 134, x + glyph, WHITE)
+            x += glyph + 3
+    return frame
+
+
+def title(rng):
+    """Title screen: dark background, flames and the logo"""
+    frame = np.zeros((HEIGHT, WIDTH, 3), dtype=np.uint8)
+    frame[:] = (8, 8, 16)
+    for _ in range(int(rng.integers(12, 24))):
+        y, x = int(rng.integers(60, 150)), int(rng.integers(0, 220))
+        h, w = int(rng.integers(6, 20)), int(rng.integers(8, 24))
+        box(frame, y, x, y + h, x + w, (248, int(rng.integers(40, 120)), 24))
+    box(frame, 14, 40, 52, 200, (232, 200, 48))
+    box(frame, 22, 50, 44, 190, (40, 72, 160))
+    text_lines(frame, rng, 130, 80, 170, 1)
+    return frame
+
+
+def blank(rng):
+    """Fade between screens: one flat colour"""
+    frame = np.zeros((HEIGHT, WIDTH, 3), dtype=np.uint8)
+    frame[:] = (0, 0, 0) if rng.random() < 0.6 else WHITE
+    return frame
+
+
+RENDERERS = {
+    "battle": battle,
+    "dialogue": dialogue,
+    "menu": menu,
+    "title": title,
+    "blank": blank,
+    "field": field
+}
+
+
+def write_fixtures(per_scene=8, output_dir=FIXTURES_DIR, seed=151):
+    """Render and save the fixture set; returns the number of frames written"""
+    rng = np.random.default_rng(seed)
+    written = 0
+    for scene, render in RENDERERS.items():
+        os.makedirs(os.path.join(output_dir, scene), exist_ok=True)
+        for index in range(per_scene):
+            if scene == "dialogue":
+                arrow = index % 2 == 0
+                frame, name = render(rng, arrow), f"{index:02d}-arrow.png" if arrow else f"{index:02d}.png"
+            else:
+                frame, name = render(rng), f"{index:02d}.png"
+            Image.fromarray(frame).save(os.path.join(output_dir, scene, name), optimize=True)
+            written += 1
+    return written
+
+
+if __name__ == "__main__":
+    per_scene = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    output_dir = sys.argv[2] if len(sys.argv) > 2 else FIXTURES_DIR
+    print(f"🖼️ Wrote {write_fixtures(per_scene, output_dir)} labelled frames to {output_dir}")
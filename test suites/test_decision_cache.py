@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Regression check for the decision cache on screens its hash cannot tell apart: two overworld frames
+one tile apart on a grass route, and a menu whose cursor moved, hash within the cache tolerance, so
+the player must not reuse a decision between them. Only frames the scene classifier positively
+labels dialogue, title or blank are cached (nothing when it is off), and a stuck screen computes its
+key without a lookup. No browser or network needed.
+"""
+
+import io
+import os
+import sys
+
+import numpy as np
+from PIL import Image
+
+os.environ.setdefault('XAI_API_KEY', 'offline-stub')
+
+from pokemon_player_browser import DecisionCache, PokemonAIPlayer
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import scene_fixtures
+
+def png_bytes(frame):
+    buffer = io.BytesIO()
+    Image.fromarray(np.ascontiguousarray(frame)).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+def neighbouring_route_frames(seed=0):
+    """Two frames of a grass route one tile apart, the player sprite centred in both (the camera follows the player)"""
+    rng = np.random.default_rng(seed)
+    width = scene_fixtures.WIDTH + 16
+    route = np.zeros((scene_fixtures.HEIGHT, width, 3), dtype=np.uint8)
+    route[:] = scene_fixtures.FIELD_TILES[0]
+    for ty in range(scene_fixtures.HEIGHT // 16):
+        for tx in range(width // 16):
+            # The grass tile pattern repeats every 16 pixels, like the real tileset
+            scene_fixtures.box(route, ty * 16 + 4, tx * 16 + 4, ty * 16 + 7, tx * 16 + 7, scene_fixtures.FIELD_TILES[1])
+            scene_fixtures.box(route, ty * 16 + 11, tx * 16 + 10, ty * 16 + 14, tx * 16 + 13, scene_fixtures.FIELD_TILES[1])
+    ty, tx = int(rng.integers(0, 10)), int(rng.integers(0, width // 16))
+    scene_fixtures.box(route, ty * 16, tx * 16, ty * 16 + 16, tx * 16 + 16, scene_fixtures.FIELD_TILES[3])
+
+    frames = []
+    for left in (0, 16):
+        frame = route[:, left:left + scene_fixtures.WIDTH].copy()
+        scene_fixtures.box(frame, 70, 113, 90, 127, (208, 64, 56))
+        frames.append(png_bytes(frame))
+    return frames
+
+def test_decision_cache():
+    """Overworld and menu frames the hash cannot tell apart never share a cached decision; text boxes still do"""
+    print("🧪 Testing Decision Cache on Look-alike Frames")
+    print("=" * 40)
+
+    player = PokemonAIPlayer(api_base_url="http://127.0.0.1:9")
+    memory_list = ["CURRENT LOCATION: Route 1"]
+    decision = {"reasoning": "walk north", "actions": ["UP", "UP", "UP"], "memory_updates": {}}
+    try:
+        print("\n🌳 Test 1: Two route frames one tile apart...")
+        for seed in range(8):
+            first, second = neighbouring_route_frames(seed)
+            distance = bin(DecisionCache.frame_hash(first) ^ DecisionCache.frame_hash(second)).count("1")
+
+            player.observe_scene(first)
+            assert player.scene_label == "field", f"seed {seed}: first frame labelled {player.scene_label}"
+            cache_key, cached = player.check_decision_cache(memory_list, first)
+            assert cache_key is None and cached is None, f"seed {seed}: field frame went through the cache"
+            # Even a decision stored for the first screen must not answer the second
+            player.decision_cache.put(DecisionCache.frame_hash(first), DecisionCache.memory_digest(memory_list), decision)
+
+            player.observe_scene(second)
+            cache_key, cached = player.check_decision_cache(memory_list, second)
+            assert cached is None, f"seed {seed}: the neighbouring screen ({distance} bits away) reused a cached decision"
+            print(f"✅ seed {seed}: {distance} bits apart (tolerance {player.decision_cache.tolerance}), no reuse")
+
+        print("\n📋 Test 2: A menu whose cursor moved...")
+        rng = np.random.default_rng(4)
+        menu = scene_fixtures.menu(rng)
+        moved = menu.copy()
+        cursor = moved[10:20, 176:181].copy()
+        scene_fixtures.box(moved, 10, 176, 20, 181, scene_fixtures.WHITE)
+        moved[26:36, 176:181] = cursor
+        first, second = png_bytes(menu), png_bytes(moved)
+        distance = bin(DecisionCache.frame_hash(first) ^ DecisionCache.frame_hash(second)).count("1")
+        player.decision_cache.put(DecisionCache.frame_hash(first), DecisionCache.memory_digest(memory_list), {"reasoning": "pick", "actions": ["DOWN", "A"], "memory_updates": {}})
+        player.observe_scene(second)
+        cache_key, cached = player.check_decision_cache(memory_list, second)
+        assert cache_key is None and cached is None, f"{player.scene_label} frame with a moved cursor ({distance} bits away) went through the cache"
+        print(f"✅ {player.scene_label} frame, cursor moved ({distance} bits apart), no reuse")
+
+        print("\n💬 Test 3: A text box frame is still cached...")
+        rng = np.random.default_rng(151)
+        text_box = png_bytes(scene_fixtures.dialogue(rng, arrow=True))
+        player.observe_scene(text_box)
+        cache_key, cached = player.check_decision_cache(memory_list, text_box)
+        assert cache_key is not None and cached is None, f"{player.scene_label} frame skipped the cache"
+        player.remember_decision(cache_key, {"reasoning": "advance", "actions": ["A"], "memory_updates": {}})
+        cache_key, cached = player.check_decision_cache(memory_list, text_box)
+        assert cached is not None and cached["actions"] == ["A"], "repeated text box missed the cache"
+        print(f"✅ {player.scene_label} frame hit the cache: {player.decision_cache.stats()}")
+
+        print("\n🔁 Test 4: A stuck screen gets its key without a lookup...")
+        hits = player.decision_cache.stats()["hits"]
+        cache_key, cached = player.check_decision_cache(memory_list, text_box, lookup=False)
+        assert cache_key is not None and cached is None, "stuck lookup returned a cached decision"
+        assert player.decision_cache.stats()["hits"] == hits, "stuck lookup counted a hit"
+        print("✅ Key computed, no hit counted")
+
+        print("\n🚫 Test 5: No classifier label, no cache...")
+        player.scene_classifier = None
+        player.observe_scene(text_box)
+        cache_key, cached = player.check_decision_cache(memory_list, text_box)
+        assert cache_key is None and cached is None, "unlabelled frame went through the cache"
+        print("✅ Classifier off - cache skipped")
+    finally:
+        player.http_client.close()
+
+    print("\n✅ Decision cache test complete!")
+
+if __name__ == "__main__":
+    test_decision_cache()
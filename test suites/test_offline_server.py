@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Benchmark the API side of the game loop against the offline xAI stand-in server
+(no browser, no network, no API cost)
+"""
+
+import base64
+import io
+import os
+import statistics
+import time
+
+from PIL import Image
+
+os.environ.setdefault('XAI_API_KEY', 'offline-stub')
+
+from pokemon_player_browser import PokemonAIPlayer
+from xai_stub_server import XAIStubServer
+
+def blank_frame_base64():
+    """A GBA-sized frame so vision payloads have realistic shape"""
+    buffer = io.BytesIO()
+    Image.new('RGB', (240, 160), (248, 248, 248)).save(buffer, format='PNG')
+    return base64.b64encode(buffer.getvalue()).decode('utf-8')
+
+def run_iterations(player, iterations):
+    """Time classic (tool selection + decision) and fused iterations"""
+    memory_list = ["SCREENSHOTS: [N/A] | CURRENT PROGRESS: Offline benchmark"]
+    frame = blank_frame_base64()
+    classic, fused = [], []
+
+    for _ in range(iterations):
+        start = time.time()
+        player.ask_ai_what_to_do(memory_list)
+        player.make_gameplay_decision(memory_list, "Offline stub: dialogue box on screen")
+        classic.append(time.time() - start)
+
+        start = time.time()
+        decision = player.query_grok4_with_vision(memory_list, frame)
+        fused.append(time.time() - start)
+
+    print(f"✅ Last fused decision: {decision.get('actions')} - {decision.get('reasoning')}")
+    for name, samples in (("classic", classic), ("fused", fused)):
+        print(f"⏱️ {name}: mean {statistics.mean(samples):.3f}s, max {max(samples):.3f}s over {len(samples)} iterations")
+
+def test_offline_server():
+    """Run the loop's API calls against clean and faulty stand-in servers"""
+    print("🧪 Testing Against the Offline xAI Stand-in")
+    print("=" * 40)
+
+    print("\n📡 Test 1: Clean server, lognormal latency...")
+    server = XAIStubServer(port=0, latency="lognormal:-2.0,0.5", seed=7).start()
+    player = PokemonAIPlayer(api_base_url=server.base_url)
+    try:
+        run_iterations(player, 5)
+        print(f"📊 Server stats: {server.stats}")
+    finally:
+        player.http_client.close()
+        server.stop()
+
+    print("\n💥 Test 2: 20% 429s and 10% 5xx (retries and fallbacks)...")
+    server = XAIStubServer(port=0, latency="fixed:0.05", rate_429=0.2, rate_5xx=0.1, retry_after=1, seed=7).start()
+    player = PokemonAIPlayer(api_base_url=server.base_url)
+    try:
+        run_iterations(player, 5)
+        print(f"📊 Server stats: {server.stats}")
+    finally:
+        player.http_client.close()
+        server.stop()
+
+    print("\n🔌 Test 3: Half-open circuit probe answered with 429...")
+    server = XAIStubServer(port=0, rate_429=1.0, retry_after=0, seed=7).start()
+    player = PokemonAIPlayer(api_base_url=server.base_url)
+    breaker = player.circuit_breaker
+    try:
+        breaker.cooldown = 0.2
+        for _ in range(breaker.failure_threshold):
+            breaker.record_failure()
+        time.sleep(0.3)
+        content = player.robust_api_call([{"role": "user", "content": "probe"}], max_tokens=50, function_name="Probe")
+        assert content is None, "a 429 probe must not return content"
+        assert breaker.state == "open" and not breaker.probe_in_flight, f"probe left unresolved ({breaker.state}, in flight: {breaker.probe_in_flight})"
+        time.sleep(0.3)
+        assert breaker.allow(), "the next probe must be admitted after the cooldown"
+        breaker.resolve_probe(True)
+        print(f"✅ 429 probe re-opened the circuit and the next probe was admitted: {breaker.stats()['transitions']}")
+    finally:
+        player.http_client.close()
+        server.stop()
+
+    print("\n🪟 Test 4: Per-turn hints keep the rolling context in one window...")
+    server = XAIStubServer(port=0, seed=7).start()
+    player = PokemonAIPlayer(api_base_url=server.base_url)
+    try:
+        memory_list = ["SCREENSHOTS: [N/A] | CURRENT PROGRESS: Offline benchmark"]
+        frame = blank_frame_base64()
+        for turn in range(4):
+            player.turn_notes = [f"SCENE: a text box is open (turn {turn})"]
+            player.query_grok4_with_vision(memory_list, frame)
+            player.note_decision({"actions": ["A"]})
+        stats = player.decision_session("Fused Decision").stats()
+        assert stats["windows"] == 1, f"hints opened {stats['windows']} windows in 4 turns"
+        print(f"✅ 4 hinted turns, 1 window: {stats}")
+    finally:
+        player.http_client.close()
+        server.stop()
+
+    print("\n✅ Offline server test complete!")
+
+if __name__ == "__main__":
+    test_offline_server()
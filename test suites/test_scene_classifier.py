@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Benchmark the local scene classifier on labelled frames: accuracy per scene, the confusion between
+scenes, text box continue-arrow detection (dialogue frames named *-arrow.png show the arrow) and
+per-frame latency (PNG decode included). Frames are read from <dir>/<scene>/*.png - the
+shipped synthetic fixtures by default (regenerate with scene_fixtures.py), which are a regression
+check for the tuned thresholds rather than an accuracy measurement; sort real captures into the
+same layout to measure on the live game.
+
+Usage: python "test suites/test_scene_classifier.py" [frames_dir] [repeats]
+"""
+
+import glob
+import os
+import statistics
+import sys
+import time
+from pokemon_player_browser import SceneClassifier
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from scene_fixtures import FIXTURES_DIR
+
+def load_frames(frames_dir):
+    """(scene, path, PNG bytes) for every labelled frame"""
+    frames = []
+    for scene in SceneClassifier.SCENES:
+        for path in sorted(glob.glob(os.path.join(frames_dir, scene, "*.png"))):
+            with open(path, 'rb') as f:
+                frames.append((scene, path, f.read()))
+    return frames
+
+def test_scene_classifier(frames_dir=FIXTURES_DIR, repeats=20):
+    """Accuracy and latency of SceneClassifier on a labelled frame set"""
+    print("🧪 Benchmarking Local Scene Classifier")
+    print("=" * 40)
+
+    frames = load_frames(frames_dir)
+    if not frames:
+        print(f"❌ No labelled frames in {frames_dir} - run scene_fixtures.py or sort captures into <scene>/ folders")
+        return
+
+    classifier = SceneClassifier()
+    confusion = {scene: {} for scene in SceneClassifier.SCENES}
+    misses = []
+    arrows = []
+    for scene, path, image_bytes in frames:
+        result = classifier.classify(image_bytes)
+        predicted = result["scene"]
+        confusion[scene][predicted] = confusion[scene].get(predicted, 0) + 1
+        if predicted != scene:
+            misses.append((path, scene, predicted))
+        if scene == "dialogue":
+            arrows.append(result["features"]["continue_arrow"] == path.endswith("-arrow.png"))
+
+    latencies = []
+    for _ in range(repeats):
+        for _, _, image_bytes in frames:
+            start = time.perf_counter()
+            classifier.classify(image_bytes)
+            latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+
+    print(f"\n📊 Accuracy on {len(frames)} frames:")
+    for scene in SceneClassifier.SCENES:
+        total = sum(confusion[scene].values())
+        if total:
+            print(f"   {scene}: {confusion[scene].get(scene, 0)}/{total} ({confusion[scene].get(scene, 0) / total:.0%}) -> {confusion[scene]}")
+    correct = sum(confusion[scene].get(scene, 0) for scene in SceneClassifier.SCENES)
+    print(f"   overall: {correct}/{len(frames)} ({correct / len(frames):.1%})")
+    for path, scene, predicted in misses:
+        print(f"   ❌ {path}: {scene} labelled {predicted}")
+    if arrows:
+        print(f"   continue arrow: {sum(arrows)}/{len(arrows)} dialogue frames right")
+    if os.path.abspath(frames_dir) == FIXTURES_DIR:
+        print("   ⚠️ Synthetic fixtures drawn with the thresholds they test - this checks the thresholds reproduce, not real-game accuracy; pass a folder of real captures to measure that")
+
+    print(f"\n⏱️ Latency ({len(latencies)} classifications, decode included): mean {statistics.mean(latencies):.2f}ms, "
+          f"p50 {latencies[len(latencies) // 2]:.2f}ms, p95 {latencies[int(len(latencies) * 0.95)]:.2f}ms, max {latencies[-1]:.2f}ms")
+
+    print("\n✅ Scene classifier benchmark complete!")
+
+if __name__ == "__main__":
+    frames_dir = sys.argv[1] if len(sys.argv) > 1 else FIXTURES_DIR
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    test_scene_classifier(frames_dir, repeats)
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Check the deduplicated screenshot archive: repeated frames are stored once, and every screenshot
+(and its description) can be recalled before and after the background commit - including a repeat
+of a frame that was already committed. Runs in a temporary folder, no browser or network needed.
+"""
+
+import os
+import tempfile
+
+from pokemon_player_browser import ScreenshotArchive
+
+def test_screenshot_archive():
+    """Recall through the pending and committed states of the archive"""
+    print("🧪 Testing Screenshot Archive")
+    print("=" * 40)
+
+    with tempfile.TemporaryDirectory() as folder:
+        archive = ScreenshotArchive(os.path.join(folder, "archive.sqlite"), session="test")
+        try:
+            print("\n🗂️ Test 1: Pending, then committed...")
+            archive.put(1, b"dialogue frame")
+            archive.describe(1, "Oak is talking")
+            assert archive.image(1) == b"dialogue frame", "pending screenshot not recalled"
+            archive.commit()
+            assert archive.image(1) == b"dialogue frame", "committed screenshot not recalled"
+            assert archive.description(1) == "Oak is talking", "committed description not recalled"
+            print("✅ Screenshot 1 recalled before and after the commit")
+
+            print("\n🔁 Test 2: A repeat of an already committed frame, before its commit...")
+            archive.put(2, b"dialogue frame")
+            assert archive.image(2) == b"dialogue frame", "repeated frame not recalled until the writer caught up"
+            archive.commit()
+            assert archive.image(2) == b"dialogue frame", "repeated frame not recalled after the commit"
+            print("✅ Screenshot 2 recalled while its index row was still pending")
+
+            print("\n📊 Test 3: Stored once...")
+            stats = archive.stats()
+            assert stats["frames"] == 2 and stats["duplicates"] == 1, f"unexpected accounting: {stats}"
+            assert archive.image(3) is None, "unknown screenshot returned data"
+            print(f"✅ {stats}")
+        finally:
+            archive.close()
+
+    print("\n✅ Screenshot archive test complete!")
+
+if __name__ == "__main__":
+    test_screenshot_archive()
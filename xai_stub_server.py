@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+"""
+🧪 OFFLINE xAI STAND-IN SERVER
+==============================
+Local HTTP server implementing the /v1/chat/completions shape used by
+PokemonAIPlayer, so the game loop can be benchmarked without network or cost.
+
+Modes:
+  synthetic  - canned but well-formed responses for every call type (default)
+  record     - proxy to the real xAI API and append every exchange to a cassette
+  replay     - answer deterministically from a recorded cassette
+
+Fault injection: configurable latency distribution, 429 (with Retry-After),
+5xx and hung requests (to exercise client timeouts).
+
+Usage:
+  python xai_stub_server.py --port 8765 --latency lognormal:0.0,0.5 --rate-429 0.05
+  XAI_API_BASE_URL=http://127.0.0.1:8765/v1 python run.py
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class LatencyModel:
+    """Latency distribution parsed from 'fixed:S', 'uniform:LO,HI', 'normal:MEAN,STD' or 'lognormal:MU,SIGMA'"""
+
+    def __init__(self, spec="fixed:0", rng=None):
+        self.spec = spec
+        self.rng = rng or random.Random()
+        kind, _, params = spec.partition(":")
+        self.kind = kind
+        self.params = [float(p) for p in params.split(",") if p] if params else []
+
+    def sample(self):
+        """Seconds to wait before answering"""
+        if self.kind == "fixed":
+            return self.params[0] if self.params else 0.0
+        if self.kind == "uniform":
+            return self.rng.uniform(self.params[0], self.params[1])
+        if self.kind == "normal":
+            return max(0.0, self.rng.gauss(self.params[0], self.params[1]))
+        if self.kind == "lognormal":
+            return self.rng.lognormvariate(self.params[0], self.params[1])
+        raise ValueError(f"Unknown latency distribution: {self.spec}")
+
+
+class Cassette:
+    """Recorded request/response exchanges stored as JSON lines"""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.exchanges = []
+        self.by_key = {}
+        self.cursor = 0
+
+        if path and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        exchange = json.loads(line)
+                        self.exchanges.append(exchange)
+                        self.by_key.setdefault(exchange["key"], []).append(exchange)
+
+    @staticmethod
+    def request_key(payload):
+        """Stable key for a request: model + messages, with image data replaced by its digest"""
+        def normalize(value):
+            if isinstance(value, dict):
+                return {k: normalize(v) for k, v in sorted(value.items())}
+            if isinstance(value, list):
+                return [normalize(v) for v in value]
+            if isinstance(value, str) and value.startswith("data:image"):
+                return "image:" + hashlib.sha256(value.encode('utf-8')).hexdigest()[:16]
+            return value
+
+        relevant = {"model": payload.get("model"), "messages": normalize(payload.get("messages", []))}
+        return hashlib.sha256(json.dumps(relevant, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def record(self, payload, status, body):
+        """Append one exchange to the cassette file"""
+        exchange = {"key": self.request_key(payload), "status": status, "body": body, "recorded_at": time.time()}
+        with self.lock:
+            self.exchanges.append(exchange)
+            self.by_key.setdefault(exchange["key"], []).append(exchange)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(exchange) + "\n")
+
+    def replay(self, payload):
+        """Exact match on the request key, otherwise the next exchange in recorded order"""
+        with self.lock:
+            matches = self.by_key.get(self.request_key(payload))
+            if matches:
+                exchange = matches.pop(0)
+                matches.append(exchange)  # Rotate so repeated identical requests replay in order
+                return exchange
+            if not self.exchanges:
+                return None
+            exchange = self.exchanges[self.cursor % len(self.exchanges)]
+            self.cursor += 1
+            return exchange
+
+
+def synthetic_content(payload):
+    """Canned, well-formed response content for the call type the prompt belongs to"""
+    texts = []
+    for message in payload.get("messages", []):
+        content = message.get("content", "")
+        if isinstance(content, list):
+            content = " ".join(part.get("text", "") for part in content if part.get("type") == "text")
+        texts.append(content or "")
+    prompt = "\n".join(texts)
+
+    if "memory management system" in prompt:
+        memory_block = prompt.split("CURRENT MEMORY", 1)[-1].split("Your task:", 1)[0]
+        memory = [line.split(". ", 1)[-1] for line in memory_block.split("\n") if line[:1].isdigit()]
+        return json.dumps({
+            "cleaned_memory": memory[-20:] or ["SCREENSHOTS: [N/A] | SUMMARY: Offline stub memory"],
+            "cleanup_notes": "Offline stub cleanup",
+            "issues_detected": []
+        })
+    if "ONLY choose tools" in prompt:
+        return json.dumps({"tool_calls": [{"tool": "analyze_with_vision"}], "reasoning": "Offline stub: need to see the screen"})
+    if '"image_description"' in prompt:
+        return json.dumps({
+            "actions": ["A"],
+            "image_description": "Offline stub: dialogue box on screen",
+            "reasoning": "Offline stub: advance dialogue",
+            "memory_updates": {"add": [], "remove": [], "update": {}}
+        })
+    if "Respond with JSON" in prompt:
+        return json.dumps({
+            "actions": ["A"],
+            "reasoning": "Offline stub: advance dialogue",
+            "memory_updates": {"add": [], "remove": [], "update": {}}
+        })
+    return "Offline stub: a Pokemon Fire Red dialogue box is on screen. Press A to continue."
+
+
+def synthetic_tool_calls(payload):
+    """Function-calling reply: look at the screen first, then press_buttons"""
+    messages = payload.get("messages", [])
+    forced = (payload.get("tool_choice") or {}) if isinstance(payload.get("tool_choice"), dict) else {}
+    has_looked = any(message.get("role") == "tool" for message in messages)
+
+    if has_looked or forced.get("function", {}).get("name") == "press_buttons":
+        name, arguments = "press_buttons", {
+            "actions": ["A"],
+            "image_description": "Offline stub: dialogue box on screen",
+            "reasoning": "Offline stub: advance dialogue",
+            "memory_updates": {"add": [], "remove": [], "update": None}
+        }
+    else:
+        name, arguments = "analyze_with_vision", {}
+    return [{"id": f"call_{random.getrandbits(32):08x}", "type": "function", "function": {"name": name, "arguments": json.dumps(arguments)}}]
+
+
+def completion_body(payload, content):
+    """Chat completions response body (including usage) for some content"""
+    prompt_chars = len(json.dumps(payload.get("messages", [])))
+    finish_reason = "stop"
+    max_tokens = payload.get("max_tokens")
+    if max_tokens and len(content) // 4 > max_tokens:
+        content, finish_reason = content[:max_tokens * 4], "length"  # Truncate like the real API
+    return {
+        "id": f"stub-{random.getrandbits(48):012x}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": payload.get("model", "grok-4"),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": finish_reason}],
+        "usage": {
+            "prompt_tokens": prompt_chars // 4,
+            "completion_tokens": max(1, len(content) // 4),
+            "total_tokens": prompt_chars // 4 + max(1, len(content) // 4),
+            "prompt_tokens_details": {"cached_tokens": 0}
+        }
+    }
+
+
+class XAIStubServer:
+    """Threaded stand-in for https://api.x.ai/v1 (see module docstring)"""
+
+    def __init__(self, host="127.0.0.1", port=8765, mode="synthetic", cassette_path=None, latency="fixed:0",
+                 rate_429=0.0, rate_5xx=0.0, rate_timeout=0.0, retry_after=1, hang_seconds=600,
+                 upstream_url="https://api.x.ai/v1", api_key=None, seed=None):
+        self.mode = mode
+        self.rng = random.Random(seed)
+        self.latency = LatencyModel(latency, self.rng)
+        self.rate_429 = rate_429
+        self.rate_5xx = rate_5xx
+        self.rate_timeout = rate_timeout
+        self.retry_after = retry_after
+        self.hang_seconds = hang_seconds
+        self.upstream_url = upstream_url.rstrip('/')
+        self.api_key = api_key or os.getenv('XAI_API_KEY')
+        self.cassette = Cassette(cassette_path) if cassette_path else None
+        self.stats = {"requests": 0, "ok": 0, "429": 0, "5xx": 0, "timeouts": 0, "replay_misses": 0}
+        self.stats_lock = threading.Lock()
+
+        if mode in ("record", "replay") and self.cassette is None:
+            raise ValueError(f"--cassette is required in {mode} mode")
+
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def count(self, key):
+        with self.stats_lock:
+            self.stats[key] += 1
+
+    def start(self):
+        """Serve on a background thread (for test scripts)"""
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def upstream_call(self, payload):
+        """Forward a request to the real API (record mode)"""
+        import requests
+
+        response = requests.post(
+            f"{self.upstream_url}/chat/completions",
+            headers={"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"},
+            json=dict(payload, stream=False),
+            timeout=300
+        )
+        try:
+            body = response.json()
+        except ValueError:
+            body = {"error": response.text}
+        return response.status_code, body
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass  # Keep benchmark output clean
+
+            def send_json(self, status, body, extra_headers=None):
+                data = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (extra_headers or {}).items():
+                    self.send_header(name, str(value))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def send_stream(self, body):
+                content = body["choices"][0]["message"]["content"]
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                for i in range(0, len(content), 16):
+                    event = {"choices": [{"index": 0, "delta": {"content": content[i:i + 16]}}]}
+                    self.wfile.write(f"data: {json.dumps(event)}\n\n".encode('utf-8'))
+                    self.wfile.flush()
+                final = {"choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}], "usage": body.get("usage")}
+                self.wfile.write(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode('utf-8'))
+                self.wfile.flush()
+                self.close_connection = True
+
+            def do_POST(self):
+                if not self.path.rstrip('/').endswith("/chat/completions"):
+                    self.send_json(404, {"error": f"Unknown endpoint {self.path}"})
+                    return
+
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                server.count("requests")
+
+                # Fault injection first, so it applies in every mode
+                roll = server.rng.random()
+                if roll < server.rate_timeout:
+                    server.count("timeouts")
+                    time.sleep(server.hang_seconds)
+                    return
+                roll -= server.rate_timeout
+                if roll < server.rate_429:
+                    server.count("429")
+                    self.send_json(429, {"error": "Rate limit exceeded (stub)"}, {
+                        "Retry-After": server.retry_after,
+                        "x-ratelimit-remaining-requests": 0
+                    })
+                    return
+                roll -= server.rate_429
+                if roll < server.rate_5xx:
+                    server.count("5xx")
+                    self.send_json(server.rng.choice([500, 502, 503]), {"error": "Upstream error (stub)"})
+                    return
+
+                if server.mode == "record":
+                    status, body = server.upstream_call(payload)
+                    server.cassette.record(payload, status, body)
+                elif server.mode == "replay":
+                    exchange = server.cassette.replay(payload)
+                    if exchange is None:
+                        server.count("replay_misses")
+                        self.send_json(500, {"error": "Cassette is empty"})
+                        return
+                    status, body = exchange["status"], exchange["body"]
+                    time.sleep(server.latency.sample())
+                else:
+                    status, body = 200, completion_body(payload, synthetic_content(payload))
+                    if payload.get("tools"):
+                        message = body["choices"][0]
+                        message["message"] = {"role": "assistant", "content": None, "tool_calls": synthetic_tool_calls(payload)}
+                        message["finish_reason"] = "tool_calls"
+                    time.sleep(server.latency.sample())
+
+                if status == 200:
+                    server.count("ok")
+                if status == 200 and payload.get("stream"):
+                    self.send_stream(body)
+                else:
+                    self.send_json(status, body)
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline xAI stand-in server for Grok Plays Pokemon")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--mode", choices=["synthetic", "record", "replay"], default="synthetic")
+    parser.add_argument("--cassette", help="Cassette file (JSON lines) for record/replay")
+    parser.add_argument("--latency", default="fixed:0", help="fixed:S | uniform:LO,HI | normal:MEAN,STD | lognormal:MU,SIGMA")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument("--rate-5xx", type=float, default=0.0, help="Fraction of requests answered with 500/502/503")
+    parser.add_argument("--rate-timeout", type=float, default=0.0, help="Fraction of requests that hang")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--seed", type=int, help="Random seed for reproducible latency and faults")
+    args = parser.parse_args()
+
+    server = XAIStubServer(
+        host=args.host, port=args.port, mode=args.mode, cassette_path=args.cassette, latency=args.latency,
+        rate_429=args.rate_429, rate_5xx=args.rate_5xx, rate_timeout=args.rate_timeout,
+        retry_after=args.retry_after, seed=args.seed
+    )
+
+    print("🧪 Offline xAI stand-in server")
+    print("=" * 40)
+    print(f"🌐 Base URL: {server.base_url}")
+    print(f"🎛️ Mode: {args.mode}" + (f" (cassette: {args.cassette})" if args.cassette else ""))
+    print(f"⏱️ Latency: {args.latency}")
+    print(f"💥 Faults: 429={args.rate_429} 5xx={args.rate_5xx} timeout={args.rate_timeout}")
+    print(f"👉 Point the player at it: XAI_API_BASE_URL={server.base_url}")
+    print("🛑 Press Ctrl+C to stop")
+
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\n📊 Stats: {server.stats}")
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()